@@ -0,0 +1,176 @@
+"""Fingerprinted, precompressed static assets.
+
+`python -m assets` copies every file under the `views` asset directories to
+`views/dist/assets` with a content hash in its name (`css/web.css` ->
+`css/web.3f2a9c1b7e.css`), rewrites the `url(...)` and source map
+references inside CSS and JS to the hashed names, stores gzip (and, with
+the optional `brotli` package, brotli) copies of text files next to them,
+and writes `views/dist/manifest.json` mapping original to hashed paths.
+
+Templates link assets through `asset_url("css/web.css")`. Hashed files
+never change, so `/assets` serves them with `Cache-Control: immutable`;
+without a build the original, uncached paths are used.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip copies are built without it
+    brotli = None
+
+SOURCE_DIR = "views"
+ASSET_DIRS = ("css", "js", "style", "images", "webfonts")
+BUILD_DIR = settings.asset_build_dir
+ASSETS_URL = "/assets"
+# Already compressed formats (images, woff2) gain nothing from gzip
+COMPRESSIBLE = {".css", ".js", ".map", ".svg", ".ttf", ".json", ".html", ".txt"}
+# Rewritten after everything they can reference has been hashed
+REFERENCING = {".css", ".js"}
+HASH_LENGTH = 10
+# Precompressed copies smaller than the original by less than this are dropped
+MIN_SAVING = 0.05
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_SOURCE_MAP = re.compile(r"(sourceMappingURL=)(\S+?)(\s*\*/|\s*$)", re.MULTILINE)
+
+CACHE_FOREVER = "public, max-age=31536000, immutable"
+
+
+def fingerprint(path: str, content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _rewrite(path: str, text: str, manifest: dict[str, str]) -> str:
+    """Point relative references in a CSS/JS file at the hashed files."""
+    base = posixpath.dirname(path)
+
+    def hashed(reference: str) -> Optional[str]:
+        if reference.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return None
+        target, sep, suffix = re.match(r"([^?#]*)([?#]?)(.*)", reference, re.DOTALL).groups()
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return None
+        return posixpath.relpath(manifest[resolved], base) + sep + suffix
+
+    def css_url(match: re.Match) -> str:
+        new = hashed(match.group(2).strip())
+        return match.group(0) if new is None else f"url({match.group(1)}{new}{match.group(1)})"
+
+    def source_map(match: re.Match) -> str:
+        new = hashed(match.group(2))
+        return match.group(0) if new is None else match.group(1) + new + match.group(3)
+
+    if path.endswith(".css"):
+        text = _CSS_URL.sub(css_url, text)
+    return _SOURCE_MAP.sub(source_map, text)
+
+
+def _write_compressed(path: str, content: bytes) -> None:
+    variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) <= len(content) * (1 - MIN_SAVING):
+            with open(path + suffix, "wb") as file:
+                file.write(compressed)
+
+
+def build(source: str = SOURCE_DIR, dest: str = BUILD_DIR) -> dict[str, str]:
+    """Build the hashed assets of `source` into `dest`, replacing a previous
+    build, and return the manifest."""
+    files = []
+    for directory in ASSET_DIRS:
+        for root, _, names in os.walk(os.path.join(source, directory)):
+            for name in names:
+                full = os.path.join(root, name)
+                files.append(os.path.relpath(full, source).replace(os.sep, "/"))
+    # Referenced files first, so CSS and JS are hashed with the final references in them
+    files.sort(key=lambda path: (posixpath.splitext(path)[1] in REFERENCING, path))
+
+    output = os.path.join(dest, "assets")
+    shutil.rmtree(output, ignore_errors=True)
+    manifest: dict[str, str] = {}
+    for path in files:
+        with open(os.path.join(source, path), "rb") as file:
+            content = file.read()
+        ext = posixpath.splitext(path)[1]
+        if ext in REFERENCING:
+            content = _rewrite(path, content.decode("utf-8"), manifest).encode("utf-8")
+        manifest[path] = fingerprint(path, content)
+
+        target = os.path.join(output, manifest[path])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as file:
+            file.write(content)
+        if ext in COMPRESSIBLE:
+            _write_compressed(target, content)
+
+    with open(os.path.join(dest, "manifest.json"), "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(dest: str = BUILD_DIR) -> dict[str, str]:
+    try:
+        with open(os.path.join(dest, "manifest.json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+manifest = load_manifest()
+
+
+def asset_url(path: str) -> str:
+    """URL of an asset under `views`, hashed when a build exists."""
+    hashed = manifest.get(path)
+    return f"{ASSETS_URL}/{hashed}" if hashed else f"/{path}"
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serves the hashed build: a `.br`/`.gz` copy when the client accepts
+    it, and long-lived immutable caching for everything."""
+
+    async def get_response(self, path: str, scope):
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        encodings = [("br", ".br")] if "br" in accepted else []
+        if "gzip" in accepted:
+            encodings.append(("gzip", ".gz"))
+
+        response = None
+        for encoding, suffix in encodings:
+            try:
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            response.headers["Content-Encoding"] = encoding
+            response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            break
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = CACHE_FOREVER
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+if __name__ == "__main__":
+    built = build(*sys.argv[1:3])
+    print(f"Built {len(built)} assets into {sys.argv[2] if len(sys.argv) > 2 else BUILD_DIR}")
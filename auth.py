@@ -1,21 +1,291 @@
+import base64
+import hashlib
+import hmac
 import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
 from typing import Optional
 
-# Simple in-memory session store: token -> user_id
-_sessions: dict[str, int] = {}
+from sqlalchemy import delete, select
+from starlette.concurrency import run_in_threadpool
+
+import database
+from config import settings
+from controller.periodic import PeriodicWorker
+from database import utcnow
+from models.sessions import UserSession
+
+SESSION_BACKEND = settings.session_backend  # "memory" or "database"
+SESSION_TTL_SECONDS = settings.session_ttl_seconds
+SESSION_MAX_ENTRIES = settings.session_max_entries
+SESSION_SWEEP_INTERVAL = settings.session_sweep_interval
+# "opaque" tokens are looked up in the session store; "signed" tokens carry the
+# user id and expiry and are validated with HMAC only.
+SESSION_MODE = settings.session_mode
+# Comma separated "key_id:secret" pairs. The first key signs new tokens, all of
+# them are accepted, so a key can be rotated out by moving it to the end and
+# dropping it once SESSION_TTL_SECONDS has passed.
+SESSION_SIGNING_KEYS = settings.session_signing_keys
+
+
+class SessionStore(ABC):
+    """Maps session tokens to user ids until they expire."""
+
+    @abstractmethod
+    def set(self, token: str, user_id: int, ttl: int) -> None: ...
+
+    @abstractmethod
+    def get(self, token: str) -> Optional[int]: ...
+
+    @abstractmethod
+    def delete(self, token: str) -> None: ...
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Drop expired sessions and return how many were removed."""
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store with a TTL per entry and LRU eviction once
+    `max_entries` is reached. Only suitable for a single worker."""
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, token: str, user_id: int, ttl: int) -> None:
+        with self._lock:
+            self._entries[token] = (user_id, time.monotonic() + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, token: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user_id
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [token for token, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for token in expired:
+                del self._entries[token]
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DatabaseSessionStore(SessionStore):
+    """Store backed by the `sessions` table, shared by every worker that
+    points at the same database."""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or database.SessionLocal
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def set(self, token: str, user_id: int, ttl: int) -> None:
+        with self.session_factory() as db:
+            db.merge(UserSession(
+                token_hash=self._hash(token),
+                user_id=user_id,
+                expires_at=utcnow() + timedelta(seconds=ttl)
+            ))
+            db.commit()
+
+    def get(self, token: str) -> Optional[int]:
+        with self.session_factory() as db:
+            return db.execute(
+                select(UserSession.user_id).where(
+                    UserSession.token_hash == self._hash(token),
+                    UserSession.expires_at > utcnow()
+                )
+            ).scalar_one_or_none()
+
+    def delete(self, token: str) -> None:
+        with self.session_factory() as db:
+            db.execute(delete(UserSession).where(UserSession.token_hash == self._hash(token)))
+            db.commit()
+
+    def sweep(self) -> int:
+        with self.session_factory() as db:
+            result = db.execute(delete(UserSession).where(UserSession.expires_at <= utcnow()))
+            db.commit()
+            return result.rowcount
+
+    def clear(self) -> None:
+        with self.session_factory() as db:
+            db.execute(delete(UserSession))
+            db.commit()
+
+
+class SessionSweeper(PeriodicWorker):
+    """Background thread that periodically removes expired sessions."""
+
+    name = "session-sweeper"
+
+    def __init__(self, store: SessionStore, interval: float = SESSION_SWEEP_INTERVAL):
+        super().__init__(interval)
+        self.store = store
+
+    def run_once(self) -> None:
+        self.store.sweep()
+
+
+def _build_store() -> SessionStore:
+    if SESSION_BACKEND == "database":
+        return DatabaseSessionStore()
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND!r}")
+
+
+_store: SessionStore = _build_store()
+sweeper = SessionSweeper(_store)
+
+
+class TokenSigner:
+    """Issues and validates `s.<key_id>.<user_id>.<expires>.<signature>` tokens."""
+
+    PREFIX = "s"
+
+    def __init__(self, keys: dict[str, bytes]):
+        if not keys:
+            raise ValueError("TokenSigner needs at least one signing key")
+        self.keys = keys
+        self.current_key_id = next(iter(keys))
+
+    @classmethod
+    def from_config(cls, config: str) -> "TokenSigner":
+        keys = {}
+        for pair in filter(None, (part.strip() for part in config.split(","))):
+            key_id, _, secret = pair.partition(":")
+            if not key_id or not secret or "." in key_id:
+                raise ValueError(f"Invalid signing key entry: {key_id!r}")
+            keys[key_id] = secret.encode()
+        return cls(keys)
+
+    def _signature(self, key: bytes, message: str) -> str:
+        digest = hmac.new(key, message.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def sign(self, user_id: int, ttl: int) -> str:
+        message = f"{self.PREFIX}.{self.current_key_id}.{user_id}.{int(time.time()) + ttl}"
+        return f"{message}.{self._signature(self.keys[self.current_key_id], message)}"
+
+    def verify(self, token: str) -> Optional[int]:
+        parts = token.split(".")
+        if len(parts) != 5 or parts[0] != self.PREFIX:
+            return None
+        _, key_id, user_id, expires, signature = parts
+        key = self.keys.get(key_id)
+        if key is None:
+            return None
+        message = token[:-(len(signature) + 1)]
+        if not hmac.compare_digest(signature, self._signature(key, message)):
+            return None
+        if not (user_id.isdigit() and expires.isdigit()) or int(expires) <= time.time():
+            return None
+        return int(user_id)
+
+    @classmethod
+    def is_signed(cls, token: str) -> bool:
+        return token.startswith(cls.PREFIX + ".")
+
+
+def _build_signer() -> Optional[TokenSigner]:
+    if SESSION_MODE == "signed":
+        return TokenSigner.from_config(SESSION_SIGNING_KEYS)
+    if SESSION_MODE == "opaque":
+        return None
+    raise ValueError(f"Unknown SESSION_MODE: {SESSION_MODE!r}")
+
+
+signer: Optional[TokenSigner] = _build_signer()
+
+
+def get_session_store() -> SessionStore:
+    return _store
+
+
+def set_session_store(store: SessionStore) -> None:
+    global _store
+    _store = store
+    sweeper.store = store
 
 
 def create_session(user_id: int) -> str:
+    if signer is not None:
+        return signer.sign(user_id, SESSION_TTL_SECONDS)
     token = secrets.token_urlsafe(32)
-    _sessions[token] = user_id
+    _store.set(token, user_id, SESSION_TTL_SECONDS)
     return token
 
 
 def get_user_id_from_token(token: Optional[str]) -> Optional[int]:
     if not token:
         return None
-    return _sessions.get(token)
+    if TokenSigner.is_signed(token):
+        return signer.verify(token) if signer is not None else None
+    return _store.get(token)
 
 
 def invalidate_session(token: str) -> None:
-    _sessions.pop(token, None)
+    # Signed tokens cannot be revoked individually: they stay valid until they
+    # expire (or their key is removed from SESSION_SIGNING_KEYS).
+    if not TokenSigner.is_signed(token):
+        _store.delete(token)
+
+
+# Async variants for `async def` endpoints. The database store does blocking
+# I/O, so its calls are moved off the event loop; the in-memory store and
+# signed tokens are answered inline.
+def _blocks(token: Optional[str] = None) -> bool:
+    if token is not None and (not token or TokenSigner.is_signed(token)):
+        return False
+    return isinstance(_store, DatabaseSessionStore)
+
+
+async def create_session_async(user_id: int) -> str:
+    if signer is None and _blocks():
+        return await run_in_threadpool(create_session, user_id)
+    return create_session(user_id)
+
+
+async def get_user_id_from_token_async(token: Optional[str]) -> Optional[int]:
+    if _blocks(token or ""):
+        return await run_in_threadpool(get_user_id_from_token, token)
+    return get_user_id_from_token(token)
+
+
+async def invalidate_session_async(token: str) -> None:
+    if _blocks(token):
+        await run_in_threadpool(invalidate_session, token)
+    else:
+        invalidate_session(token)
@@ -0,0 +1,65 @@
+"""Latency of building the /products/grouped payload vs catalog size.
+
+The catalog cache is bypassed so every round hits the database. Run from
+the project root:
+
+    python -m benchmarks.bench_catalog
+"""
+import os
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import models.users  # noqa: F401  (tables the catalog's foreign keys point at)
+from database import Base
+from models.products import Product
+from routers.products import group_products
+
+CATALOG_SIZES = (1_000, 10_000, 100_000)
+CATEGORIES = 10
+LIMIT = 20
+ROUNDS = 10
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(bind=engine)
+
+        seeded = 0
+        print(f"{'products':>10} {'median ms':>10}")
+        for size in CATALOG_SIZES:
+            with engine.begin() as conn:
+                conn.execute(insert(Product), [
+                    {
+                        "name": f"Product {i}",
+                        "price": 1.0,
+                        "image_url": "images/item1.jpg",
+                        "category": f"category {i % CATEGORIES}",
+                        "stock_avilabilty": 100,
+                    }
+                    for i in range(seeded, size)
+                ])
+            seeded = size
+
+            timings = []
+            for _ in range(ROUNDS):
+                with SessionLocal() as db:
+                    start = time.perf_counter()
+                    json.dumps(group_products(db, LIMIT))
+                    timings.append((time.perf_counter() - start) * 1000)
+            print(f"{size:>10} {statistics.median(timings):>10.2f}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
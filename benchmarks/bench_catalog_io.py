@@ -0,0 +1,65 @@
+"""Bulk catalog import and export throughput and memory.
+
+Imports a generated CSV of ROWS products into an empty database, imports
+it again unchanged, then with every price changed (every row an update),
+and exports it back out. Memory is the peak of Python allocations, which
+the chunking keeps independent of ROWS. Run from the project root:
+
+    python -m benchmarks.bench_catalog_io
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import catalog_io
+import models.users  # noqa: F401  (tables the catalog's foreign keys point at)
+from database import Base, create_db_engine
+
+ROWS = 200_000
+
+
+def write_csv(path: str, price_offset: float) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(catalog_io.IMPORT_FIELDS)
+        for i in range(ROWS):
+            writer.writerow([f"Product {i}", f"Description of product {i}", i % 1000 + price_offset,
+                             f"images/item{i % 20 + 1}.jpg", f"Category {i % 12}", i % 500])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        original, changed = os.path.join(tmp, "products.csv"), os.path.join(tmp, "changed.csv")
+        write_csv(original, 0.99)
+        write_csv(changed, 0.49)
+
+        print(f"{engine.dialect.name}, {ROWS} rows, chunks of {catalog_io.CHUNK_SIZE}")
+        print(f"{'step':>10} {'seconds':>8} {'rows/s':>9} {'peak MiB':>9}")
+        for step, source in (("insert", original), ("unchanged", original), ("update", changed), ("export", None)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            if source is None:
+                with open(os.path.join(tmp, "export.csv"), "w", newline="") as file:
+                    catalog_io.export_products(file, "csv", session_factory=SessionLocal)
+            else:
+                with open(source, newline="") as file:
+                    catalog_io.import_products(file, "csv", session_factory=SessionLocal)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            print(f"{step:>10} {elapsed:>8.1f} {ROWS / elapsed:>9.0f} {peak:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
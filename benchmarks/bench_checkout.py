@@ -0,0 +1,79 @@
+"""Checkout latency vs cart size.
+
+Run from the project root:
+
+    python -m benchmarks.bench_checkout
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import auth
+from database import Base, create_async_db_engine, create_db_engine, get_async_db
+from main import app
+from models.products import Product
+from models.users import User
+
+CART_SIZES = (1, 10, 50, 100, 250)
+ROUNDS = 20
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{tmp}/bench.sqlite3", poolclass=NullPool)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        with SessionLocal() as db:
+            db.add_all(
+                Product(name=f"Product {i}", price=1.0, image_url="images/item1.jpg", category="bench", stock_avilabilty=10**9)
+                for i in range(max(CART_SIZES))
+            )
+            user = User(first_name="Bench", email="bench@example.com", password="x")
+            db.add(user)
+            db.commit()
+            user_id = user.id
+
+        async def override_get_async_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        client = TestClient(app)
+        client.cookies.set("session_token", auth.create_session(user_id))
+
+        print(f"{'cart size':>10} {'median ms':>10} {'p95 ms':>10}")
+        for size in CART_SIZES:
+            payload = {
+                "user_id": user_id,
+                "items": [
+                    {"product_name": f"Product {i}", "product_id": i + 1, "price": 1.0, "quantity": 1}
+                    for i in range(size)
+                ],
+            }
+            timings = []
+            for _ in range(ROUNDS):
+                start = time.perf_counter()
+                response = client.post("/order/checkout", json=payload)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.text
+            timings.sort()
+            print(f"{size:>10} {statistics.median(timings):>10.2f} {timings[int(len(timings) * 0.95) - 1]:>10.2f}")
+
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Checkout throughput with one transaction per order vs group commit.
+
+Many buyers check out concurrently, either each committing its own
+transaction or through a GroupCommitter that places a batch at a time,
+with one set of statements and one commit.
+Run from the project root:
+
+    python -m benchmarks.bench_group_commit
+
+Both SQLite `synchronous` levels are measured: with FULL every commit waits
+for an fsync. Batching mostly saves the per-order statements and lock
+waits, so it helps at either level.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from config import Settings
+from controller.group_commit import GroupCommitter
+from controller.orders import place_order
+from database import Base, create_db_engine
+from models.products import Product
+from models.users import User
+
+BUYERS = 32
+ORDERS_PER_BUYER = 50
+PRODUCTS = 20
+
+
+def setup(SessionLocal) -> tuple[int, list[int]]:
+    with SessionLocal() as db:
+        user = User(first_name="Bench", email="bench@example.com", password="x")
+        products = [
+            Product(name=f"Product {i}", price=1.0, image_url="images/item1.jpg", category="bench",
+                    stock_avilabilty=BUYERS * ORDERS_PER_BUYER)
+            for i in range(PRODUCTS)
+        ]
+        db.add_all([user, *products])
+        db.commit()
+        return user.id, [product.id for product in products]
+
+
+def run(checkout) -> tuple[float, list[float]]:
+    def buyer(n):
+        timings = []
+        for i in range(ORDERS_PER_BUYER):
+            start = time.perf_counter()
+            checkout(n * ORDERS_PER_BUYER + i)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BUYERS) as pool:
+        results = list(pool.map(buyer, range(BUYERS)))
+    elapsed = time.perf_counter() - start
+    return elapsed, sorted(timing for timings in results for timing in timings)
+
+
+def main():
+    print(f"sqlite, {BUYERS} buyers x {ORDERS_PER_BUYER} orders of 2 products")
+    print(f"{'synchronous':>11} {'mode':>14} {'orders/s':>9} {'median ms':>10} {'p95 ms':>10} {'batches':>8}")
+    for synchronous in ("NORMAL", "FULL"):
+        for mode in ("per-request", "group-commit"):
+            with tempfile.TemporaryDirectory() as tmp:
+                config = Settings(sqlite_synchronous=synchronous)
+                # Group commit needs SAVEPOINTs, like database.writer_engine
+                engine = create_db_engine(f"sqlite:///{tmp}/bench.sqlite3", config, savepoints=mode == "group-commit")
+                Base.metadata.create_all(bind=engine)
+                SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                user_id, product_ids = setup(SessionLocal)
+
+                def cart(n):
+                    return [SimpleNamespace(product_id=product_ids[(n + k) % PRODUCTS], quantity=1, product_name=None,
+                                            price=None) for k in range(2)]
+
+                committer = None
+                if mode == "per-request":
+                    def checkout(n):
+                        with SessionLocal() as db:
+                            place_order(db, user_id, cart(n))
+                            db.commit()
+                else:
+                    committer = GroupCommitter(session_factory=SessionLocal)
+                    committer.start()
+
+                    def checkout(n):
+                        committer.submit(user_id, cart(n)).result()
+
+                elapsed, timings = run(checkout)
+                batches = "-"
+                if committer is not None:
+                    committer.stop()
+                    batches = committer.batches
+                engine.dispose()
+                print(f"{synchronous:>11} {mode:>14} {len(timings) / elapsed:>9.0f} {statistics.median(timings):>10.2f} "
+                      f"{timings[int(len(timings) * 0.95) - 1]:>10.2f} {batches:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Order history latency and query count vs number of orders per user.
+
+Run from the project root:
+
+    python -m benchmarks.bench_order_history
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import auth
+from database import Base, RoutingSession, create_async_db_engine, create_db_engine, get_async_db
+from main import app
+from models.order import OrderDetails, OrderItem
+from models.users import User
+
+ORDER_COUNTS = (10, 100, 1000, 10000)
+ITEMS_PER_ORDER = 5
+ROUNDS = 20
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{tmp}/bench.sqlite3", poolclass=NullPool)
+        AsyncSessionLocal = async_sessionmaker(
+            async_engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+        )
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        with SessionLocal() as db:
+            user = User(first_name="Bench", email="bench@example.com", password="x")
+            db.add(user)
+            db.commit()
+            user_id = user.id
+
+        async def override_get_async_db():
+            async with AsyncSessionLocal() as db:
+                yield db
+
+        statements = []
+        event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        client = TestClient(app)
+        client.cookies.set("session_token", auth.create_session(user_id))
+
+        print(f"{'orders':>8} {'queries':>8} {'median ms':>10} {'p95 ms':>10}")
+        placed = 0
+        for count in ORDER_COUNTS:
+            with SessionLocal() as db:
+                for _ in range(count - placed):
+                    order = OrderDetails(user_id=user_id, total_price=5.0, item_count=ITEMS_PER_ORDER)
+                    db.add(order)
+                    db.flush()
+                    db.execute(insert(OrderItem), [
+                        {"order_details_id": order.id, "product_id": 1, "product_name": "Item", "price": 1.0, "quantity": 1}
+                        for _ in range(ITEMS_PER_ORDER)
+                    ])
+                db.commit()
+            placed = count
+
+            timings = []
+            for _ in range(ROUNDS):
+                statements.clear()
+                start = time.perf_counter()
+                response = client.get("/order/history")
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.text
+            timings.sort()
+            print(f"{count:>8} {len(statements):>8} {statistics.median(timings):>10.2f} {timings[int(len(timings) * 0.95) - 1]:>10.2f}")
+
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Search latency on a large catalog, FTS5 vs the previous ILIKE scan.
+
+Run from the project root:
+
+    python -m benchmarks.bench_search
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from controller.search import fts5_search, inverted_index
+from database import Base
+from models.products import Product
+
+CATALOG_SIZE = 300_000
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "pe", "sa", "do", "fu", "gi", "ha", "jo")
+# ~3400 distinct words, so a term matches a few hundred products like in a real catalog
+WORDS = tuple(a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES)
+QUERIES = ("kalo", "kalomi", "kalomi nerura", "tavozi", "xyz")
+ROUNDS = 20
+
+
+def timed(search):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        search()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.sqlite3")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(insert(Product), [
+                {
+                    "name": " ".join(random.sample(WORDS, 2)) + f" {i}",
+                    "description": " ".join(random.sample(WORDS, 5)),
+                    "price": 1.0,
+                    "image_url": "images/item1.jpg",
+                    "category": random.choice(WORDS),
+                    "stock_avilabilty": 1,
+                }
+                for i in range(CATALOG_SIZE)
+            ])
+
+        with sessionmaker(bind=engine)() as db:
+            inverted_index.rebuild(db)
+            print(f"{'query':>15} {'ilike ms':>10} {'fts5 ms':>10} {'inverted ms':>12}")
+            for query in QUERIES:
+                ilike = timed(lambda: db.query(Product.id).filter(Product.name.ilike(f"%{query}%")).limit(50).all())
+                fts = timed(lambda: fts5_search.search(db, query, 50))
+                inverted = timed(lambda: inverted_index.search(db, query, 50))
+                print(f"{query:>15} {ilike:>10.3f} {fts:>10.3f} {inverted:>12.3f}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Purchase throughput on one hot product, unsharded vs sharded stock.
+
+Many buyers decrement the same product concurrently, each purchase in its
+own transaction. Run from the project root:
+
+    python -m benchmarks.bench_stock_shards
+
+Set BENCH_DATABASE_URL to run against a server database (PostgreSQL,
+MySQL), where row locks are what sharding spreads out. SQLite locks the
+whole database for every write, so there the shard count cannot matter.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from controller.inventory import decrement_stock, shard_stock
+from database import Base, create_db_engine
+from models.products import Product
+
+SHARD_COUNTS = (1, 4, 16)
+BUYERS = 32
+PURCHASES_PER_BUYER = 50
+
+
+def run(SessionLocal, shards: int) -> tuple[float, list[float], int]:
+    with SessionLocal() as db:
+        product = Product(name=f"Hot {shards}", price=1.0, image_url="images/item1.jpg", category="bench",
+                          stock_avilabilty=BUYERS * PURCHASES_PER_BUYER)
+        db.add(product)
+        db.commit()
+        product_id = product.id
+        shard_stock(db, product_id, shards)
+        db.commit()
+
+    def buyer(_):
+        timings, retries = [], 0
+        for _ in range(PURCHASES_PER_BUYER):
+            start = time.perf_counter()
+            while True:
+                with SessionLocal() as db:
+                    try:
+                        new_stock = decrement_stock(db, product_id, 1)
+                        if new_stock is None:
+                            raise RuntimeError("Stock ran out before every purchase was made")
+                        db.commit()
+                        break
+                    except OperationalError:
+                        # Lock timeout / serialization failure: retry
+                        db.rollback()
+                        retries += 1
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings, retries
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BUYERS) as pool:
+        results = list(pool.map(buyer, range(BUYERS)))
+    elapsed = time.perf_counter() - start
+    timings = sorted(timing for buyer_timings, _ in results for timing in buyer_timings)
+    return elapsed, timings, sum(retries for _, retries in results)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        url = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{tmp}/bench.sqlite3")
+        engine = create_db_engine(url)
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        print(f"{engine.dialect.name}, {BUYERS} buyers x {PURCHASES_PER_BUYER} purchases")
+        print(f"{'shards':>7} {'purchases/s':>12} {'median ms':>10} {'p95 ms':>10} {'retries':>8}")
+        for shards in SHARD_COUNTS:
+            elapsed, timings, retries = run(SessionLocal, shards)
+            print(f"{shards:>7} {len(timings) / elapsed:>12.0f} {statistics.median(timings):>10.2f} "
+                  f"{timings[int(len(timings) * 0.95) - 1]:>10.2f} {retries:>8}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Bulk import and export of the product catalog, and stock sharding.
+
+    python -m catalog_io import data/products.csv
+    python -m catalog_io import products.jsonl --chunk-size 10000
+    python -m catalog_io export catalog.csv
+    python -m catalog_io export - --format jsonl > catalog.jsonl
+    python -m catalog_io shard "Flash Sale Phone" 8
+
+Files are CSV with a header row, or JSON Lines (one object per line), with
+the fields in IMPORT_FIELDS; the format follows the file extension unless
+`--format` is given. Both directions stream in chunks of `--chunk-size`
+rows, so memory use does not depend on the size of the file.
+
+Products are matched by name: existing ones are updated, new ones inserted,
+and none are deleted. Each chunk is committed on its own, so an import that
+stops on a bad row can simply be run again once the file is fixed. The
+search index stops following product writes (the SQLite FTS5 triggers are
+dropped) for the length of the import and is rebuilt once at the end; the
+import then bumps the catalog version, and running servers drop their
+cached catalog data within CATALOG_VERSION_INTERVAL.
+
+Names are unique (`ux_products_name`), so a product is never matched twice.
+
+`shard` spreads a hot product's stock over K counter rows so concurrent
+buyers update different rows (see controller/inventory.py); K = 1 merges
+them back. The total stock does not change.
+"""
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+from typing import IO, Iterable, Iterator, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import database
+from controller.catalog_version import bump_catalog_version, drop_cached_catalog
+from controller.inventory import shard_stock, stock_level
+from controller.search import get_search_backend
+from models.products import Product, ProductStockShard
+
+IMPORT_FIELDS = ("name", "description", "price", "image_url", "category", "stock_avilabilty")
+REQUIRED_FIELDS = ("name", "price", "image_url", "category", "stock_avilabilty")
+FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 5000
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass --format")
+
+
+def read_rows(file: IO[str], fmt: str) -> Iterator[tuple[int, dict]]:
+    """Yield `(line_number, raw_row)` from an open CSV or JSON Lines file."""
+    if fmt == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"Line {line_number}: invalid JSON ({exc.msg})") from exc
+
+
+def parse_row(line_number: int, raw: dict) -> dict:
+    """Validate a raw row and convert it to Product column values."""
+    missing = [field for field in REQUIRED_FIELDS if raw.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Line {line_number}: missing {', '.join(missing)}")
+    try:
+        row = {
+            "name": str(raw["name"]).strip(),
+            "description": raw.get("description") or None,
+            "price": float(raw["price"]),
+            "image_url": str(raw["image_url"]),
+            "category": str(raw["category"]),
+            "stock_avilabilty": int(raw["stock_avilabilty"]),
+        }
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Line {line_number}: {exc}") from exc
+    if row["price"] < 0 or row["stock_avilabilty"] < 0:
+        raise ValueError(f"Line {line_number}: price and stock_avilabilty must not be negative")
+    return row
+
+
+def chunked(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def upsert_products(db: Session, rows: list[dict]) -> tuple[int, int]:
+    """Insert or update (by name) a chunk of products with one SELECT and
+    one executemany per kind of write; rows that match the database are
+    left alone. Returns `(inserted, updated)`. Runs in the caller's
+    transaction."""
+    # A name repeated within the chunk: the last row wins
+    by_name = {row["name"]: row for row in rows}
+    columns = [getattr(Product, field) for field in IMPORT_FIELDS]
+    existing = db.execute(select(Product.id, *columns).where(Product.name.in_(by_name))).mappings().all()
+    updates = [
+        {"id": current["id"], **by_name[current["name"]]}
+        for current in existing
+        if any(current[field] != by_name[current["name"]][field] for field in IMPORT_FIELDS)
+    ]
+    found = {current["name"] for current in existing}
+    inserts = [row for name, row in by_name.items() if name not in found]
+
+    if updates:
+        db.execute(update(Product), updates)
+        _reshard(db, [row["id"] for row in updates])
+    if inserts:
+        db.execute(insert(Product), inserts)
+    return len(inserts), len(updates)
+
+
+def _reshard(db: Session, product_ids: list[int]) -> None:
+    # Sharded products keep their stock in the shard rows; spread the
+    # imported stock over the same number of shards
+    counts = db.execute(
+        select(ProductStockShard.product_id, func.count())
+        .where(ProductStockShard.product_id.in_(product_ids))
+        .group_by(ProductStockShard.product_id)
+    ).all()
+    for product_id, shards in counts:
+        db.execute(delete(ProductStockShard).where(ProductStockShard.product_id == product_id))
+        shard_stock(db, product_id, shards)
+
+
+def refresh_catalog(db: Session) -> None:
+    """Rebuild the search index suspended for the import and tell every
+    process, this one included, to drop its cached catalog data; once per
+    import."""
+    get_search_backend(db).resume(db)
+    bump_catalog_version(db)
+    db.commit()
+    drop_cached_catalog()
+
+
+def import_products(file: IO[str], fmt: str, chunk_size: int = CHUNK_SIZE,
+                    session_factory=None) -> dict[str, int]:
+    """Upsert every product in an open CSV/JSON Lines file; returns counts.
+    Raises ValueError on the first invalid row (earlier chunks stay committed)."""
+    session_factory = session_factory or database.SessionLocal
+    totals = {"inserted": 0, "updated": 0}
+    with session_factory() as db:
+        get_search_backend(db).suspend(db)
+        db.commit()
+        try:
+            rows = (parse_row(line_number, raw) for line_number, raw in read_rows(file, fmt))
+            for chunk in chunked(rows, chunk_size):
+                inserted, updated = upsert_products(db, chunk)
+                db.commit()
+                totals["inserted"] += inserted
+                totals["updated"] += updated
+        finally:
+            db.rollback()
+            refresh_catalog(db)
+    return totals
+
+
+def export_products(file: IO[str], fmt: str, chunk_size: int = CHUNK_SIZE, session_factory=None) -> int:
+    """Write the whole catalog, in id order, to an open file; returns the
+    number of products. Rows are fetched `chunk_size` at a time."""
+    session_factory = session_factory or database.SessionLocal
+    columns = [getattr(Product, field) for field in IMPORT_FIELDS if field != "stock_avilabilty"]
+    query = (
+        select(*columns, stock_level().label("stock_avilabilty"))
+        .order_by(Product.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(file, fieldnames=IMPORT_FIELDS, lineterminator="\n")
+        writer.writeheader()
+
+    count = 0
+    with session_factory() as db:
+        for row in db.execute(query).mappings():
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(dict(row)) + "\n")
+            count += 1
+    return count
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number, not {value}")
+    return number
+
+
+def shard_product(name: str, shards: int, session_factory=None) -> int:
+    """Split the stock of the product called `name` over `shards` counter
+    rows (1 merges it back into the product row); returns its id. Raises
+    ValueError if there is no such product."""
+    session_factory = session_factory or database.SessionLocal
+    with session_factory() as db:
+        product_id = db.scalar(select(Product.id).where(Product.name == name))
+        if product_id is None:
+            raise ValueError(f"No product named {name!r}")
+        shard_stock(db, product_id, shards)
+        db.commit()
+    return product_id
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m catalog_io",
+                                     description="Import, export or shard the product catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("import", "export"):
+        transfer = commands.add_parser(command, help=f"{command} products")
+        transfer.add_argument("path", help="CSV or JSON Lines file; '-' for stdin/stdout")
+        transfer.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+        transfer.add_argument("--chunk-size", type=positive_int, default=CHUNK_SIZE)
+    shard = commands.add_parser("shard", help="split a hot product's stock over several counter rows")
+    shard.add_argument("name", help="product name")
+    shard.add_argument("shards", type=positive_int, help="number of counter rows; 1 turns sharding off")
+    args = parser.parse_args(argv)
+
+    if args.command == "shard":
+        database.init_db()
+        try:
+            shard_product(args.name, args.shards)
+        except ValueError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+        print(f"Stock of {args.name!r} is now kept in {args.shards} shard(s)", file=sys.stderr)
+        return 0
+
+    try:
+        fmt = detect_format(args.path, args.format)
+    except ValueError as exc:
+        parser.error(str(exc))
+    database.init_db()
+
+    if args.command == "import":
+        file = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+        try:
+            totals = import_products(file, fmt, args.chunk_size)
+        except ValueError as exc:
+            print(f"Import stopped: {exc}", file=sys.stderr)
+            return 1
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        print(f"Imported {totals['inserted']} new and {totals['updated']} updated products", file=sys.stderr)
+    else:
+        file = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+        try:
+            count = export_products(file, fmt, args.chunk_size)
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        print(f"Exported {count} products", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Application settings.
+
+Every field can be overridden with an environment variable of the same name
+(case-insensitive) or from a `.env` file in the working directory.
+"""
+import os
+from typing import Literal, Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # Database
+    database_url: str = "sqlite:///./db.sqlite3"
+    # Defaults to database_url with its async driver (aiosqlite, asyncpg, ...)
+    async_database_url: Optional[str] = None
+    database_echo: bool = False
+    # Comma separated read replicas of database_url; catalog and profile reads
+    # are spread over them. Empty means every query goes to database_url.
+    read_replica_urls: str = ""
+    # After a write, the client's reads stay on the primary this long, so it
+    # sees its own changes even while the replicas are lagging
+    read_your_writes_seconds: float = 5
+
+    # SQLite profile, applied to every new connection
+    sqlite_journal_mode: Literal["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"] = "WAL"  # readers don't block the writer
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"  # safe with WAL, fsync only at checkpoints
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+
+    # Connection pool profile for server databases (PostgreSQL, MySQL, ...)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+
+    # Password hashing (see controller/user.py)
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 4
+    password_hash_workers: int = os.cpu_count() or 1
+
+    # Sessions (see auth.py)
+    session_backend: Literal["memory", "database"] = "memory"
+    session_mode: Literal["opaque", "signed"] = "opaque"
+    session_signing_keys: str = ""
+    session_ttl_seconds: int = 7 * 24 * 3600
+    session_max_entries: int = 100000
+    session_sweep_interval: float = 60
+
+    # Stock holds taken by carts (see controller/reservations.py)
+    reservation_ttl_seconds: int = 15 * 60
+    reservation_sweep_interval: float = 30
+
+    # Checkout responses kept in memory per Idempotency-Key (see controller/orders.py)
+    idempotency_cache_size: int = 10000
+    # Queue concurrent checkouts and place them together: one transaction (one
+    # fsync) and one set of statements per batch (see controller/group_commit.py)
+    checkout_group_commit: bool = False
+    group_commit_window_ms: float = 2
+    group_commit_max_batch: int = 100
+
+    # Embed the first catalog page in the home page (see main.py)
+    inline_catalog: bool = True
+
+    # Output of `python -m assets`: hashed, precompressed static files
+    asset_build_dir: str = "views/dist"
+
+    # Resized product images (see controller/images.py)
+    image_cache_dir: str = "views/dist/image-cache"
+    image_cache_max_bytes: int = 512 * 1024 * 1024
+    image_workers: int = os.cpu_count() or 1
+
+    # Catalog cache (see controller/catalog.py)
+    catalog_cache_ttl: float = 30
+    catalog_cache_max_entries: int = 256
+    # Product price snapshots behind /order/preview
+    price_cache_ttl: float = 5
+    # Seconds between checks for catalog imports made by other processes
+    # (see controller/catalog_version.py)
+    catalog_version_interval: float = 5
+
+    # Seconds between rebuilds of the in-process search index used without
+    # SQLite FTS5 (see controller/search.py)
+    search_index_max_age: float = 300
+
+
+settings = Settings()
@@ -1 +1,8 @@
-from .user import hash_password,verify_password
\ No newline at end of file
+from .user import (
+    hash_password,
+    verify_password,
+    verify_and_update_password,
+    hash_password_async,
+    verify_password_async,
+    verify_and_update_password_async,
+)
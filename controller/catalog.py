@@ -0,0 +1,203 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Hashable, Iterable, NamedTuple, Optional
+
+from config import settings
+
+# Upper bound on how stale a cached catalog can get. Stock changes made by this
+# process invalidate the cache immediately; the TTL covers changes made by other
+# workers or directly in the database.
+CATALOG_CACHE_TTL = settings.catalog_cache_ttl
+# Query parameters (limit, cursor, fields, ...) multiply the number of
+# distinct responses, so the cache keeps at most this many of them.
+CATALOG_CACHE_MAX_ENTRIES = settings.catalog_cache_max_entries
+# Cart previews may show a price or stock level this old; checkout always
+# reads the locked rows.
+PRICE_CACHE_TTL = settings.price_cache_ttl
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    # Response headers derived from the body when it was built (X-Next-Cursor)
+    headers: dict[str, str]
+
+
+class CatalogCache:
+    """Serialized catalog responses, valid for one catalog version.
+
+    Every entry is stored as ready-to-send JSON bytes together with a strong
+    ETag derived from its content and any headers derived from it, so hits
+    cost a dict lookup and repeat browsers can be answered with 304 Not
+    Modified. Builders return `(body, headers)`."""
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL, max_entries: int = CATALOG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[Hashable, tuple[CachedResponse, float]] = {}
+        self._invalidated_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def get_or_build(self, key: Hashable, build: Callable[[], tuple[bytes, dict]]) -> CachedResponse:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        version = self.version
+        return self._put(key, *build(), version)
+
+    async def get_or_build_async(self, key: Hashable, build: Callable[[], Awaitable[tuple[bytes, dict]]],
+                                 fresh: bool = False) -> CachedResponse:
+        """`get_or_build` for a coroutine `build`, e.g. one awaiting an
+        AsyncSession. `fresh` skips the lookup and replaces the entry."""
+        cached = None if fresh else self.get(key)
+        if cached is not None:
+            return cached
+
+        version = self.version
+        return self._put(key, *await build(), version)
+
+    def _put(self, key: Hashable, body: bytes, headers: dict, version: int) -> CachedResponse:
+        response = CachedResponse(body, f'"{hashlib.sha1(body).hexdigest()}"', headers)
+        with self._lock:
+            # Don't store a body built from data that was invalidated meanwhile
+            if version == self.version:
+                self._entries[key] = (response, time.monotonic() + self.ttl)
+                while len(self._entries) > self.max_entries:
+                    # dicts keep insertion order: drop the oldest entry
+                    del self._entries[next(iter(self._entries))]
+        return response
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._invalidated_at = time.monotonic()
+
+    def invalidated_within(self, seconds: float) -> bool:
+        """Whether `invalidate` was called in the last `seconds`."""
+        return time.monotonic() - self._invalidated_at < seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._invalidated_at = float("-inf")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class PriceCache:
+    """Short-lived `{id, name, price, stock}` snapshots of single products,
+    for cart previews that are refreshed far more often than prices change."""
+
+    def __init__(self, ttl: float = PRICE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: dict[int, tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, product_ids: Iterable[int]) -> tuple[dict[int, dict], list[int]]:
+        """Return the cached snapshots and the ids that need loading."""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._entries.get(product_id)
+                if entry is not None and entry[1] > now:
+                    found[product_id] = entry[0]
+                else:
+                    missing.append(product_id)
+        return found, missing
+
+    def put_many(self, snapshots: Iterable[dict]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            # At most one entry per product, so no eviction is needed
+            for snapshot in snapshots:
+                self._entries[snapshot["id"]] = (snapshot, expires_at)
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None) -> None:
+        with self._lock:
+            if product_ids is None:
+                self._entries.clear()
+            else:
+                for product_id in product_ids:
+                    self._entries.pop(product_id, None)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[list[str]]:
+    """Turn a `fields=name,price` query parameter into a column list.
+
+    `id` is always included because cursors are built from it. Returns None
+    when no projection was requested; raises ValueError on unknown fields."""
+    if not fields:
+        return None
+    allowed = list(allowed)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return [field for field in allowed if field in requested]
+
+
+def encode_cursor(key: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Inverse of `encode_cursor`; raises ValueError on malformed input."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+async def stream_json_array(rows: AsyncIterable[dict], batch_size: int = 100) -> AsyncIterator[bytes]:
+    """Serialize `rows` as a JSON array in chunks, so a large page is sent
+    while it is still being read instead of being built in memory first."""
+    yield b"["
+    batch = []
+    first = True
+    async for row in rows:
+        batch.append(json.dumps(row))
+        if len(batch) == batch_size:
+            yield (("" if first else ",") + ",".join(batch)).encode()
+            batch, first = [], False
+    if batch:
+        yield (("" if first else ",") + ",".join(batch)).encode()
+    yield b"]"
+
+
+catalog_cache = CatalogCache()
+price_cache = PriceCache()
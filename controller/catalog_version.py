@@ -0,0 +1,64 @@
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import database
+from config import settings
+from controller.catalog import catalog_cache, price_cache
+from controller.periodic import PeriodicWorker
+from controller.search import inverted_index
+from models.products import CatalogVersion
+
+CATALOG_VERSION_INTERVAL = settings.catalog_version_interval
+
+
+def bump_catalog_version(db: Session) -> None:
+    """Record that the catalog changed behind the servers' back (writes
+    that bypass the ORM, from another process), in the caller's transaction."""
+    db.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def catalog_version(db: Session) -> Optional[int]:
+    return db.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar_one_or_none()
+
+
+def drop_cached_catalog() -> None:
+    """Forget everything this process keeps about products; it is reloaded
+    from the database on next use."""
+    catalog_cache.invalidate()
+    price_cache.invalidate()
+    inverted_index.clear()
+
+
+class CatalogWatcher(PeriodicWorker):
+    """Background thread that polls the catalog version and drops this
+    process's cached catalog data when another process (e.g. `python -m
+    catalog_io import`) has bumped it."""
+
+    name = "catalog-watcher"
+
+    def __init__(self, interval: float = CATALOG_VERSION_INTERVAL, session_factory=None):
+        super().__init__(interval)
+        self.session_factory = session_factory or database.SessionLocal
+        self.version: Optional[int] = None
+
+    def start(self) -> None:
+        # Taken before anything is cached, so an import that finishes before
+        # the first poll is not missed
+        with self.session_factory() as db:
+            self.version = catalog_version(db)
+        super().start()
+
+    def run_once(self) -> None:
+        with self.session_factory() as db:
+            version = catalog_version(db)
+        if self.version is not None and version != self.version:
+            drop_cached_catalog()
+        self.version = version
+
+
+watcher = CatalogWatcher()
@@ -0,0 +1,164 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
+
+import database
+from config import settings
+from controller.orders import place_order, place_orders
+
+# Checkouts arriving within this window of the first queued one share its
+# commit; the first waits at most this long for company.
+GROUP_COMMIT_WINDOW_MS = settings.group_commit_window_ms
+GROUP_COMMIT_MAX_BATCH = settings.group_commit_max_batch
+
+
+class CommitterStopped(RuntimeError):
+    """The committer is not running; the caller commits on its own."""
+
+
+class _Job:
+    __slots__ = ("args", "future")
+
+    def __init__(self, args: tuple):
+        self.args = args
+        self.future: Future = Future()
+
+
+class GroupCommitter:
+    """Background writer that places queued checkouts in batches, each batch
+    as a single transaction.
+
+    A batch is written by `place_orders`, with the same few statements
+    however many orders it holds, in submission order, so an order sees the
+    stock left by the ones before it and one that cannot be placed just
+    gets its OrderError. If the batch fails as a whole (a reused idempotency
+    key, shards that came up short), it is rolled back and its orders are
+    placed again one at a time, each in its own SAVEPOINT, so only the
+    offending ones fail. Once the transaction commits each caller's future
+    gets its own result or exception; if the commit itself fails, every
+    order in the batch fails with it."""
+
+    def __init__(self, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH,
+                 session_factory=None):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.session_factory = session_factory or database.WriterSessionLocal
+        self.batches = 0
+        self.jobs = 0
+        self.fallbacks = 0
+        self._queue: queue.Queue[_Job] = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Guards `_accepting`, so no job is queued once `stop` has begun
+        self._lock = threading.Lock()
+        self._accepting = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._accepting = True
+            self._thread = threading.Thread(target=self._run, name="group-committer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop after committing whatever is already queued. Blocks until
+        then; call it from a worker thread in async code."""
+        with self._lock:
+            self._accepting = False
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, user_id: int, cart, idempotency_key: Optional[str] = None,
+               request_hash: Optional[str] = None) -> Future:
+        """Queue a checkout (`place_order`'s arguments); the future resolves
+        after its batch commits. Raises CommitterStopped unless started."""
+        with self._lock:
+            if not self._accepting:
+                raise CommitterStopped("group committer is not running")
+            job = _Job((user_id, cart, idempotency_key, request_hash))
+            self._queue.put(job)
+        return job.future
+
+    async def run(self, *args) -> Any:
+        return await asyncio.wrap_future(self.submit(*args))
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self._commit(self._collect(first))
+
+    def _collect(self, first: _Job) -> list[_Job]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Take what is already queued without waiting, then wait out the window
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch: list[_Job]) -> None:
+        try:
+            with self.session_factory() as db:
+                outcomes = place_orders(db, [job.args for job in batch])
+                db.commit()
+        except Exception:
+            self.fallbacks += 1
+            outcomes = self._commit_each(batch)
+
+        self.batches += 1
+        self.jobs += len(batch)
+        for job, outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                job.future.set_exception(outcome)
+            else:
+                job.future.set_result(outcome)
+
+    def _commit_each(self, batch: list[_Job]) -> list:
+        outcomes = []
+        try:
+            with self.session_factory() as db:
+                for job in batch:
+                    outcomes.append(self._apply(db, job))
+                db.commit()
+        except Exception as exc:
+            outcomes = [exc] * len(batch)
+        return outcomes
+
+    @staticmethod
+    def _apply(db: Session, job: _Job) -> Any:
+        try:
+            with db.begin_nested():
+                return place_order(db, *job.args)
+        except Exception as exc:
+            return exc
+        finally:
+            # Rows loaded by this order may have been changed with Core
+            # UPDATEs; the next one must read them again
+            db.expire_all()
+
+
+# Only created when CHECKOUT_GROUP_COMMIT is on; checkout falls back to one
+# transaction per request otherwise
+committer: Optional[GroupCommitter] = GroupCommitter() if settings.checkout_group_commit else None
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # in requirements.txt; without it the originals are served
+    Image = None
+
+IMAGE_DIR = "views/images"
+# Widths variants are made in; requested widths are rounded up to one of
+# these so the cache holds a handful of files per image, not one per pixel
+IMAGE_WIDTHS = (320, 480, 640, 960, 1280)
+IMAGE_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+IMAGE_QUALITY = {"webp": 80, "jpeg": 82}
+IMAGE_CACHE_DIR = settings.image_cache_dir
+IMAGE_CACHE_MAX_BYTES = settings.image_cache_max_bytes
+# Variants used this recently are never evicted: a response may be about
+# to stream them
+IMAGE_CACHE_MIN_AGE = 60
+# Pillow releases the GIL while decoding, resizing and encoding
+IMAGE_WORKERS = settings.image_workers
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-resize")
+
+
+def variant_width(requested: int) -> int:
+    return next((width for width in IMAGE_WIDTHS if width >= requested), IMAGE_WIDTHS[-1])
+
+
+def srcset(image_url: Optional[str]) -> Optional[str]:
+    """`srcset` attribute value for a product image served from /images,
+    None for external URLs or when Pillow is missing (no variants)."""
+    if not image_url or Image is None:
+        return None
+    name = image_url.removeprefix("/").removeprefix("images/")
+    if name == image_url.removeprefix("/") or "/" in name:
+        return None
+    return ", ".join(f"/images/{name}?w={width} {width}w" for width in IMAGE_WIDTHS)
+
+
+def resize(source: bytes, width: int, fmt: str) -> bytes:
+    """Scale an image down to `width` (never up) and encode it as `fmt`."""
+    with Image.open(io.BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if fmt == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif fmt == "webp" and image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        image.save(output, format=fmt.upper(), quality=IMAGE_QUALITY[fmt], optimize=True,
+                   **({"progressive": True} if fmt == "jpeg" else {"method": 4}))
+        return output.getvalue()
+
+
+class ImageCache:
+    """Resized images on disk, named by a hash of the original's content and
+    the variant, so an edited original never serves a stale variant.
+
+    When the files exceed `max_bytes`, the least recently used ones are
+    deleted (reads refresh a file's mtime), except those used within
+    `min_age` seconds, so the limit can be briefly overrun. Concurrent
+    requests for the same missing variant share a single resize."""
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+                 executor: ThreadPoolExecutor = _image_executor, min_age: float = IMAGE_CACHE_MIN_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.executor = executor
+        self.min_age = min_age
+        self._size: Optional[int] = None
+        self._digests: dict[str, tuple[int, int, str]] = {}
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # Held while a hit refreshes a file's mtime and while eviction
+        # re-checks and deletes one, so a file handed out is never deleted
+        self._touch_lock = threading.Lock()
+        # One thread at a time walks the directory to count or evict
+        self._evicting = threading.Lock()
+
+    def key(self, path: str, width: int, fmt: str) -> str:
+        """Cache key of a variant; reads the original only when it changed."""
+        stat = os.stat(path)
+        with self._lock:
+            known = self._digests.get(path)
+        if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, "rb") as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+            known = (stat.st_mtime_ns, stat.st_size, digest)
+            with self._lock:
+                self._digests[path] = known
+        return hashlib.sha256(f"{known[2]}:{width}:{fmt}".encode()).hexdigest()
+
+    def path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    async def get(self, source: str, width: int, fmt: str) -> tuple[str, str]:
+        """Return `(path, key)` of the variant, making it if needed."""
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(self.executor, self.key, source, width, fmt)
+        path = self.path(key, fmt)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = self.executor.submit(self._make, source, path, width, fmt)
+                pending.add_done_callback(lambda _: self._done(key))
+        await asyncio.wrap_future(pending)
+        return path, key
+
+    def _done(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _make(self, source: str, path: str, width: int, fmt: str) -> None:
+        try:
+            with self._touch_lock:
+                os.utime(path)  # cache hit: mark as recently used
+            return
+        except FileNotFoundError:
+            pass
+        with open(source, "rb") as file:
+            data = resize(file.read(), width, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        self._added(len(data))
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_bytes:
+                    return
+        # Walking the directory is slow, so it happens outside `_lock`, which
+        # every request takes. It also corrects `_size` for files added by
+        # other threads meanwhile; if another walk is running, it covers this one.
+        if not self._evicting.acquire(blocking=False):
+            return
+        try:
+            files = sorted(self._files(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in files)
+            recent = time.time() - self.min_age
+            # Evict down to 90% so eviction doesn't run on every insert
+            for path, size, mtime in files:
+                if total <= self.max_bytes * 0.9 or mtime > recent:
+                    break
+                try:
+                    with self._touch_lock:
+                        if os.stat(path).st_mtime > recent:
+                            continue
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            with self._lock:
+                self._size = total
+        finally:
+            self._evicting.release()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+
+image_cache = ImageCache()
@@ -0,0 +1,236 @@
+import random
+from typing import Iterable, Optional
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.products import Product, ProductStockShard
+
+
+def stock_level():
+    """SQL expression for a product's stock: the sum of its shards when it
+    is sharded, otherwise `stock_avilabilty`."""
+    shards = (
+        select(func.sum(ProductStockShard.quantity))
+        .where(ProductStockShard.product_id == Product.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(shards, Product.stock_avilabilty)
+
+
+def sharded_totals(db: Session, product_ids: Iterable[int]) -> dict[int, int]:
+    """Current stock of the sharded products among `product_ids`."""
+    rows = db.execute(
+        select(ProductStockShard.product_id, func.sum(ProductStockShard.quantity))
+        .where(ProductStockShard.product_id.in_(list(product_ids)))
+        .group_by(ProductStockShard.product_id)
+    )
+    return {product_id: int(total) for product_id, total in rows}
+
+
+def shard_stock(db: Session, product_id: int, shards: int) -> None:
+    """Split a product's stock evenly over `shards` counter rows, or merge it
+    back into the product row when `shards` is 1. Runs in the caller's
+    transaction; the product row and its shards are locked first, so
+    concurrent purchases wait instead of being lost in the move."""
+    lock_products(db, [product_id])
+    db.execute(select(ProductStockShard.shard).where(ProductStockShard.product_id == product_id).with_for_update())
+    total = db.execute(select(stock_level()).where(Product.id == product_id)).scalar_one()
+    db.execute(delete(ProductStockShard).where(ProductStockShard.product_id == product_id))
+    if shards > 1:
+        db.execute(insert(ProductStockShard), [
+            {"product_id": product_id, "shard": shard, "quantity": total // shards + (shard < total % shards)}
+            for shard in range(shards)
+        ])
+    db.execute(
+        update(Product).where(Product.id == product_id).values(stock_avilabilty=total)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _take_from_shard(db: Session, product_id: int, shard: int, take: int) -> bool:
+    result = db.execute(
+        update(ProductStockShard)
+        .where(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.shard == shard,
+            ProductStockShard.quantity >= take
+        )
+        .values(quantity=ProductStockShard.quantity - take)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def decrement_sharded(db: Session, product_id: int, quantity: int, held: int = 0) -> bool:
+    """Take `quantity` from a sharded product's counters, leaving at least
+    `held` units (stock reserved by carts) in place.
+
+    Shards are tried in random order and each one is updated with its own
+    conditional UPDATE, so concurrent buyers of the same product usually
+    lock different rows. A quantity larger than one shard holds is taken
+    from several; a shard another buyer lowered meanwhile is locked and
+    re-read, and what it still has is taken. With `held`, every shard is
+    locked up front so the total can be checked without other buyers
+    selling in between. The caller must hold at least a shared lock on the
+    product row, so `held` cannot grow meanwhile (see `reserve_stock`).
+    Returns False if the shards came up short; the caller must then roll
+    back."""
+    query = (
+        select(ProductStockShard.shard, ProductStockShard.quantity)
+        .where(ProductStockShard.product_id == product_id)
+        .order_by(ProductStockShard.shard)
+    )
+    if held:
+        query = query.with_for_update()
+    shards = db.execute(query).all()
+    if held and sum(available for _, available in shards) < quantity + held:
+        return False
+
+    shards = [(shard, available) for shard, available in shards if available > 0]
+    random.shuffle(shards)
+    remaining = quantity
+    for shard, available in shards:
+        take = min(available, remaining)
+        if not _take_from_shard(db, product_id, shard, take):
+            available = db.execute(
+                select(ProductStockShard.quantity)
+                .where(ProductStockShard.product_id == product_id, ProductStockShard.shard == shard)
+                .with_for_update()
+            ).scalar_one()
+            take = min(available, remaining)
+            # Locked now, so this can only fail if the shard is empty
+            if take == 0 or not _take_from_shard(db, product_id, shard, take):
+                continue
+        remaining -= take
+        if remaining == 0:
+            return True
+    return False
+
+
+def sync_sharded_stock(db: Session) -> int:
+    """Copy the shard totals into `stock_avilabilty`, which listings read.
+    Returns the number of products whose total changed. Commits."""
+    total = (
+        select(func.sum(ProductStockShard.quantity))
+        .where(ProductStockShard.product_id == Product.id)
+        .scalar_subquery()
+    )
+    sharded = select(ProductStockShard.product_id).distinct()
+    result = db.execute(
+        update(Product)
+        .where(Product.id.in_(sharded), Product.stock_avilabilty != total)
+        .values(stock_avilabilty=total)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def lock_products(db: Session, product_ids) -> dict[int, Product]:
+    """Load and lock every product in `product_ids` with one query.
+
+    Rows are locked in primary key order so two concurrent checkouts that
+    share products always acquire their locks in the same order and cannot
+    deadlock each other."""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    query = select(Product).where(Product.id.in_(product_ids)).order_by(Product.id).with_for_update()
+    return {product.id: product for product in db.execute(query).scalars()}
+
+
+def reserve_stock(db: Session, product_id: int, quantity: int) -> bool:
+    """Add `quantity` to a product's reserved stock if that much is free
+    (stock minus what is already reserved); returns False otherwise.
+
+    The check and the write are one `UPDATE ... SET reserved = reserved + :q
+    WHERE stock - reserved >= :q`, so no row is locked up front and two
+    reservations cannot both take the last units. A sharded product's
+    stock is not on the row: buyers of it hold a shared lock on the row
+    (see `decrement_stock`), and the stock is re-read once the update has
+    waited them out, since the update may have evaluated an older total.
+    On False nothing is changed."""
+    result = db.execute(
+        update(Product)
+        .where(Product.id == product_id, stock_level() - Product.reserved >= quantity)
+        .values(reserved=Product.reserved + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    if db.execute(select(stock_level() - Product.reserved).where(Product.id == product_id)).scalar_one() < 0:
+        unreserve_stock(db, {product_id: quantity})
+        return False
+    return True
+
+
+def unreserve_stock(db: Session, quantities: dict[int, int]) -> None:
+    """Subtract `quantities` (product_id -> quantity) from reserved stock in
+    a single UPDATE statement."""
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+    db.execute(
+        update(Product)
+        .where(Product.id.in_(quantities))
+        .values(reserved=Product.reserved - case(quantities, value=Product.id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def decrement_stock_bulk(db: Session, quantities: dict[int, int]) -> bool:
+    """Subtract `quantities` (product_id -> quantity) from stock in a single
+    UPDATE statement.
+
+    Every row is only updated if it still has enough stock; returns False
+    (and updates nothing visible once the caller rolls back) when any
+    product came up short."""
+    if not quantities:
+        return True
+    quantity = case(quantities, value=Product.id)
+    result = db.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.stock_avilabilty >= quantity)
+        .values(stock_avilabilty=Product.stock_avilabilty - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(quantities)
+
+
+def decrement_stock(db: Session, product_id: int, quantity: int) -> Optional[int]:
+    """Atomically subtract `quantity` from one product's stock, leaving its
+    reserved stock (held by carts) in place.
+
+    Runs `UPDATE ... WHERE id = :id AND stock - reserved >= :q RETURNING
+    stock`, so the check and the write cannot interleave with another
+    purchase or reservation. Returns the new stock, or None if the product
+    is missing or has too little free stock. Engines without UPDATE ...
+    RETURNING re-read the row, which is still locked by the update, inside
+    the same transaction. Sharded products are decremented with
+    `decrement_sharded` under a shared lock on the product row, which
+    keeps new reservations out until the purchase commits."""
+    sharded = sharded_totals(db, [product_id])
+    if sharded:
+        # FOR SHARE on PostgreSQL: other buyers can take it too
+        reserved = db.execute(
+            select(Product.reserved).where(Product.id == product_id).with_for_update(read=True)
+        ).scalar_one()
+        # Refused early from the snapshot; decrement_sharded checks again
+        # under its locks
+        if sharded[product_id] < quantity + reserved or not decrement_sharded(db, product_id, quantity, reserved):
+            return None
+        return sharded_totals(db, [product_id])[product_id]
+
+    statement = (
+        update(Product)
+        .where(Product.id == product_id, Product.stock_avilabilty - Product.reserved >= quantity)
+        .values(stock_avilabilty=Product.stock_avilabilty - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(statement.returning(Product.stock_avilabilty)).scalar_one_or_none()
+
+    if db.execute(statement).rowcount != 1:
+        return None
+    return db.execute(select(Product.stock_avilabilty).where(Product.id == product_id)).scalar_one()
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from controller.inventory import decrement_sharded, decrement_stock_bulk, lock_products, sharded_totals
+from controller.reservations import confirm, holds_by_user
+from models.order import OrderDetails, OrderItem
+
+# Longest Idempotency-Key accepted (the column is String(64))
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+IDEMPOTENCY_CACHE_SIZE = settings.idempotency_cache_size
+
+
+class OrderError(Exception):
+    """A checkout that cannot be placed; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyCache:
+    """Recent checkout responses by `(user_id, idempotency_key)`, with the
+    hash of the request that produced them, so retries are answered without
+    a database round trip. LRU bounded; a miss falls back to the key stored
+    on the order."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[Optional[str], dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[tuple[Optional[str], dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, request_hash: Optional[str], response: dict) -> None:
+        with self._lock:
+            self._entries[key] = (request_hash, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+idempotency_cache = IdempotencyCache()
+
+
+def request_hash(cart) -> str:
+    """Fingerprint of a checkout cart (as sent, client prices included)."""
+    lines = [[item.product_id, item.quantity, item.product_name, item.price] for item in cart]
+    return hashlib.sha256(json.dumps(lines).encode()).hexdigest()
+
+
+def price_changes(cart, products: dict[int, dict]) -> list[dict]:
+    """Cart lines whose client-side price differs from the current one."""
+    changes = []
+    for item in cart:
+        product = products.get(item.product_id)
+        if product is None or item.price is None or round(item.price, 2) == round(product["price"], 2):
+            continue
+        changes.append({
+            "product_id": item.product_id,
+            "product_name": product["name"],
+            "client_price": item.price,
+            "price": product["price"]
+        })
+    return changes
+
+
+def preview_order(cart, products: dict[int, dict]) -> dict:
+    """Price `cart` from product snapshots (`id`, `name`, `price`, `stock`)
+    without reserving anything."""
+    quantities: dict[int, int] = {}
+    for item in cart:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    items, missing = [], []
+    for item in cart:
+        product = products.get(item.product_id)
+        if product is None:
+            missing.append(item.product_id)
+            continue
+        items.append({
+            "product_id": item.product_id,
+            "product_name": product["name"],
+            "price": product["price"],
+            "quantity": item.quantity,
+            "available": product["stock"],
+            "in_stock": product["stock"] >= quantities[item.product_id]
+        })
+    return {
+        "items": items,
+        "total": sum(item["price"] * item["quantity"] for item in items),
+        "price_changes": price_changes(cart, products),
+        "missing": missing
+    }
+
+
+def place_order(db: Session, user_id: int, cart, idempotency_key: Optional[str] = None,
+                request_hash: Optional[str] = None) -> dict:
+    """Validate stock, decrement it and write the order for `cart` (a list of
+    items with product_id and quantity) in the current transaction. Names
+    and prices come from the locked product rows; client-side prices are
+    only compared, and differences are listed in `price_changes`.
+
+    The caller commits; on OrderError it must roll back. A second order
+    with the same `idempotency_key` fails with IntegrityError. The order
+    keeps `request_hash` and the price changes, so `checkout_response` can
+    replay the response."""
+    (outcome,) = place_orders(db, [(user_id, cart, idempotency_key, request_hash)])
+    if isinstance(outcome, OrderError):
+        raise outcome
+    return outcome
+
+
+def place_orders(db: Session, orders: list[tuple]) -> list:
+    """Place several checkouts, each given as `place_order`'s arguments
+    `(user_id, cart, idempotency_key, request_hash)`, in the current
+    transaction with the same handful of statements however many there are.
+
+    Orders are validated in sequence against the locked stock, so each one
+    sees what the ones before it left; an order that cannot be placed gets
+    its OrderError in the returned list, in place of its response. Raises
+    OrderError if the stock came up short after all, or IntegrityError if an
+    idempotency key was already used (also by another order in `orders`);
+    the caller must then roll back all of them."""
+    # Merge repeated cart lines so each product is locked and updated once
+    carts: list[dict[int, int]] = []
+    for _, cart, _, _ in orders:
+        quantities: dict[int, int] = {}
+        for item in cart:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        carts.append(quantities)
+    product_ids = {product_id for quantities in carts for product_id in quantities}
+
+    # 1. Lock all referenced products in one query and read their stock and
+    # the active holds on them. A sharded product's stock lives in its shard
+    # rows, but the lock still keeps reservations and purchases of it out.
+    products = lock_products(db, product_ids)
+    sharded = sharded_totals(db, product_ids)
+    holds = holds_by_user(db, product_ids)
+    stock = {product_id: sharded.get(product_id, product.stock_avilabilty) for product_id, product in products.items()}
+
+    # 2. Validate each order against the stock not held by other carts (the
+    # user's own holds count as theirs) and take its stock
+    outcomes: list = []
+    taken: dict[int, int] = {}
+    confirmed: list[tuple[int, int]] = []
+    for (user_id, cart, _, _), quantities in zip(orders, carts):
+        try:
+            for item in cart:
+                product = products.get(item.product_id)
+                if not product:
+                    raise OrderError(404, f"Product {item.product_name or item.product_id} not found")
+
+                others = sum(quantity for holder, quantity in holds.get(item.product_id, {}).items() if holder != user_id)
+                available = stock[item.product_id] - others
+                if available < quantities[item.product_id]:
+                    raise OrderError(400, f"Insufficient stock for {product.name}. Available: {max(available, 0)}")
+        except OrderError as exc:
+            outcomes.append(exc)
+            continue
+
+        for product_id, quantity in quantities.items():
+            stock[product_id] -= quantity
+            taken[product_id] = taken.get(product_id, 0) + quantity
+            # The user's hold on the product turns into this order
+            holds.get(product_id, {}).pop(user_id, None)
+            confirmed.append((user_id, product_id))
+        outcomes.append(None)
+
+    # 3. Deduct the stock of every product with one conditional UPDATE (one
+    # per sharded product, which leaves the remaining holds in place) and
+    # delete the holds the orders used up
+    unsharded = {product_id: quantity for product_id, quantity in taken.items() if product_id not in sharded}
+    if not decrement_stock_bulk(db, unsharded) or not all(
+        decrement_sharded(db, product_id, taken[product_id], sum(holds.get(product_id, {}).values()))
+        for product_id in sharded if product_id in taken
+    ):
+        raise OrderError(400, "Insufficient stock for one or more items. Please try again.")
+    confirm(db, confirmed)
+
+    # 4. Write the order headers with one multi-row INSERT, then all of
+    # their items with one executemany
+    placed: list[tuple[int, OrderDetails, list]] = []
+    snapshots = {product.id: {"name": product.name, "price": product.price} for product in products.values()}
+    for index, ((user_id, cart, idempotency_key, request_hash), quantities) in enumerate(zip(orders, carts)):
+        if outcomes[index] is not None:
+            continue
+        changes = price_changes(cart, snapshots)
+        order = OrderDetails(
+            user_id=user_id, total_price=sum(products[item.product_id].price * item.quantity for item in cart),
+            item_count=sum(quantities.values()), idempotency_key=idempotency_key, request_hash=request_hash,
+            price_changes=changes or None
+        )
+        placed.append((index, order, changes))
+    db.add_all([order for _, order, _ in placed])
+    db.flush()  # <-- generates the order ids before adding items
+
+    items = []
+    for index, order, changes in placed:
+        lines = [
+            {
+                "order_details_id": order.id,
+                "product_name": products[item.product_id].name,
+                "product_id": item.product_id,
+                "price": products[item.product_id].price,
+                "quantity": item.quantity
+            }
+            for item in orders[index][1]
+        ]
+        items.extend(lines)
+        outcomes[index] = {
+            "message": "Checkout saved successfully",
+            "order_details_id": order.id,
+            "total": order.total_price,
+            "items": [{key: line[key] for key in ("product_id", "product_name", "quantity", "price")} for line in lines],
+            "price_changes": changes
+        }
+    if items:
+        db.execute(insert(OrderItem), items)
+
+    return outcomes
+
+
+def serialize_order(order: OrderDetails) -> dict:
+    """An order and its (already loaded) items as returned by the API."""
+    return {
+        "order_details_id": order.id,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "total": order.total_price,
+        "item_count": order.item_count,
+        "items": [
+            {
+                "product_id": item.product_id,
+                "product_name": item.product_name,
+                "quantity": item.quantity,
+                "price": item.price
+            }
+            for item in order.items
+        ]
+    }
+
+
+def checkout_response(order: OrderDetails) -> dict:
+    """The checkout response for an existing order, used to replay it."""
+    summary = serialize_order(order)
+    return {
+        "message": "Checkout saved successfully",
+        "order_details_id": summary["order_details_id"],
+        "total": summary["total"],
+        "items": summary["items"],
+        "price_changes": order.price_changes or []
+    }
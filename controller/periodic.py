@@ -0,0 +1,39 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class PeriodicWorker(ABC):
+    """Background thread that calls `run_once` every `interval` seconds
+    until stopped."""
+
+    name = "periodic-worker"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @abstractmethod
+    def run_once(self) -> None: ...
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                # A failed run (e.g. database briefly locked) is retried next interval
+                pass
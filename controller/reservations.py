@@ -0,0 +1,151 @@
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import Select, delete, select, tuple_
+from sqlalchemy.orm import Session
+
+import database
+from config import settings
+from controller.catalog import catalog_cache
+from controller.inventory import reserve_stock, sync_sharded_stock, unreserve_stock
+from controller.periodic import PeriodicWorker
+from database import utcnow
+from models.reservations import StockReservation
+
+# How long a cart keeps its stock before it is given back
+RESERVATION_TTL_SECONDS = settings.reservation_ttl_seconds
+RESERVATION_SWEEP_INTERVAL = settings.reservation_sweep_interval
+
+
+def holds_by_user(db: Session, product_ids: Iterable[int]) -> dict[int, dict[int, int]]:
+    """Active holds per product, split by user (product_id -> user_id -> quantity)."""
+    query = (
+        select(StockReservation.product_id, StockReservation.user_id, StockReservation.quantity)
+        .where(StockReservation.product_id.in_(list(product_ids)), StockReservation.expires_at > utcnow())
+    )
+    holds: dict[int, dict[int, int]] = {}
+    for product_id, user_id, quantity in db.execute(query):
+        holds.setdefault(product_id, {})[user_id] = quantity
+    return holds
+
+
+def user_holds(user_id: int) -> Select:
+    """Query for the user's active holds, oldest first."""
+    return (
+        select(StockReservation)
+        .where(StockReservation.user_id == user_id, StockReservation.expires_at > utcnow())
+        .order_by(StockReservation.id)
+    )
+
+
+def _delete_holds(db: Session, *conditions) -> int:
+    """Delete the holds matching `conditions` and take their quantities off
+    the products' reserved stock, in the caller's transaction. Returns the
+    number of holds deleted."""
+    if db.get_bind().dialect.delete_returning:
+        rows = db.execute(
+            delete(StockReservation).where(*conditions)
+            .returning(StockReservation.product_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+    else:
+        rows = db.execute(
+            select(StockReservation.product_id, StockReservation.quantity).where(*conditions).with_for_update()
+        ).all()
+        db.execute(delete(StockReservation).where(*conditions).execution_options(synchronize_session=False))
+    released: dict[int, int] = {}
+    for product_id, quantity in rows:
+        released[product_id] = released.get(product_id, 0) + quantity
+    unreserve_stock(db, released)
+    return len(rows)
+
+
+def release_expired(db: Session, product_ids: Optional[Iterable[int]] = None, keep_user: Optional[int] = None) -> int:
+    """Delete expired holds (on `product_ids`, if given; apart from
+    `keep_user`'s, if given) and give their stock back, in the caller's
+    transaction. Returns the number of holds released."""
+    conditions = [StockReservation.expires_at <= utcnow()]
+    if product_ids is not None:
+        conditions.append(StockReservation.product_id.in_(list(product_ids)))
+    if keep_user is not None:
+        conditions.append(StockReservation.user_id != keep_user)
+    return _delete_holds(db, *conditions)
+
+
+def reserve(db: Session, user_id: int, product_id: int, quantity: int,
+            ttl: int = RESERVATION_TTL_SECONDS) -> Optional[StockReservation]:
+    """Hold `quantity` of a product for the user's cart, replacing any hold
+    they already have on it and restarting its expiry. Returns None when
+    not enough stock is free. Commits.
+
+    A hold that grows takes the difference with `reserve_stock`'s single
+    conditional UPDATE of the product's reserved stock, so no row is locked
+    beforehand. That stock still counts holds that expired but have not
+    been swept yet, so a refusal releases those and asks once more before
+    giving up."""
+    hold = db.execute(
+        select(StockReservation).where(StockReservation.user_id == user_id, StockReservation.product_id == product_id)
+    ).scalar_one_or_none()
+    # Reserved stock counts the existing hold, expired or not, until the row goes
+    delta = quantity - (hold.quantity if hold is not None else 0)
+    try:
+        if delta > 0 and not reserve_stock(db, product_id, delta):
+            if not release_expired(db, [product_id], keep_user=user_id) or not reserve_stock(db, product_id, delta):
+                db.rollback()
+                return None
+        elif delta < 0:
+            unreserve_stock(db, {product_id: -delta})
+        if hold is None:
+            hold = StockReservation(user_id=user_id, product_id=product_id)
+            db.add(hold)
+        hold.quantity = quantity
+        hold.expires_at = utcnow() + timedelta(seconds=ttl)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return hold
+
+
+def release(db: Session, user_id: int, product_id: int) -> bool:
+    """Drop the user's hold on a product; returns False if there was none. Commits."""
+    released = _delete_holds(db, StockReservation.user_id == user_id, StockReservation.product_id == product_id)
+    db.commit()
+    return released > 0
+
+
+def confirm(db: Session, holds: Iterable[tuple[int, int]]) -> None:
+    """Remove the holds (`(user_id, product_id)` pairs) that checkouts have
+    turned into orders, in the caller's transaction, which must have locked
+    the products: one DELETE, plus one UPDATE of their reserved stock."""
+    holds = list(holds)
+    if not holds:
+        return
+    _delete_holds(db, tuple_(StockReservation.user_id, StockReservation.product_id).in_(holds))
+
+
+def sweep_expired(db: Session) -> int:
+    """Delete expired holds and give their stock back. Commits."""
+    released = release_expired(db)
+    db.commit()
+    return released
+
+
+class ReservationSweeper(PeriodicWorker):
+    """Background thread that periodically gives back expired holds and
+    copies sharded stock totals to the product rows listings read."""
+
+    name = "reservation-sweeper"
+
+    def __init__(self, interval: float = RESERVATION_SWEEP_INTERVAL, session_factory=None):
+        super().__init__(interval)
+        self.session_factory = session_factory or database.SessionLocal
+
+    def run_once(self) -> None:
+        with self.session_factory() as db:
+            sweep_expired(db)
+            if sync_sharded_stock(db):
+                catalog_cache.invalidate()
+
+
+sweeper = ReservationSweeper()
@@ -0,0 +1,317 @@
+import bisect
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.products import Product
+
+# Relative weight of a match in each indexed column, highest first
+FIELD_WEIGHTS = {"name": 10.0, "description": 1.0, "category": 2.0}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# The in-process index only sees this process's commits; rebuilding it this
+# often bounds how far it can drift from writes made by other workers
+SEARCH_INDEX_MAX_AGE = settings.search_index_max_age
+
+
+def tokenize(value) -> list[str]:
+    return _TOKEN_RE.findall(value.lower()) if value else []
+
+
+@lru_cache(maxsize=None)
+def fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(value)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+# Position of a result in the ranking: (score, product_id), lowest first
+SearchKey = tuple[float, int]
+
+
+class SearchBackend(ABC):
+    @abstractmethod
+    def search(self, db: Session, query: str, limit: int, offset: int = 0,
+               after: Optional[SearchKey] = None) -> list[SearchKey]:
+        """Return `(score, product_id)` of matching products, best match
+        (lowest score) first. Every query token must match the start of a
+        word in the product. `after` continues the ranking after a
+        previously returned key (keyset pagination)."""
+
+    @abstractmethod
+    def rebuild(self, db: Session) -> None:
+        """Re-index every product from the products table."""
+
+    @abstractmethod
+    def suspend(self, db: Session) -> None:
+        """Stop indexing product writes ahead of a bulk load, in the caller's
+        transaction; `resume` then indexes everything once."""
+
+    @abstractmethod
+    def resume(self, db: Session) -> None:
+        """Index what was written since `suspend` and follow writes again."""
+
+
+class Fts5Search(SearchBackend):
+    """SQLite FTS5 index over name/description/category.
+
+    `products_fts` is an external-content table: it stores only the index and
+    is kept in sync with `products` by triggers, so every write path (ORM,
+    bulk statements, raw SQL) updates it. Stock updates don't touch the
+    indexed columns and don't fire the update trigger."""
+
+    DDL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "name, description, category, content='products', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts(rowid, name, description, category) "
+        "VALUES (new.id, new.name, new.description, new.category); END",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description, category) "
+        "VALUES ('delete', old.id, old.name, old.description, old.category); END",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description, category) "
+        "VALUES ('delete', old.id, old.name, old.description, old.category); "
+        "INSERT INTO products_fts(rowid, name, description, category) "
+        "VALUES (new.id, new.name, new.description, new.category); END",
+    ]
+
+    TRIGGERS = ("products_fts_ai", "products_fts_ad", "products_fts_au")
+
+    @classmethod
+    def create(cls, connection: Connection) -> bool:
+        """Create the index and its triggers; returns True if it was missing."""
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        ).first()
+        for statement in cls.DDL:
+            connection.exec_driver_sql(statement)
+        return exists is None
+
+    def search(self, db: Session, query: str, limit: int, offset: int = 0,
+               after: Optional[SearchKey] = None) -> list[SearchKey]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = " ".join(f'"{token}"*' for token in tokens)
+        weights = ", ".join(str(weight) for weight in FIELD_WEIGHTS.values())
+        params = {"match": match, "limit": limit, "offset": offset}
+        keyset = ""
+        if after is not None:
+            keyset = "WHERE score > :score OR (score = :score AND id > :id)"
+            params.update(score=after[0], id=after[1])
+        rows = db.execute(
+            text(
+                f"SELECT score, id FROM (SELECT bm25(products_fts, {weights}) AS score, rowid AS id "
+                f"FROM products_fts WHERE products_fts MATCH :match) {keyset} "
+                "ORDER BY score, id LIMIT :limit OFFSET :offset"
+            ),
+            params
+        )
+        return [(row.score, row.id) for row in rows]
+
+    def rebuild(self, db: Session) -> None:
+        db.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+    def suspend(self, db: Session) -> None:
+        # Without the triggers a bulk load writes only the products table
+        for trigger in self.TRIGGERS:
+            db.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+
+    def resume(self, db: Session) -> None:
+        for statement in self.DDL:
+            db.execute(text(statement))
+        self.rebuild(db)
+
+
+class InvertedIndex(SearchBackend):
+    """In-process inverted index for databases without FTS5.
+
+    Built from the products table on first use, rebuilt once it is
+    `max_age` seconds old, and in between kept up to date with the `Product`
+    changes this process commits (see `_apply_product_changes`). Writes that
+    bypass the ORM or come from other processes show up at the next rebuild."""
+
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self._documents: dict[int, list[str]] = {}
+        self._terms: list[str] = []
+        self._lock = threading.Lock()
+        self._built_at = 0.0
+        self.ready = False
+
+    def _add(self, product_id: int, fields: dict) -> None:
+        self._remove(product_id)
+        terms = []
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(fields.get(field)):
+                postings = self._postings[token]
+                if not postings:
+                    bisect.insort(self._terms, token)
+                postings[product_id] = postings.get(product_id, 0.0) + weight
+                terms.append(token)
+        self._documents[product_id] = terms
+
+    def _remove(self, product_id: int) -> None:
+        for token in set(self._documents.pop(product_id, ())):
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._terms[bisect.bisect_left(self._terms, token)]
+
+    def add(self, product: Product) -> None:
+        with self._lock:
+            self._add(product.id, {field: getattr(product, field) for field in FIELD_WEIGHTS})
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            self._remove(product_id)
+
+    def apply(self, changes: dict[int, Optional[dict]]) -> None:
+        """Index committed changes: `{product_id: fields}`, None for deleted."""
+        with self._lock:
+            for product_id, fields in changes.items():
+                if fields is None:
+                    self._remove(product_id)
+                else:
+                    self._add(product_id, fields)
+
+    def _prefix_scores(self, prefix: str) -> dict[int, float]:
+        scores: dict[int, float] = defaultdict(float)
+        position = bisect.bisect_left(self._terms, prefix)
+        while position < len(self._terms) and self._terms[position].startswith(prefix):
+            for product_id, weight in self._postings[self._terms[position]].items():
+                scores[product_id] += weight
+            position += 1
+        return scores
+
+    def search(self, db: Session, query: str, limit: int, offset: int = 0,
+               after: Optional[SearchKey] = None) -> list[SearchKey]:
+        if not self.ready or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild(db)
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            scores = self._prefix_scores(tokens[0])
+            for token in tokens[1:]:
+                matches = self._prefix_scores(token)
+                scores = {product_id: score + matches[product_id] for product_id, score in scores.items() if product_id in matches}
+        ranked = sorted((-score, product_id) for product_id, score in scores.items())
+        if after is not None:
+            ranked = ranked[bisect.bisect_right(ranked, tuple(after)):]
+        return ranked[offset:offset + limit]
+
+    def rebuild(self, db: Session) -> None:
+        columns = [getattr(Product, field) for field in FIELD_WEIGHTS]
+        rows = db.execute(select(Product.id, *columns)).all()
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._terms.clear()
+            for row in rows:
+                self._add(row.id, row._mapping)
+            self._built_at = time.monotonic()
+            self.ready = True
+
+    def suspend(self, db: Session) -> None:
+        pass  # Bulk loads bypass the ORM, so the index doesn't follow them anyway
+
+    def resume(self, db: Session) -> None:
+        # Rebuilt from the table on next use
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._terms.clear()
+            self.ready = False
+
+
+fts5_search = Fts5Search()
+inverted_index = InvertedIndex()
+
+
+def uses_fts5(bind) -> bool:
+    return bind.dialect.name == "sqlite" and fts5_available()
+
+
+def get_search_backend(db: Session) -> SearchBackend:
+    return fts5_search if uses_fts5(db.get_bind()) else inverted_index
+
+
+@event.listens_for(Product.__table__, "after_create")
+def _create_fts_index(target, connection, **kw):
+    if uses_fts5(connection):
+        Fts5Search.create(connection)
+
+
+@event.listens_for(Product.__table__, "before_drop")
+def _drop_fts_index(target, connection, **kw):
+    if uses_fts5(connection):
+        connection.exec_driver_sql("DROP TABLE IF EXISTS products_fts")
+
+
+# The in-process index follows ORM changes to products once they are
+# committed: flushes collect them on the session, a commit applies them and
+# a rollback discards them.
+_CHANGES = "search_changes"
+# Set when part of the transaction was rolled back to a savepoint, after
+# which the collected values may not be what gets committed
+_STALE = "search_changes_stale"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_product_changes(session, flush_context):
+    for product in session.new | session.dirty:
+        if isinstance(product, Product):
+            fields = {field: getattr(product, field) for field in FIELD_WEIGHTS}
+            session.info.setdefault(_CHANGES, {})[product.id] = fields
+    for product in session.deleted:
+        if isinstance(product, Product):
+            session.info.setdefault(_CHANGES, {})[product.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_product_changes(session):
+    changes = session.info.pop(_CHANGES, None)
+    stale = session.info.pop(_STALE, False)
+    if changes is None or not inverted_index.ready:
+        return
+    if stale:
+        # Rebuilt from the database on the next search
+        inverted_index.clear()
+    else:
+        inverted_index.apply(changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _mark_product_changes_stale(session, previous_transaction):
+    if previous_transaction.nested and _CHANGES in session.info:
+        session.info[_STALE] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_product_changes(session, transaction):
+    # Runs after after_commit; otherwise the transaction was rolled back or
+    # the session closed
+    if transaction.parent is None:
+        session.info.pop(_CHANGES, None)
+        session.info.pop(_STALE, None)
@@ -1,10 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 from passlib.context import CryptContext
 
+from config import settings
+
+# Argon2 cost parameters. Changing any of them makes existing hashes
+# "need update"; they are transparently re-hashed on the next login.
+ARGON2_TIME_COST = settings.argon2_time_cost
+ARGON2_MEMORY_COST = settings.argon2_memory_cost  # KiB
+ARGON2_PARALLELISM = settings.argon2_parallelism
+
+# argon2-cffi releases the GIL while hashing, so a thread pool is enough to
+# use every core. The pool is bounded to cap the memory used by concurrent
+# hashes (each one allocates ARGON2_MEMORY_COST KiB).
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 
 def hash_password(password: str):
-    pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password) -> tuple[bool, Optional[str]]:
+    """Verify a password and return `(valid, new_hash)`.
+
+    `new_hash` is only set when the stored hash was made with outdated cost
+    parameters and should be written back to the user row."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password, hashed_password) -> tuple[bool, Optional[str]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_and_update_password, plain_password, hashed_password)
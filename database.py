@@ -1,38 +1,168 @@
 """Database setup using SQLAlchemy.
 
-Creates an engine, session factory and a declarative base. Call
-`init_db()` to create tables from ORM models.
+Creates sync and async engines, session factories and a declarative base.
+Call `init_db()` to bring the schema up to date (see `migrations/`).
+
+Reads that tolerate replication lag can go to read replicas through
+`get_read_db`; everything else uses the primary through `get_async_db`.
 """
-import os
+import random
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from fastapi import Depends, Request, Response
+from typing import AsyncGenerator, Generator
+
+from config import Settings, settings
+
+DATABASE_URL = settings.database_url
+
+# Async drivers used when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+def to_async_url(url: str) -> URL:
+	"""Swap the driver of a sync database URL for its asyncio counterpart."""
+	url = make_url(url)
+	backend = url.get_backend_name()
+	if backend not in ASYNC_DRIVERS:
+		raise ValueError(f"No async driver known for {backend!r}; set ASYNC_DATABASE_URL")
+	return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def _engine_options(url: URL, config: Settings) -> dict:
+	if url.get_backend_name() != "sqlite":
+		return {
+			"echo": config.database_echo,
+			"pool_size": config.db_pool_size,
+			"max_overflow": config.db_max_overflow,
+			"pool_timeout": config.db_pool_timeout,
+			"pool_recycle": config.db_pool_recycle,
+			"pool_pre_ping": config.db_pool_pre_ping,
+		}
+	# SQLite needs check_same_thread=False for use with multiple threads
+	return {
+		"echo": config.database_echo,
+		"connect_args": {"check_same_thread": False, "timeout": config.sqlite_busy_timeout_ms / 1000},
+	}
+
+
+def _apply_sqlite_profile(engine: Engine, url: URL, config: Settings) -> None:
+	in_memory = url.database in (None, "", ":memory:")
+
+	@event.listens_for(engine, "connect")
+	def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		if not in_memory:
+			cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+			cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size)}")
+		cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+		cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout_ms)}")
+		cursor.execute(f"PRAGMA cache_size=-{int(config.sqlite_cache_size_kib)}")
+		cursor.close()
+
+
+def _enable_sqlite_savepoints(engine: Engine) -> None:
+	# pysqlite opens transactions lazily and commits on RELEASE of an
+	# outermost SAVEPOINT; let SQLAlchemy emit BEGIN itself instead. IMMEDIATE
+	# takes the write lock up front (waiting out busy_timeout), since a read
+	# transaction cannot be upgraded once another connection has written.
+	@event.listens_for(engine, "connect")
+	def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+		dbapi_connection.isolation_level = None
+
+	@event.listens_for(engine, "begin")
+	def _begin(connection):
+		connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_db_engine(url: str, config: Settings = settings, savepoints: bool = False) -> Engine:
+	"""Create an engine tuned for the backend `url` points at.
+
+	SQLite connections get the pragmas from the `sqlite_*` settings (WAL,
+	synchronous, mmap, busy timeout) applied as soon as they are opened;
+	other backends get a sized, pre-pinged and recycled connection pool.
+	`savepoints` makes SAVEPOINTs (`Session.begin_nested`) work on SQLite."""
+	url = make_url(url)
+	engine = create_engine(url, **_engine_options(url, config))
+	if url.get_backend_name() == "sqlite":
+		_apply_sqlite_profile(engine, url, config)
+		if savepoints:
+			_enable_sqlite_savepoints(engine)
+	return engine
+
+
+def create_async_db_engine(url: str, config: Settings = settings, **options) -> AsyncEngine:
+	"""Async counterpart of `create_db_engine`, with the same profiles."""
+	url = make_url(url)
+	engine = create_async_engine(url, **{**_engine_options(url, config), **options})
+	if url.get_backend_name() == "sqlite":
+		_apply_sqlite_profile(engine.sync_engine, url, config)
+	return engine
+
+
+class RoutingSession(Session):
+	"""Session that sends plain reads to a read replica.
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import Generator
+	The replica is picked per session by `get_read_db` and stored in
+	`info["replica"]`; without one this is an ordinary Session. Flushes,
+	INSERT/UPDATE/DELETE and SELECT ... FOR UPDATE always go to the primary."""
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./db.sqlite3")
+	def get_bind(self, mapper=None, clause=None, **kw):
+		replica = self.info.get("replica")
+		if replica is not None and not self._flushing and not _is_write(clause):
+			return replica
+		return super().get_bind(mapper, clause=clause, **kw)
 
-# SQLite needs check_same_thread=False for use with multiple threads
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+def _is_write(clause) -> bool:
+	return isinstance(clause, UpdateBase) or getattr(clause, "_for_update_arg", None) is not None
+
+
+engine = create_db_engine(DATABASE_URL)
+# Used by the checkout group committer, which needs SAVEPOINTs
+writer_engine = create_db_engine(DATABASE_URL, savepoints=True) if engine.dialect.name == "sqlite" else engine
+async_engine = create_async_db_engine(settings.async_database_url or to_async_url(DATABASE_URL))
+
+READ_REPLICA_URLS = [url.strip() for url in settings.read_replica_urls.split(",") if url.strip()]
+read_engines = [create_async_db_engine(to_async_url(url)) for url in READ_REPLICA_URLS]
+
+# Cookie holding the time until which the client's reads stay on the primary
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+READ_YOUR_WRITES_SECONDS = settings.read_your_writes_seconds
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+	async_engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
 
 
+def utcnow() -> datetime:
+	"""Naive UTC, matching how SQLite stores DateTime columns."""
+	return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 def init_db():
-	"""Import all modules that define models so they are registered with
-	`Base`, then create all tables."""
-	# Import models so they are registered on Base.metadata
-	try:
-		import models.users  # noqa: F401
-		import models.products  # noqa: F401
-	except Exception:
-		# If imports fail, continue silently — errors will surface when models are used
-		pass
+	"""Register every model with `Base` and apply pending schema migrations.
+
+	A database that is already current costs a single query."""
+	import models.users  # noqa: F401
+	import models.products  # noqa: F401
+	import models.order  # noqa: F401
+	import models.sessions  # noqa: F401
+	import models.reservations  # noqa: F401
+	import migrations
 
-	Base.metadata.create_all(bind=engine)
+	migrations.migrate(engine)
 
 
 def get_db() -> Generator:
@@ -51,3 +181,40 @@ def get_db() -> Generator:
 	finally:
 		db.close()
 
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+	"""Yield an AsyncSession for `async def` endpoints.
+
+	Queries are awaited so the event loop keeps serving other requests while
+	the database works. Synchronous helpers can still be reused through
+	`await db.run_sync(helper, ...)`.
+	"""
+	async with AsyncSessionLocal() as db:
+		yield db
+
+
+def pin_reads_to_primary(response: Response, seconds: float = READ_YOUR_WRITES_SECONDS) -> None:
+	"""Call after a write: the client's next reads skip the replicas for
+	`seconds`, so it sees its own change however far they lag."""
+	until = time.time() + seconds
+	response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{until:.3f}", max_age=max(1, round(seconds)), httponly=True, samesite="lax")
+
+
+def reads_pinned_to_primary(request: Request) -> bool:
+	try:
+		return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+	except ValueError:
+		return False
+
+
+def read_from_primary(db: AsyncSession) -> None:
+	"""Send the rest of a `get_read_db` session's reads to the primary."""
+	db.sync_session.info.pop("replica", None)
+
+
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_async_db)) -> AsyncGenerator[AsyncSession, None]:
+	"""Like `get_async_db`, but queries go to a random read replica unless
+	the client wrote something in the last READ_YOUR_WRITES_SECONDS."""
+	if read_engines and not reads_pinned_to_primary(request):
+		db.sync_session.info["replica"] = random.choice(read_engines).sync_engine
+	yield db
@@ -1,35 +1,99 @@
-from fastapi import FastAPI, Request
+import hashlib
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Request, Response, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 import database
-from routers import users, order, products
-import time
+import auth
+import assets
+from controller import catalog_version, group_commit, reservations
+from config import settings
+from controller.catalog import CachedResponse, etag_matches
+from routers import users, order, products, images
+
+# Inline the first page of the catalog into the home page, so products show
+# without a second request
+INLINE_CATALOG = settings.inline_catalog
+# Stands in for the catalog JSON in the cached home page shell
+CATALOG_MARKER = "__INLINE_CATALOG__"
 
 app = FastAPI()
 
 
+# Before the /images mount, so resizing requests reach it
+app.include_router(images.images_router)
 app.mount("/css", StaticFiles(directory="views/css"), name="css")
 app.mount("/js", StaticFiles(directory="views/js"), name="js")
 app.mount("/style", StaticFiles(directory="views/style"), name="style")
 app.mount("/images", StaticFiles(directory="views/images"), name="images")
 app.mount("/webfonts", StaticFiles(directory="views/webfonts"), name="webfonts")
+# Hashed copies from `python -m assets`, linked by the templates' asset_url()
+if assets.manifest:
+    app.mount(assets.ASSETS_URL, assets.PrecompressedStaticFiles(directory=f"{assets.BUILD_DIR}/assets"), name="assets")
 
 @app.on_event("startup")
 def on_startup():
     database.init_db()
+    auth.sweeper.start()
+    reservations.sweeper.start()
+    catalog_version.watcher.start()
+    if group_commit.committer is not None:
+        group_commit.committer.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # stop() joins the worker threads; wait for them off the event loop
+    await run_in_threadpool(auth.sweeper.stop)
+    await run_in_threadpool(reservations.sweeper.stop)
+    await run_in_threadpool(catalog_version.watcher.stop)
+    if group_commit.committer is not None:
+        await run_in_threadpool(group_commit.committer.stop)
+    await database.async_engine.dispose()
 
 templates = Jinja2Templates(directory="views")
+templates.env.globals["asset_url"] = assets.asset_url
+
+@lru_cache(maxsize=None)
+def render_page(name: str, inline_catalog: bool = False) -> tuple[bytes, str]:
+    """Render a page shell once per process. Pages have no per-request
+    content, and their asset links only change with a new build (which
+    needs a restart), so the ETag changes exactly when the page does. With
+    `inline_catalog` the shell holds CATALOG_MARKER where the catalog goes."""
+    body = templates.get_template(name).render(catalog_json=CATALOG_MARKER if inline_catalog else None).encode()
+    return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+def page_response(request: Request, name: str, catalog: Optional[CachedResponse] = None) -> Response:
+    """A cached page, optionally with a catalog response inlined; the page's
+    ETag then covers both."""
+    body, etag = render_page(name, catalog is not None)
+    if catalog is not None:
+        etag = f'"{hashlib.sha1((etag + catalog.etag).encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if catalog is not None:
+        # "<" can only occur inside JSON strings, where \u003c means the same
+        # and cannot end (or confuse) the <script> element
+        body = body.replace(CATALOG_MARKER.encode(), catalog.body.replace(b"<", b"\\u003c"), 1)
+    return Response(content=body, media_type="text/html", headers=headers)
 
 @app.get("/")
-async def read_root(request: Request):
-    return templates.TemplateResponse("Web.html", {"request": request, "timestamp": int(time.time())})
+async def read_root(request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    if not INLINE_CATALOG:
+        return page_response(request, "Web.html")
+    catalog = await products.grouped_catalog(db, fresh=database.reads_pinned_to_primary(request))
+    return page_response(request, "Web.html", catalog)
 
 @app.get("/Register")
 async def read_registration(request: Request):
-    return templates.TemplateResponse("RegistrationForm.html", {"request": request})
+    return page_response(request, "RegistrationForm.html")
 @app.get("/FQA")
-async def read_registration(request: Request):
-    return templates.TemplateResponse("FQA.html", {"request": request})
+async def read_fqa(request: Request):
+    return page_response(request, "FQA.html")
 
 app.include_router(users.users_router)
 app.include_router(order.order_router)
@@ -0,0 +1,102 @@
+"""Versioned schema migrations.
+
+Every `vNNNN_<name>.py` module in this package is one migration with an
+`upgrade(connection)` function; they are applied in version order and
+recorded in the `schema_migrations` table, so each runs once per database.
+A module can set `TRANSACTIONAL = False` to run in autocommit mode, which
+online index builds (CREATE INDEX CONCURRENTLY) require.
+
+`migrate` is called by `database.init_db` on every startup. When the
+database is current it costs one query.
+"""
+import importlib
+import pkgutil
+import re
+from datetime import datetime, timezone
+from types import ModuleType
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+_VERSION_RE = re.compile(r"^v(\d{4})_\w+$")
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", metadata,
+    Column("version", String(4), primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def discover() -> list[tuple[str, ModuleType]]:
+    """All migrations in this package as `(version, module)`, oldest first."""
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        match = _VERSION_RE.match(module.name)
+        if match:
+            found.append((match.group(1), importlib.import_module(f"{__name__}.{module.name}")))
+    found.sort(key=lambda migration: migration[0])
+    versions = [version for version, _ in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions in {__name__}: {versions}")
+    return found
+
+
+MIGRATIONS = discover()
+
+
+def applied_versions(connection: Connection) -> set[str]:
+    try:
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+    except (OperationalError, ProgrammingError):
+        # No version table yet: nothing has been applied
+        connection.rollback()
+        return set()
+
+
+def pending(engine: Engine) -> list[tuple[str, ModuleType]]:
+    with engine.connect() as connection:
+        applied = applied_versions(connection)
+    return [(version, module) for version, module in MIGRATIONS if version not in applied]
+
+
+def _record(connection: Connection, version: str, module: ModuleType) -> None:
+    connection.execute(insert(schema_migrations).values(
+        version=version,
+        name=module.__name__.rsplit(".", 1)[-1],
+        applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+    ))
+
+
+def migrate(engine: Engine) -> list[str]:
+    """Apply pending migrations; returns the versions applied."""
+    todo = pending(engine)
+    if not todo:
+        return []
+
+    with engine.begin() as connection:
+        metadata.create_all(connection, checkfirst=True)
+
+    applied = []
+    for version, module in todo:
+        if getattr(module, "TRANSACTIONAL", True):
+            try:
+                with engine.begin() as connection:
+                    module.upgrade(connection)
+                    _record(connection, version, module)
+            except IntegrityError:
+                # Another worker applied it concurrently; its changes stand
+                continue
+        else:
+            with engine.connect() as connection:
+                module.upgrade(connection.execution_options(isolation_level="AUTOCOMMIT"))
+            try:
+                with engine.begin() as connection:
+                    _record(connection, version, module)
+            except IntegrityError:
+                continue
+        applied.append(version)
+    return applied
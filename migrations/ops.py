@@ -0,0 +1,77 @@
+"""Building blocks for migration scripts.
+
+Helpers check the current schema before changing it, so a script stays
+correct on databases that already have part of the change (for example
+ones created with `Base.metadata.create_all`)."""
+from sqlalchemy import Column, inspect
+from sqlalchemy.engine import Connection
+
+
+def create_index(connection: Connection, name: str, table: str, columns: list[str], unique: bool = False) -> bool:
+    """Create an index unless it already exists; returns True if created.
+
+    The build is done online where the database supports it: CONCURRENTLY
+    on PostgreSQL (the migration must set `TRANSACTIONAL = False`) and
+    LOCK=NONE on MySQL, so writes to `table` continue meanwhile. SQLite
+    has no online build; its index builds hold the write lock briefly."""
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return False
+    if name in {index["name"] for index in inspector.get_indexes(table)}:
+        return False
+
+    dialect = connection.dialect.name
+    quote = connection.dialect.identifier_preparer.quote
+    online = ""
+    if dialect == "postgresql" and connection.get_isolation_level() == "AUTOCOMMIT":
+        online = "CONCURRENTLY "
+    suffix = " ALGORITHM=INPLACE LOCK=NONE" if dialect in ("mysql", "mariadb") else ""
+    connection.exec_driver_sql(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {online}{quote(name)} "
+        f"ON {quote(table)} ({', '.join(quote(column) for column in columns)}){suffix}"
+    )
+    return True
+
+
+def drop_index(connection: Connection, name: str, table: str) -> bool:
+    """Drop an index if it exists; returns True if dropped. Like
+    `create_index`, CONCURRENTLY on PostgreSQL in autocommit mode."""
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return False
+    if name not in {index["name"] for index in inspector.get_indexes(table)}:
+        return False
+
+    dialect = connection.dialect.name
+    quote = connection.dialect.identifier_preparer.quote
+    if dialect in ("mysql", "mariadb"):
+        connection.exec_driver_sql(f"DROP INDEX {quote(name)} ON {quote(table)}")
+        return True
+    online = ""
+    if dialect == "postgresql" and connection.get_isolation_level() == "AUTOCOMMIT":
+        online = "CONCURRENTLY "
+    connection.exec_driver_sql(f"DROP INDEX {online}{quote(name)}")
+    return True
+
+
+def add_column(connection: Connection, table: str, column: Column) -> bool:
+    """Add `column` to `table` unless it is already there; returns True if
+    added. The column must be nullable (or have a server default) so that
+    existing rows stay valid; a server default and NOT NULL are carried
+    over."""
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return False
+    if column.name in {existing["name"] for existing in inspector.get_columns(table)}:
+        return False
+
+    quote = connection.dialect.identifier_preparer.quote
+    column_type = column.type.compile(dialect=connection.dialect)
+    if column.server_default is not None:
+        default = column.server_default.arg
+        default = default.text if hasattr(default, "text") else "'" + default.replace("'", "''") + "'"
+        column_type += f" DEFAULT {default}"
+    if not column.nullable:
+        column_type += " NOT NULL"
+    connection.exec_driver_sql(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column.name)} {column_type}")
+    return True
@@ -0,0 +1,55 @@
+"""The schema as first shipped: users, products and orders.
+
+Tables are defined here rather than taken from the models, so this script
+keeps creating the same schema however the models change later. Tables
+that already exist (databases created with `create_all`) are left alone.
+"""
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, String, Table, Text
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("first_name", String),
+    Column("last_name", String),
+    Column("dob", String),
+    Column("email", String),
+    Column("password", String),
+    Column("sex", String),
+    Column("phone", String),
+    Column("country", String),
+)
+
+Table(
+    "products", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(100), index=True, nullable=False),
+    Column("description", Text, nullable=True),
+    Column("price", Float, nullable=False),
+    Column("image_url", String(255), nullable=False),
+    Column("category", String(50), nullable=False),
+    Column("stock_avilabilty", Integer, nullable=False),
+)
+
+Table(
+    "order_details", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("total_price", Float, default=0),
+)
+
+Table(
+    "order_items", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_details_id", Integer, ForeignKey("order_details.id")),
+    Column("product_id", Integer, ForeignKey("products.id")),
+    Column("product_name", String),
+    Column("price", Float),
+    Column("quantity", Integer),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,33 @@
+"""Indexes for the columns looked up on every login, registration and order
+listing, plus the foreign keys of the order tables."""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from migrations.ops import create_index
+
+# Lets PostgreSQL build the indexes without blocking writes
+TRANSACTIONAL = False
+
+INDEXES = [
+    # (name, table, columns, unique)
+    ("ix_users_email", "users", ["email"], True),
+    ("ix_order_details_user_id", "order_details", ["user_id"], False),
+    ("ix_order_items_order_details_id", "order_items", ["order_details_id"], False),
+    ("ix_order_items_product_id", "order_items", ["product_id"], False),
+    ("ix_products_category_id", "products", ["category", "id"], False),
+]
+
+
+def upgrade(connection: Connection) -> None:
+    if connection.dialect.has_table(connection, "users"):
+        duplicates = connection.execute(text(
+            "SELECT email FROM users WHERE email IS NOT NULL GROUP BY email HAVING COUNT(*) > 1"
+        )).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                f"Cannot add a unique index on users.email: {len(duplicates)} emails are registered "
+                f"more than once (e.g. {duplicates[0]!r}). Merge or remove the duplicate accounts first."
+            )
+
+    for name, table, columns, unique in INDEXES:
+        create_index(connection, name, table, columns, unique)
@@ -0,0 +1,16 @@
+"""Server-side sessions shared by all workers (SESSION_BACKEND=database)."""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table(
+    "sessions", metadata,
+    Column("token_hash", String(64), primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("expires_at", DateTime, nullable=False, index=True),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.create_all(connection, checkfirst=True)
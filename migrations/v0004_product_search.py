@@ -0,0 +1,48 @@
+"""Full-text index behind /products/search (SQLite with FTS5 only; other
+databases use the in-process index and need no schema).
+
+The DDL is spelled out here rather than taken from controller/search.py,
+so this script keeps creating the same index however the app code changes
+later."""
+import sqlite3
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, category, content='products', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, category ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description, category) "
+    "VALUES ('delete', old.id, old.name, old.description, old.category); "
+    "INSERT INTO products_fts(rowid, name, description, category) "
+    "VALUES (new.id, new.name, new.description, new.category); END",
+]
+
+
+def fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(value)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def upgrade(connection: Connection) -> None:
+    if connection.dialect.name != "sqlite" or not fts5_available():
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    ).first()
+    for statement in DDL:
+        connection.exec_driver_sql(statement)
+    if exists is None:
+        # Index the products that existed before the triggers did
+        connection.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
@@ -0,0 +1,15 @@
+"""Order timestamps and item counts, so order history can be listed without
+touching order_items. Existing orders are backfilled from their items."""
+from sqlalchemy import Column, DateTime, Integer, text
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+
+def upgrade(connection: Connection) -> None:
+    add_column(connection, "order_details", Column("created_at", DateTime, nullable=True))
+    if add_column(connection, "order_details", Column("item_count", Integer, nullable=True)):
+        connection.execute(text(
+            "UPDATE order_details SET item_count = COALESCE("
+            "(SELECT SUM(quantity) FROM order_items WHERE order_items.order_details_id = order_details.id), 0)"
+        ))
@@ -0,0 +1,13 @@
+"""Idempotency-Key of the checkout that created each order."""
+from sqlalchemy import Column, String
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column, create_index
+
+TRANSACTIONAL = False
+
+
+def upgrade(connection: Connection) -> None:
+    add_column(connection, "order_details", Column("idempotency_key", String(64), nullable=True))
+    create_index(connection, "ux_order_details_user_id_idempotency_key", "order_details",
+                 ["user_id", "idempotency_key"], unique=True)
@@ -0,0 +1,23 @@
+"""Time-limited stock holds taken by carts before checkout."""
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table("users", metadata, Column("id", Integer, primary_key=True))
+Table("products", metadata, Column("id", Integer, primary_key=True))
+
+Table(
+    "stock_reservations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("expires_at", DateTime, nullable=False, index=True),
+    Index("ux_stock_reservations_user_id_product_id", "user_id", "product_id", unique=True),
+    Index("ix_stock_reservations_product_id_expires_at", "product_id", "expires_at"),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.tables["stock_reservations"].create(connection, checkfirst=True)
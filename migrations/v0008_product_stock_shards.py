@@ -0,0 +1,18 @@
+"""Optional per-product stock counters for hot products."""
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+from sqlalchemy.engine import Connection
+
+metadata = MetaData()
+
+Table("products", metadata, Column("id", Integer, primary_key=True))
+
+Table(
+    "product_stock_shards", metadata,
+    Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+    Column("shard", Integer, primary_key=True),
+    Column("quantity", Integer, nullable=False),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    metadata.tables["product_stock_shards"].create(connection, checkfirst=True)
@@ -0,0 +1,12 @@
+"""What a checkout replay needs beyond the order itself: the fingerprint of
+the request that used the Idempotency-Key, and the price changes reported
+to the client."""
+from sqlalchemy import JSON, Column, String
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+
+def upgrade(connection: Connection) -> None:
+    add_column(connection, "order_details", Column("request_hash", String(64), nullable=True))
+    add_column(connection, "order_details", Column("price_changes", JSON, nullable=True))
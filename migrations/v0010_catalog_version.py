@@ -0,0 +1,38 @@
+"""A catalog version row, bumped by bulk imports, that servers poll to drop
+their cached catalog data; and a unique index on product names, which
+imports match products by."""
+from sqlalchemy import Column, Integer, MetaData, Table, insert, select, text
+from sqlalchemy.engine import Connection
+
+from migrations.ops import create_index, drop_index
+
+# Lets PostgreSQL build the index without blocking writes
+TRANSACTIONAL = False
+
+metadata = MetaData()
+
+catalog_version = Table(
+    "catalog_version", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+def upgrade(connection: Connection) -> None:
+    catalog_version.create(connection, checkfirst=True)
+    if connection.execute(select(catalog_version.c.id)).first() is None:
+        connection.execute(insert(catalog_version).values(id=1, version=0))
+
+    if connection.dialect.has_table(connection, "products"):
+        duplicates = connection.execute(text(
+            "SELECT name FROM products GROUP BY name HAVING COUNT(*) > 1"
+        )).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                f"Cannot add a unique index on products.name: {len(duplicates)} names are used by more "
+                f"than one product (e.g. {duplicates[0]!r}). Rename or merge the duplicates first."
+            )
+
+    create_index(connection, "ux_products_name", "products", ["name"], unique=True)
+    # The unique index serves every lookup the plain one did
+    drop_index(connection, "ix_products_name", "products")
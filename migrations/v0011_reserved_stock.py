@@ -0,0 +1,15 @@
+"""Stock held by carts, kept on the product row so a reservation can check
+and take it with one conditional UPDATE."""
+from sqlalchemy import Column, Integer, text
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+
+def upgrade(connection: Connection) -> None:
+    if add_column(connection, "products", Column("reserved", Integer, nullable=False, server_default="0")):
+        connection.execute(text(
+            "UPDATE products SET reserved = COALESCE(("
+            "SELECT SUM(quantity) FROM stock_reservations WHERE stock_reservations.product_id = products.id"
+            "), 0)"
+        ))
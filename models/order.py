@@ -1,25 +1,40 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import JSON, Column, DateTime, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
-from database import Base
+from database import Base, utcnow
 
 
 class OrderDetails(Base):
     __tablename__ = "order_details"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     total_price = Column(Float, default=0)
+    # Sum of the item quantities, stored at checkout for order listings
+    item_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=utcnow)
+    # Client-chosen Idempotency-Key of the checkout that created the order,
+    # and a hash of that request's cart, so a reused key can be told apart
+    # from a retry
+    idempotency_key = Column(String(64), nullable=True)
+    request_hash = Column(String(64), nullable=True)
+    # Cart lines whose client-side price was stale, as reported at checkout
+    price_changes = Column(JSON, nullable=True)
 
     # One order has many items
-    items = relationship("OrderItem", back_populates="order_details")
+    items = relationship("OrderItem", back_populates="order_details", order_by="OrderItem.id")
+
+    __table_args__ = (
+        # One order per key and user; NULL keys (no header) never collide
+        Index("ux_order_details_user_id_idempotency_key", "user_id", "idempotency_key", unique=True),
+    )
 
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_details_id = Column(Integer, ForeignKey("order_details.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    order_details_id = Column(Integer, ForeignKey("order_details.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     product_name = Column(String)
     price = Column(Float)
     quantity = Column(Integer)
@@ -1,13 +1,50 @@
-from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy import Column, ForeignKey, Integer, String, Float, Text, Index, event, insert
 from database import Base
 
 class Product(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), index=True, nullable=False)
+    name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False)
     image_url = Column(String(255), nullable=False) 
     category = Column(String(50), nullable=False)
-    stock_avilabilty = Column(Integer, nullable=False)
\ No newline at end of file
+    stock_avilabilty = Column(Integer, nullable=False)
+    # Sum of the stock_reservations rows on this product, expired ones
+    # included until they are swept (see controller/reservations.py)
+    reserved = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # Imports match products by name (see catalog_io.py)
+        Index("ux_products_name", "name", unique=True),
+        # Serves category lookups and the per-category top-N query behind
+        # /products/grouped
+        Index("ix_products_category_id", "category", "id"),
+    )
+
+
+class ProductStockShard(Base):
+    """One of K counters a hot product's stock is split into, so concurrent
+    buyers update different rows (see controller/inventory.py). A product
+    with shards keeps only a periodically synced total in stock_avilabilty."""
+    __tablename__ = "product_stock_shards"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+
+class CatalogVersion(Base):
+    """A single row whose `version` is bumped by catalog changes made outside
+    the servers (bulk imports), so each server process knows to drop its
+    cached catalog data (see controller/catalog_version.py)."""
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+@event.listens_for(CatalogVersion.__table__, "after_create")
+def _insert_catalog_version(target, connection, **kw):
+    connection.execute(insert(target).values(id=1, version=0))
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer
+from database import Base
+
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # Held stock is given back once this passes (see controller/reservations.py)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        # One hold per cart line; also serves the per-user lookups
+        Index("ux_stock_reservations_user_id_product_id", "user_id", "product_id", unique=True),
+        # Sum of active holds per product
+        Index("ix_stock_reservations_product_id_expires_at", "product_id", "expires_at"),
+    )
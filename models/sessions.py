@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from database import Base
+
+
+class UserSession(Base):
+    __tablename__ = "sessions"
+
+    # SHA-256 of the session token; the raw token only lives in the cookie
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -8,7 +8,7 @@ class User(Base):
     first_name = Column(String)
     last_name = Column(String)
     dob = Column(String)
-    email = Column(String)
+    email = Column(String, unique=True, index=True)  # looked up on every login
     password = Column(String)
     sex = Column(String)
     phone = Column(String)
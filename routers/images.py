@@ -0,0 +1,53 @@
+import os
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+
+from controller import images
+from controller.catalog import etag_matches
+
+images_router = APIRouter(tags=["images"])
+
+# Originals, with the same conditional-GET handling as the /images mount
+originals = StaticFiles(directory=images.IMAGE_DIR)
+
+VARIANT_CACHE_CONTROL = "public, max-age=86400"
+
+
+# Registered before the /images mount in main.py, which it takes over for
+# single-file paths
+@images_router.get("/images/{name}")
+async def get_image(
+    name: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    fmt: Optional[Literal["webp", "jpeg"]] = None
+):
+    """An image from views/images. With `w` and/or `fmt`, a copy scaled down
+    to (at least) `w` pixels wide, as WebP or JPEG; without `fmt` WebP is
+    used when the browser accepts it."""
+    if (w is None and fmt is None) or images.Image is None:
+        return await originals.get_response(name, request.scope)
+
+    source = os.path.join(images.IMAGE_DIR, name)
+    if os.path.basename(name) != name or not os.path.isfile(source):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {"Cache-Control": VARIANT_CACHE_CONTROL}
+    if fmt is None:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        headers["Vary"] = "Accept"
+    width = images.variant_width(w) if w is not None else images.IMAGE_WIDTHS[-1]
+
+    try:
+        path, key = await images.image_cache.get(source, width, fmt)
+    except OSError:
+        # Not an image Pillow can read (e.g. a corrupt upload)
+        raise HTTPException(status_code=415, detail="Image cannot be converted")
+
+    headers["ETag"] = f'"{key}"'
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=images.IMAGE_FORMATS[fmt], headers=headers)
@@ -1,22 +1,40 @@
-from fastapi import APIRouter, Depends, Request
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
-from models.order import OrderDetails, OrderItem
-from models.users import User
-from models.products import Product
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from database import get_async_db, get_read_db, pin_reads_to_primary
 from fastapi.responses import JSONResponse
 from fastapi import status, HTTPException
 import auth
+from controller.catalog import catalog_cache, price_cache
+from controller import group_commit, reservations
+from controller.inventory import stock_level
+from controller.orders import (
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    OrderError,
+    checkout_response,
+    idempotency_cache,
+    place_order,
+    preview_order,
+    request_hash,
+    serialize_order,
+)
+from models.order import OrderDetails
+from models.products import Product
 
 order_router = APIRouter(prefix="/order", tags=["order"])
 
 
 class OrderItemIn(BaseModel):
-    product_name: str
     product_id: int
-    price: float
-    quantity: int
+    quantity: int = Field(gt=0)
+    # What the client showed; the order always uses the current product row
+    product_name: Optional[str] = None
+    price: Optional[float] = None
 
 
 class CheckoutRequest(BaseModel):
@@ -24,54 +42,209 @@ class CheckoutRequest(BaseModel):
     items: list[OrderItemIn]
 
 
+class PreviewRequest(BaseModel):
+    items: list[OrderItemIn]
+
+
+class ReservationRequest(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+
+def serialize_reservation(hold) -> dict:
+    return {"product_id": hold.product_id, "quantity": hold.quantity, "expires_at": hold.expires_at.isoformat()}
+
+
+async def find_order_by_key(db: AsyncSession, user_id: int, idempotency_key: str) -> Optional[OrderDetails]:
+    return (await db.execute(
+        select(OrderDetails)
+        .where(OrderDetails.user_id == user_id, OrderDetails.idempotency_key == idempotency_key)
+        .options(selectinload(OrderDetails.items))
+    )).scalar_one_or_none()
+
+
+def replay(request_hash: str, original_hash: Optional[str], result: dict) -> JSONResponse:
+    # Orders placed before hashes were stored can't be compared
+    if original_hash is not None and original_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different checkout")
+    return JSONResponse(content=result, headers={"Idempotent-Replayed": "true"})
+
+
+async def place_checkout(db: AsyncSession, args: tuple) -> dict:
+    """Place an order (`place_order`'s arguments) and commit it, together
+    with other concurrent checkouts when group commit is on."""
+    if group_commit.committer is not None:
+        try:
+            return await group_commit.committer.run(*args)
+        except group_commit.CommitterStopped:
+            pass  # Shutting down; commit this one on its own
+    result = await db.run_sync(place_order, *args)
+    await db.commit()
+    return result
+
+
+async def find_replay(db: AsyncSession, user_id: int, idempotency_key: str) -> Optional[tuple[Optional[str], dict]]:
+    """`(request_hash, response)` of the checkout that used the key, if any."""
+    cache_key = (user_id, idempotency_key)
+    cached = idempotency_cache.get(cache_key)
+    if cached is None:
+        existing = await find_order_by_key(db, user_id, idempotency_key)
+        if existing is not None:
+            cached = (existing.request_hash, checkout_response(existing))
+            idempotency_cache.set(cache_key, *cached)
+    return cached
+
+
 @order_router.post("/checkout")
-def checkout(data: CheckoutRequest, request: Request, db: Session = Depends(get_db)):
+async def checkout(
+    data: CheckoutRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Place an order. With an `Idempotency-Key` header, repeating the
+    request (e.g. a client retry) returns the original response instead of
+    placing a new one; reusing the key for a different cart is a 422."""
     # Authenticate using session cookie (server-side)
     token = request.cookies.get("session_token")
-    user_id = auth.get_user_id_from_token(token)
+    user_id = await auth.get_user_id_from_token_async(token)
     if not user_id:
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "You must be logged in to checkout."})
 
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = request_hash(data.items)
+        previous = await find_replay(db, user_id, idempotency_key)
+        if previous is not None:
+            return replay(fingerprint, *previous)
+
     # Ignore client-supplied user_id; use authenticated user_id
-    new_order_detail = OrderDetails(user_id=user_id)
-    db.add(new_order_detail)
-    db.flush()  # <-- generates new_order_detail.id before adding items
-
-    total = 0
-
-    # 2. Add order items and update stock
-    for item in data.items:
-        # Check product stock
-        product = db.query(Product).filter(Product.id == item.product_id).with_for_update().first()
-        if not product:
-             raise HTTPException(status_code=404, detail=f"Product {item.product_name} not found")
-        
-        if product.stock_avilabilty < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product.name}. Available: {product.stock_avilabilty}")
-
-        # Deduct stock
-        product.stock_avilabilty -= item.quantity
-
-        order_item = OrderItem(
-            order_details_id=new_order_detail.id,
-            product_name=item.product_name,
-            product_id=item.product_id,
-            price=item.price,
-            quantity=item.quantity
+    args = (user_id, data.items, idempotency_key or None, fingerprint)
+    try:
+        result = await place_checkout(db, args)
+    except OrderError as exc:
+        await db.rollback()
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    except IntegrityError:
+        await db.rollback()
+        previous = await find_replay(db, user_id, idempotency_key) if idempotency_key else None
+        if previous is None:
+            raise
+        # A concurrent request with the same key placed the order first
+        return replay(fingerprint, *previous)
+
+    catalog_cache.invalidate()
+    price_cache.invalidate(item.product_id for item in data.items)
+    if idempotency_key:
+        idempotency_cache.set((user_id, idempotency_key), fingerprint, result)
+    # Let the client see its new order and stock levels on the next reads
+    pin_reads_to_primary(response)
+
+    return result
+
+
+@order_router.post("/preview")
+async def preview(data: PreviewRequest, db: AsyncSession = Depends(get_read_db)):
+    """Current names, prices and stock for a cart, plus the lines whose
+    client-side price is stale. Served from short-lived price snapshots, so
+    the frontend can refresh it freely; checkout re-checks everything."""
+    snapshots, missing = price_cache.get_many({item.product_id for item in data.items})
+    if missing:
+        rows = await db.execute(
+            select(Product.id, Product.name, Product.price, stock_level().label("stock"))
+            .where(Product.id.in_(missing))
         )
-        db.add(order_item)
-        total += item.price * item.quantity
-
-    # 3. Update total price
-    new_order_detail.total_price = total
-
-    db.commit()
-    db.refresh(new_order_detail)
-
-    # 4. Return response
-    return {
-        "message": "Checkout saved successfully",
-        "order_details_id": new_order_detail.id,
-        "total": total,
-        "items": [{"product_id": i.product_id, "product_name": i.product_name, "quantity": i.quantity, "price": i.price} for i in new_order_detail.items]
-    }
+        loaded = [dict(row) for row in rows.mappings()]
+        price_cache.put_many(loaded)
+        snapshots.update((snapshot["id"], snapshot) for snapshot in loaded)
+    return preview_order(data.items, snapshots)
+
+
+def not_logged_in(message: str = "You must be logged in to view orders.") -> JSONResponse:
+    return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": message})
+
+
+@order_router.post("/reservations")
+async def reserve_stock(data: ReservationRequest, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Hold stock for a cart line until checkout or RESERVATION_TTL_SECONDS
+    pass. Posting again for the same product changes the quantity and
+    restarts the timer."""
+    user_id = await auth.get_user_id_from_token_async(request.cookies.get("session_token"))
+    if not user_id:
+        return not_logged_in("You must be logged in to reserve stock.")
+
+    hold = await db.run_sync(reservations.reserve, user_id, data.product_id, data.quantity)
+    if hold is None:
+        raise HTTPException(status_code=409, detail="Not enough stock available")
+    return serialize_reservation(hold)
+
+
+@order_router.get("/reservations")
+async def list_reservations(request: Request, db: AsyncSession = Depends(get_async_db)):
+    user_id = await auth.get_user_id_from_token_async(request.cookies.get("session_token"))
+    if not user_id:
+        return not_logged_in()
+
+    holds = (await db.execute(reservations.user_holds(user_id))).scalars()
+    return [serialize_reservation(hold) for hold in holds]
+
+
+@order_router.delete("/reservations/{product_id}")
+async def release_stock(product_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user_id = await auth.get_user_id_from_token_async(request.cookies.get("session_token"))
+    if not user_id:
+        return not_logged_in()
+
+    if not await db.run_sync(reservations.release, user_id, product_id):
+        raise HTTPException(status_code=404, detail="No reservation for this product")
+    return {"message": "Reservation released"}
+
+
+# Registered before /{order_id} so "history" is not parsed as an order id
+@order_router.get("/history")
+async def order_history(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The user's orders with their items, newest first. Pass the
+    `X-Next-Cursor` header of a page as `before` to get the next one.
+    Always two queries: one for the orders, one for all of their items."""
+    user_id = await auth.get_user_id_from_token_async(request.cookies.get("session_token"))
+    if not user_id:
+        return not_logged_in()
+
+    query = (
+        select(OrderDetails)
+        .where(OrderDetails.user_id == user_id)
+        .options(selectinload(OrderDetails.items))
+        .order_by(OrderDetails.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        query = query.where(OrderDetails.id < before)
+    orders = (await db.execute(query)).scalars().all()
+
+    headers = {}
+    if len(orders) == limit:
+        headers["X-Next-Cursor"] = str(orders[-1].id)
+    return JSONResponse(content=[serialize_order(order) for order in orders], headers=headers)
+
+
+@order_router.get("/{order_id}")
+async def get_order(order_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    user_id = await auth.get_user_id_from_token_async(request.cookies.get("session_token"))
+    if not user_id:
+        return not_logged_in()
+
+    order = (await db.execute(
+        select(OrderDetails)
+        .where(OrderDetails.id == order_id, OrderDetails.user_id == user_id)
+        .options(selectinload(OrderDetails.items))
+    )).scalar_one_or_none()
+    if order is None:
+        # Other users' orders are reported as missing too
+        raise HTTPException(status_code=404, detail="Order not found")
+    return serialize_order(order)
@@ -1,11 +1,36 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
-from typing import Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from database import (
+    READ_YOUR_WRITES_SECONDS,
+    get_async_db,
+    get_read_db,
+    pin_reads_to_primary,
+    read_from_primary,
+    reads_pinned_to_primary,
+)
+from typing import Dict, List, Optional
+import json
 from models.products import Product
 from collections import defaultdict
+from controller.inventory import decrement_stock
+from controller.reservations import release_expired
+from controller.catalog import (
+    CachedResponse,
+    catalog_cache,
+    price_cache,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    parse_fields,
+    stream_json_array,
+)
+from controller.search import get_search_backend
+from controller.images import srcset
 
 products_router = APIRouter()
 
@@ -17,44 +42,193 @@ class ProductSchema(BaseModel):
     category: str
     description: str | None = None
     stock_avilabilty: int
+    # Resized variants of image_url for <img srcset>; None for external images
+    srcset: str | None = None
 
     class Config:
         from_attributes = True
 
 class PurchaseRequest(BaseModel):
-    quantity: int
+    quantity: int = Field(gt=0)
 
-@products_router.get("/products/grouped", response_model=Dict[str, List[ProductSchema]])
-def get_products(db: Session = Depends(get_db), limit: int = 20):
-    products = db.query(Product).all()
+# Columns that can be selected with `fields`; srcset is derived from image_url
+PRODUCT_FIELDS = [field for field in ProductSchema.model_fields if field != "srcset"]
+# Search pages larger than this are streamed to the client
+STREAM_THRESHOLD = 100
+
+def product_columns(fields: Optional[list[str]]) -> list:
+    return [getattr(Product, field) for field in (fields or PRODUCT_FIELDS)]
+
+def with_srcset(product: dict) -> dict:
+    if "image_url" in product:
+        product["srcset"] = srcset(product["image_url"])
+    return product
+
+def group_products(db: Session, limit: int, after: int = 0,
+                   category: Optional[str] = None, fields: Optional[list[str]] = None) -> dict:
+    # Walk the distinct categories with index seeks (a recursive "loose index
+    # scan"), then fetch the first `limit` ids of each from the
+    # (category, id) index. Cost depends on categories * limit, not on the
+    # size of the catalog.
+    categories = select(func.min(Product.category).label("category")).cte("categories", recursive=True)
+    following = aliased(Product)
+    categories = categories.union_all(
+        select(
+            select(func.min(following.category))
+            .where(following.category > categories.c.category)
+            .scalar_subquery()
+        ).where(categories.c.category.is_not(None))
+    )
+    first_ids = (
+        select(following.id)
+        .where(following.category == categories.c.category, following.id > after)
+        .order_by(following.id)
+        .limit(limit)
+    )
+    query = (
+        select(Product.category.label("_group"), *product_columns(fields))
+        .join(categories, Product.id.in_(first_ids))
+        .order_by(Product.id)
+    )
+    if category:
+        # Compared on the (few) distinct categories, not on every product
+        query = query.where(func.lower(categories.c.category) == category.lower())
+
+    # Categories differing only in case are merged, hence the second cap
     grouped_data = defaultdict(list)
-    for product in products:
-        category = product.category.capitalize() if product.category else "Other"
-        if len(grouped_data[category]) < limit:
-            grouped_data[category].append(product)
+    for row in db.execute(query).mappings():
+        product = with_srcset(dict(row))
+        group = product.pop("_group")
+        group = group.capitalize() if group else "Other"
+        if len(grouped_data[group]) < limit:
+            grouped_data[group].append(product)
 
     return grouped_data
 
+async def grouped_catalog(db: AsyncSession, limit: int = 20, category: Optional[str] = None, after: int = 0,
+                          columns: Optional[list[str]] = None, fresh: bool = False) -> CachedResponse:
+    """The serialized `/products/grouped` response, its ETag and cursor
+    header, from the catalog cache. The defaults are those of a plain
+    request, which the home page inlines. `fresh` rebuilds the entry: a
+    client that just wrote reads from the primary and must not be served one
+    built from a lagging replica."""
+    async def build():
+        if catalog_cache.invalidated_within(READ_YOUR_WRITES_SECONDS):
+            # The entry is shared by every client, and a replica may not have
+            # the write behind the invalidation yet
+            read_from_primary(db)
+        grouped = await db.run_sync(group_products, limit, after, category, columns)
+        headers = {}
+        if category:
+            page = next(iter(grouped.values()), [])
+            if len(page) == limit:
+                headers["X-Next-Cursor"] = str(page[-1]["id"])
+        return json.dumps(grouped).encode(), headers
+
+    key = ("grouped", limit, category.lower() if category else None, after, tuple(columns or ()))
+    return await catalog_cache.get_or_build_async(key, build, fresh=fresh)
+
+@products_router.get("/products/grouped", response_model=Dict[str, List[ProductSchema]])
+async def get_products(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    limit: int = Query(20, ge=1, le=200),
+    category: Optional[str] = None,
+    after: int = Query(0, ge=0),
+    fields: Optional[str] = None
+):
+    """Up to `limit` products per category. With `category`, pages through
+    that category: pass the `X-Next-Cursor` header as `after` to continue.
+    `fields` limits the returned columns (`id` is always included)."""
+    try:
+        columns = parse_fields(fields, PRODUCT_FIELDS)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    catalog = await grouped_catalog(db, limit, category, after, columns, fresh=reads_pinned_to_primary(request))
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache", **catalog.headers}
+    if etag_matches(request.headers.get("if-none-match"), catalog.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+@products_router.get("/products/cache-stats")
+async def get_cache_stats():
+    return catalog_cache.stats()
+
 @products_router.post("/products/{product_id}/purchase", status_code=status.HTTP_200_OK)
-def purchase_product(product_id: int, request: PurchaseRequest, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
-    
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    if product.stock_avilabilty < request.quantity:
+async def purchase_product(product_id: int, request: PurchaseRequest, response: Response,
+                           db: AsyncSession = Depends(get_async_db)):
+    def purchase(session: Session) -> Optional[int]:
+        # Stock held by carts is not for sale, but expired holds count as
+        # held until they are swept: release them and look again
+        new_stock = decrement_stock(session, product_id, request.quantity)
+        if new_stock is None:
+            session.rollback()
+            if release_expired(session, [product_id]):
+                new_stock = decrement_stock(session, product_id, request.quantity)
+        return new_stock
+
+    new_stock = await db.run_sync(purchase)
+
+    if new_stock is None:
+        exists = await db.get(Product, product_id) is not None
+        await db.rollback()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=400, detail="Insufficient stock")
-    
-    product.stock_avilabilty -= request.quantity
-    db.commit()
-    db.refresh(product)
-    
-    return {"message": "Purchase successful", "new_stock": product.stock_avilabilty}
+
+    await db.commit()
+    catalog_cache.invalidate()
+    price_cache.invalidate([product_id])
+    pin_reads_to_primary(response)
+
+    return {"message": "Purchase successful", "new_stock": new_stock}
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    key = decode_cursor(cursor)
+    if not (isinstance(key, list) and len(key) == 2
+            and isinstance(key[0], (int, float)) and isinstance(key[1], int)):
+        raise ValueError("Invalid cursor")
+    return key[0], key[1]
 
 
 @products_router.get("/products/search", response_model=List[ProductSchema])
-def search_products(q: str, db: Session = Depends(get_db)):
+async def search_products(
+    q: str,
+    db: AsyncSession = Depends(get_read_db),
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Ranked search. Pages can be requested with `offset`, or with the
+    `X-Next-Cursor` header of the previous page passed as `cursor`, which
+    stays cheap however deep the client pages."""
+    try:
+        columns = parse_fields(fields, PRODUCT_FIELDS)
+        after = decode_search_cursor(cursor) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
     if not q:
         return []
-    products = db.query(Product).filter(Product.name.ilike(f"%{q}%")).all()
-    return products
+    keys = await db.run_sync(lambda session: get_search_backend(session).search(session, q, limit, offset, after))
+    headers = {}
+    if len(keys) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(keys[-1])
+
+    async def rows():
+        # Fetch in ranking order, one batch of ids at a time
+        ids = [product_id for _, product_id in keys]
+        for start in range(0, len(ids), STREAM_THRESHOLD):
+            batch = ids[start:start + STREAM_THRESHOLD]
+            result = await db.execute(select(*product_columns(columns)).where(Product.id.in_(batch)))
+            found = {row["id"]: with_srcset(dict(row)) for row in result.mappings()}
+            for product_id in batch:
+                if product_id in found:
+                    yield found[product_id]
+
+    if len(keys) > STREAM_THRESHOLD:
+        return StreamingResponse(stream_json_array(rows()), media_type="application/json", headers=headers)
+    return JSONResponse(content=[row async for row in rows()], headers=headers)
@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, status, Form, Request
+from fastapi import APIRouter, Depends, status, Form, Request, Response
 from fastapi.responses import JSONResponse
 from models.users import User
 import database
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
-from controller import hash_password, verify_password
+from controller import hash_password_async, verify_and_update_password_async
 users_router = APIRouter()
 
+
+def email_taken() -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"success": False, "message": "This email is already registered."}
+    )
+
+
 @users_router.post("/register-user")
 async def register_user(
+    response: Response,
     first_name: str = Form(...),
     last_name: str = Form(...),
     dob: str = Form(...),
@@ -17,15 +28,12 @@ async def register_user(
     sex: str = Form(...),
     phone: str = Form(...),
     country: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    existing_user = db.query(User).filter(User.email == email).first()
+    existing_user = (await db.execute(select(User.id).where(User.email == email))).first()
     if existing_user:
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content={"success": False, "message": "This email is already registered."}
-        )
-    hashed_password = hash_password(password)
+        return email_taken()
+    hashed_password = await hash_password_async(password)
     new_user = User(
         first_name=first_name,
         last_name=last_name,
@@ -38,9 +46,15 @@ async def register_user(
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Registered concurrently after the check above (users.email is unique)
+        await db.rollback()
+        return email_taken()
 
+    # The client usually logs in and loads /me right away
+    database.pin_reads_to_primary(response)
     return {"success": True, "message": "Registration successful"}
 
 
@@ -48,14 +62,23 @@ async def register_user(
 async def login_user(
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(User).filter(User.email == email).first()
-    if user and verify_password(password, user.password):
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_and_update_password_async(password, user.password)
+    if valid:
+        if new_hash:
+            # Stored hash used outdated Argon2 parameters; upgrade it in place
+            user.password = new_hash
+            await db.commit()
         # create a session token and set it in an HTTP-only cookie
-        token = auth.create_session(user.id)
+        token = await auth.create_session_async(user.id)
         resp = JSONResponse(content={"user_name": user.first_name, "user_id": user.id})
-        resp.set_cookie(key="session_token", value=token, httponly=True, samesite="lax")
+        resp.set_cookie(key="session_token", value=token, httponly=True, samesite="lax", max_age=auth.SESSION_TTL_SECONDS)
+        # A lagging replica may not have the user yet (or its new hash)
+        database.pin_reads_to_primary(resp)
         return resp
     else:
         return JSONResponse(
@@ -65,12 +88,12 @@ async def login_user(
 
 
 @users_router.get("/me")
-def get_me(request: Request, db: Session = Depends(database.get_db)):
+async def get_me(request: Request, db: AsyncSession = Depends(database.get_read_db)):
     token = request.cookies.get("session_token")
-    user_id = auth.get_user_id_from_token(token)
+    user_id = await auth.get_user_id_from_token_async(token)
     if not user_id:
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Not authenticated"})
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Invalid session"})
     
@@ -96,6 +119,7 @@ def get_me(request: Request, db: Session = Depends(database.get_db)):
 @users_router.put("/update-profile")
 async def update_profile(
     request: Request,
+    response: Response,
     first_name: str = Form(None),
     last_name: str = Form(None),
     phone: str = Form(None),
@@ -103,15 +127,15 @@ async def update_profile(
     password: str = Form(None),
     dob: str = Form(None),
     sex: str = Form(None),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     token = request.cookies.get("session_token")
-    user_id = auth.get_user_id_from_token(token)
+    user_id = await auth.get_user_id_from_token_async(token)
     
     if not user_id:
         return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"message": "Not authenticated"})
         
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"message": "User not found"})
 
@@ -119,21 +143,21 @@ async def update_profile(
     if last_name: user.last_name = last_name
     if phone: user.phone = phone
     if country: user.country = country
-    if password: user.password = password
+    if password: user.password = await hash_password_async(password)
     if dob: user.dob = dob
     if sex: user.sex = sex
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    database.pin_reads_to_primary(response)
     
     return {"message": "Profile updated successfully!", "user_name": user.first_name}
 
 
 @users_router.post("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     token = request.cookies.get("session_token")
     if token:
-        auth.invalidate_session(token)
+        await auth.invalidate_session_async(token)
     resp = JSONResponse(content={"message": "Logged out"})
     resp.delete_cookie("session_token")
     return resp
@@ -1,28 +1,51 @@
 import pytest
 import sys
 import os
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.pool import NullPool
+from typing import Generator, Iterator
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
-from database import Base, get_db
+from database import Base, RoutingSession, get_db, get_async_db, create_db_engine, create_async_db_engine
 import auth
 from models.users import User
 from models.products import Product
 from controller import hash_password
+from controller.catalog import catalog_cache, price_cache
+from controller.orders import idempotency_cache
 
 TEST_DATABASE_URL = "sqlite:///./test_db.sqlite3"
 
-test_engine = create_engine(
-    TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+test_engine = create_db_engine(TEST_DATABASE_URL)
 TestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
 
+# The app talks to the same file through aiosqlite. NullPool closes each
+# connection with its request, so no connection outlives a test's event loop.
+test_async_engine = create_async_db_engine("sqlite+aiosqlite:///./test_db.sqlite3", poolclass=NullPool)
+TestAsyncSessionLocal = async_sessionmaker(
+    test_async_engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+@contextmanager
+def count_statements(engine=None) -> Iterator[list[str]]:
+    """Collect the SQL statements `engine` (by default the app's) executes
+    inside the block; use `len()` of the yielded list afterwards."""
+    engine = getattr(engine or test_async_engine, "sync_engine", engine or test_async_engine)
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
 
 @pytest.fixture(scope="function")
 def test_db() -> Generator:
@@ -32,20 +55,18 @@ def test_db() -> Generator:
     
     Base.metadata.drop_all(bind=test_engine)
     
-    auth._sessions.clear()
+    auth.get_session_store().clear()
 
 
 @pytest.fixture(scope="function")
 def db_session(test_db) -> Generator[Session, None, None]:
-    connection = test_engine.connect()
-    transaction = connection.begin()
-    session = TestSessionLocal(bind=connection)
+    # Data is committed for real so the app's async connections can see it;
+    # test_db drops every table afterwards.
+    session = TestSessionLocal()
     
     yield session
     
     session.close()
-    transaction.rollback()
-    connection.close()
 
 
 def override_get_db(db_session: Session):
@@ -57,10 +78,19 @@ def override_get_db(db_session: Session):
     return _override
 
 
+async def override_get_async_db():
+    async with TestAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="function")
 def client(db_session: Session) -> TestClient: # dah wa7ed da5l 3ady m3ndosh mail asln fa asmo client
     
     app.dependency_overrides[get_db] = override_get_db(db_session)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    catalog_cache.clear()
+    price_cache.invalidate()
+    idempotency_cache.clear()
     
     with TestClient(app) as test_client:
         yield test_client
@@ -0,0 +1,127 @@
+import time
+import pytest
+import auth
+from auth import MemorySessionStore, DatabaseSessionStore, SessionSweeper, TokenSigner
+from tests.conftest import TestSessionLocal
+
+
+class TestMemorySessionStore:
+    def test_set_and_get_session(self):
+        store = MemorySessionStore()
+        store.set("token", 42, ttl=60)
+        assert store.get("token") == 42
+        assert store.get("missing") is None
+
+    def test_expired_session_is_rejected(self):
+        store = MemorySessionStore()
+        store.set("token", 42, ttl=0)
+        assert store.get("token") is None
+        assert len(store) == 0
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = MemorySessionStore(max_entries=2)
+        store.set("a", 1, ttl=60)
+        store.set("b", 2, ttl=60)
+        store.get("a")  # "b" is now least recently used
+        store.set("c", 3, ttl=60)
+
+        assert store.get("a") == 1
+        assert store.get("b") is None
+        assert store.get("c") == 3
+
+    def test_sweep_removes_only_expired_sessions(self):
+        store = MemorySessionStore()
+        store.set("old", 1, ttl=0)
+        store.set("new", 2, ttl=60)
+        assert store.sweep() == 1
+        assert len(store) == 1
+
+
+class TestDatabaseSessionStore:
+    def test_sessions_are_shared_between_store_instances(self, test_db):
+        worker_a = DatabaseSessionStore(TestSessionLocal)
+        worker_b = DatabaseSessionStore(TestSessionLocal)
+
+        worker_a.set("token", 7, ttl=60)
+        assert worker_b.get("token") == 7
+
+        worker_b.delete("token")
+        assert worker_a.get("token") is None
+
+    def test_expired_sessions_are_rejected_and_swept(self, test_db):
+        store = DatabaseSessionStore(TestSessionLocal)
+        store.set("old", 1, ttl=-1)
+        store.set("new", 2, ttl=60)
+
+        assert store.get("old") is None
+        assert store.sweep() == 1
+        assert store.get("new") == 2
+
+
+class TestSessionSweeper:
+    def test_sweeper_runs_in_background(self):
+        store = MemorySessionStore()
+        store.set("old", 1, ttl=0)
+        sweeper = SessionSweeper(store, interval=0.01)
+        sweeper.start()
+        try:
+            deadline = time.monotonic() + 2
+            while len(store) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            sweeper.stop()
+        assert len(store) == 0
+
+
+class TestSessionApi:
+    def test_create_and_invalidate_session(self):
+        token = auth.create_session(5)
+        assert auth.get_user_id_from_token(token) == 5
+        auth.invalidate_session(token)
+        assert auth.get_user_id_from_token(token) is None
+
+    def test_missing_token_returns_none(self):
+        assert auth.get_user_id_from_token(None) is None
+        assert auth.get_user_id_from_token("") is None
+
+
+class TestTokenSigner:
+    def test_signed_token_round_trip(self):
+        signer = TokenSigner.from_config("k1:secret-one")
+        token = signer.sign(12, ttl=60)
+        assert TokenSigner.is_signed(token)
+        assert signer.verify(token) == 12
+
+    def test_tampered_token_is_rejected(self):
+        signer = TokenSigner.from_config("k1:secret-one")
+        token = signer.sign(12, ttl=60)
+        forged = token.replace(".12.", ".13.")
+        assert signer.verify(forged) is None
+
+    def test_expired_token_is_rejected(self):
+        signer = TokenSigner.from_config("k1:secret-one")
+        assert signer.verify(signer.sign(12, ttl=-1)) is None
+
+    def test_rotated_keys_still_accept_old_tokens(self):
+        old_signer = TokenSigner.from_config("k1:secret-one")
+        token = old_signer.sign(12, ttl=60)
+
+        rotated = TokenSigner.from_config("k2:secret-two,k1:secret-one")
+        assert rotated.verify(token) == 12
+        assert rotated.sign(12, ttl=60).startswith("s.k2.")
+
+        retired = TokenSigner.from_config("k2:secret-two")
+        assert retired.verify(token) is None
+
+    def test_invalid_key_config_raises(self):
+        with pytest.raises(ValueError):
+            TokenSigner.from_config("")
+        with pytest.raises(ValueError):
+            TokenSigner.from_config("k1")
+
+    def test_signed_mode_skips_session_store(self, monkeypatch):
+        monkeypatch.setattr(auth, "signer", TokenSigner.from_config("k1:secret-one"))
+        token = auth.create_session(9)
+
+        assert len(auth.get_session_store()) == 0
+        assert auth.get_user_id_from_token(token) == 9
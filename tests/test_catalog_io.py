@@ -0,0 +1,201 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import catalog_io
+from controller.catalog import catalog_cache, price_cache
+from controller.catalog_version import CatalogWatcher, catalog_version
+from controller.inventory import shard_stock
+from controller.search import get_search_backend
+from models.products import Product, ProductStockShard
+from tests.conftest import TestSessionLocal, count_statements, test_engine
+
+CSV = """name,description,price,image_url,category,stock_avilabilty
+Coat,Stylish winter coat,70.0,images/item1.jpg,Clothes,50
+Jeans,,50.0,images/item2.jpg,Clothes,100
+"""
+
+
+def import_text(text: str, fmt: str = "csv", chunk_size: int = 1000) -> dict:
+    return catalog_io.import_products(io.StringIO(text), fmt, chunk_size, session_factory=TestSessionLocal)
+
+
+def export_text(fmt: str, chunk_size: int = 1000) -> str:
+    output = io.StringIO()
+    catalog_io.export_products(output, fmt, chunk_size, session_factory=TestSessionLocal)
+    return output.getvalue()
+
+
+class TestCatalogImport:
+    def test_import_csv(self, db_session: Session):
+        assert import_text(CSV) == {"inserted": 2, "updated": 0}
+
+        coat = db_session.execute(select(Product).where(Product.name == "Coat")).scalar_one()
+        assert (coat.price, coat.stock_avilabilty, coat.category) == (70.0, 50, "Clothes")
+        jeans = db_session.execute(select(Product).where(Product.name == "Jeans")).scalar_one()
+        assert jeans.description is None
+
+    def test_reimport_updates_by_name(self, db_session: Session):
+        import_text(CSV)
+        changed = CSV.replace("70.0", "65.0").replace("Clothes,100", "Clothes,90")
+
+        assert import_text(changed) == {"inserted": 0, "updated": 2}
+        assert db_session.scalar(select(func.count()).select_from(Product)) == 2
+        assert db_session.scalar(select(Product.price).where(Product.name == "Coat")) == 65.0
+
+    def test_import_jsonl_in_chunks(self, db_session: Session):
+        lines = [
+            json.dumps({"name": f"Product {i}", "price": i, "image_url": "images/item1.jpg",
+                        "category": "Bulk", "stock_avilabilty": i})
+            for i in range(25)
+        ]
+        # The last occurrence of a repeated name wins
+        lines.append(json.dumps({"name": "Product 3", "price": 99, "image_url": "images/item1.jpg",
+                                 "category": "Bulk", "stock_avilabilty": 1}))
+
+        assert import_text("\n".join(lines), "jsonl", chunk_size=10) == {"inserted": 25, "updated": 1}
+        assert db_session.scalar(select(Product.price).where(Product.name == "Product 3")) == 99
+
+    @pytest.mark.parametrize("line, message", [
+        ("Boot,,abc,images/item3.jpg,Clothes,40", "Line 4"),
+        ("Boot,,40,,Clothes,40", "missing image_url"),
+        ("Boot,,40,images/item3.jpg,Clothes,-1", "must not be negative"),
+    ])
+    def test_invalid_row_stops_import(self, db_session: Session, line: str, message: str):
+        with pytest.raises(ValueError, match=message):
+            import_text(CSV + line + "\n", chunk_size=2)
+        # The chunk before the bad row was committed
+        assert db_session.scalar(select(func.count()).select_from(Product)) == 2
+
+    def test_import_refreshes_search_and_caches(self, db_session: Session):
+        version = catalog_cache.version
+        import_text(CSV)
+
+        assert catalog_cache.version > version
+        ids = [product_id for _, product_id in get_search_backend(db_session).search(db_session, "winter", 10)]
+        assert ids == [db_session.scalar(select(Product.id).where(Product.name == "Coat"))]
+
+    def test_import_indexes_search_once(self, db_session: Session):
+        with count_statements(test_engine) as statements:
+            import_text(CSV)
+        # The triggers are dropped for the import and the index rebuilt once
+        assert len([statement for statement in statements if "'rebuild'" in statement]) == 1
+        assert len([statement for statement in statements if statement.startswith("DROP TRIGGER")]) == 3
+
+        # ... after which they index writes again
+        db_session.add(Product(name="Scarf", price=9.0, image_url="images/item1.jpg", category="Clothes",
+                               stock_avilabilty=1))
+        db_session.commit()
+        ids = [product_id for _, product_id in get_search_backend(db_session).search(db_session, "scarf", 10)]
+        assert ids == [db_session.scalar(select(Product.id).where(Product.name == "Scarf"))]
+
+    def test_failed_import_still_indexes_committed_chunks(self, db_session: Session):
+        with pytest.raises(ValueError):
+            import_text(CSV + "Boot,,abc,images/item3.jpg,Clothes,40\n", chunk_size=2)
+        assert get_search_backend(db_session).search(db_session, "jeans", 10)
+
+    @pytest.mark.parametrize("chunk_size", ["0", "-5"])
+    def test_chunk_size_must_be_positive(self, chunk_size: str, capsys):
+        with pytest.raises(SystemExit) as exit:
+            catalog_io.main(["import", "products.csv", "--chunk-size", chunk_size])
+        assert exit.value.code == 2
+        assert "must be a positive number" in capsys.readouterr().err
+
+    def test_import_signals_other_processes(self, db_session: Session):
+        # A server's watcher, polling the database the import writes to
+        watcher = CatalogWatcher(session_factory=TestSessionLocal)
+        watcher.run_once()
+        version = catalog_version(db_session)
+
+        import_text(CSV)
+
+        assert catalog_version(db_session) == version + 1
+        price_cache.put_many([{"id": 1, "name": "Coat", "price": 70.0, "stock": 50}])
+        cache_version = catalog_cache.version
+        watcher.run_once()
+        assert catalog_cache.version > cache_version
+        assert price_cache.get_many([1]) == ({}, [1])
+        # Nothing changed since: the caches are left alone
+        cache_version = catalog_cache.version
+        watcher.run_once()
+        assert catalog_cache.version == cache_version
+
+    def test_product_names_are_unique(self, db_session: Session):
+        import_text(CSV)
+        db_session.add(Product(name="Coat", price=1.0, image_url="images/item1.jpg", category="Clothes",
+                               stock_avilabilty=1))
+        with pytest.raises(IntegrityError):
+            db_session.commit()
+        db_session.rollback()
+
+    def test_import_respreads_sharded_stock(self, db_session: Session):
+        import_text(CSV)
+        coat_id = db_session.scalar(select(Product.id).where(Product.name == "Coat"))
+        shard_stock(db_session, coat_id, 4)
+        db_session.commit()
+
+        import_text(CSV.replace("Clothes,50", "Clothes,21"))
+
+        quantities = db_session.scalars(
+            select(ProductStockShard.quantity).where(ProductStockShard.product_id == coat_id)
+        ).all()
+        assert sorted(quantities) == [5, 5, 5, 6]
+
+
+class TestShardCommand:
+    @pytest.fixture(autouse=True)
+    def test_database(self, monkeypatch):
+        monkeypatch.setattr(catalog_io.database, "SessionLocal", TestSessionLocal)
+        monkeypatch.setattr(catalog_io.database, "init_db", lambda: None)
+
+    def shard_quantities(self, db_session: Session, name: str) -> list[int]:
+        return sorted(db_session.scalars(
+            select(ProductStockShard.quantity).join(Product, Product.id == ProductStockShard.product_id)
+            .where(Product.name == name)
+        ).all())
+
+    def test_shard_and_merge_back(self, db_session: Session):
+        import_text(CSV)
+
+        assert catalog_io.main(["shard", "Coat", "4"]) == 0
+        assert self.shard_quantities(db_session, "Coat") == [12, 12, 13, 13]
+
+        assert catalog_io.main(["shard", "Coat", "1"]) == 0
+        assert self.shard_quantities(db_session, "Coat") == []
+        assert db_session.scalar(select(Product.stock_avilabilty).where(Product.name == "Coat")) == 50
+
+    def test_unknown_product(self, db_session: Session, capsys):
+        assert catalog_io.main(["shard", "Nope", "4"]) == 1
+        assert "No product named 'Nope'" in capsys.readouterr().err
+
+    def test_shard_count_must_be_positive(self):
+        with pytest.raises(SystemExit):
+            catalog_io.main(["shard", "Coat", "0"])
+
+
+class TestCatalogExport:
+    def test_csv_round_trip(self, db_session: Session):
+        import_text(CSV)
+        exported = export_text("csv", chunk_size=1)
+        assert exported == CSV
+
+        # Nothing changed, so nothing is rewritten
+        assert import_text(exported) == {"inserted": 0, "updated": 0}
+
+    def test_jsonl_export(self, db_session: Session):
+        import_text(CSV)
+        rows = [json.loads(line) for line in export_text("jsonl").splitlines()]
+        assert [row["name"] for row in rows] == ["Coat", "Jeans"]
+        assert rows[0] == {"name": "Coat", "description": "Stylish winter coat", "price": 70.0,
+                           "image_url": "images/item1.jpg", "category": "Clothes", "stock_avilabilty": 50}
+
+    def test_format_is_taken_from_extension(self):
+        assert catalog_io.detect_format("products.csv") == "csv"
+        assert catalog_io.detect_format("products.jsonl") == "jsonl"
+        assert catalog_io.detect_format("-", "jsonl") == "jsonl"
+        with pytest.raises(ValueError):
+            catalog_io.detect_format("products.xlsx")
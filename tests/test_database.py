@@ -1,8 +1,18 @@
 import pytest
+import database
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import Session
+from config import Settings
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import Base, create_async_db_engine, create_db_engine, to_async_url
 from models.users import User
 from models.products import Product
 from models.order import OrderDetails, OrderItem
+from tests.conftest import TestAsyncSessionLocal, count_statements
+import migrations
+from fastapi.testclient import TestClient
 
 
 class TestDatabaseConnection:
@@ -21,6 +31,34 @@ class TestDatabaseConnection:
             pytest.fail(f"Database tables not properly created: {e}")
 
 
+    def test_sqlite_connections_use_tuning_profile(self, test_db):
+        with test_db.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+    def test_engine_factory_reads_settings(self, tmp_path):
+        config = Settings(sqlite_journal_mode="DELETE", sqlite_busy_timeout_ms=1234)
+        engine = create_db_engine(f"sqlite:///{tmp_path}/tuned.sqlite3", config)
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+        engine.dispose()
+
+    def test_async_url_uses_async_driver(self):
+        assert str(to_async_url("sqlite:///./db.sqlite3")) == "sqlite+aiosqlite:///./db.sqlite3"
+        assert to_async_url("postgresql://u:p@db/shop").drivername == "postgresql+asyncpg"
+        with pytest.raises(ValueError):
+            to_async_url("oracle://db/shop")
+
+    @pytest.mark.asyncio
+    async def test_async_session_sees_committed_rows(self, db_session: Session, sample_user: User):
+        async with TestAsyncSessionLocal() as db:
+            assert isinstance(db, AsyncSession)
+            user = await db.get(User, sample_user.id)
+            assert user.email == sample_user.email
+
+
 class TestDatabaseCRUD:
     
     def test_create_user_in_database(self, db_session: Session):
@@ -155,3 +193,197 @@ class TestDatabaseRelationships:
         db_session.refresh(order)
         assert len(order.items) == 1
         assert order.items[0].product_name == product.name
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A second SQLite file standing in for a lagging read replica."""
+    url = f"sqlite:///{tmp_path}/replica.sqlite3"
+    engine = create_db_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Product(name="Replica Lamp", price=5.0, image_url="lamp.jpg", category="home", stock_avilabilty=3))
+        db.commit()
+    async_engine = create_async_db_engine(to_async_url(url), poolclass=NullPool)
+    monkeypatch.setattr(database, "read_engines", [async_engine])
+    yield engine
+    engine.dispose()
+
+
+class TestReadReplicas:
+    def test_catalog_reads_go_to_replica(self, client: TestClient, sample_products: list[Product], replica):
+        names = [p["name"] for group in client.get("/products/grouped").json().values() for p in group]
+        assert names == ["Replica Lamp"]
+        assert [p["name"] for p in client.get("/products/search", params={"q": "lamp"}).json()] == ["Replica Lamp"]
+
+    def test_checkout_pins_reads_to_primary(self, authenticated_client: TestClient, sample_products: list[Product], replica):
+        product = sample_products[0]
+        response = authenticated_client.post("/order/checkout", json={
+            "user_id": 1,
+            "items": [{"product_name": product.name, "product_id": product.id, "price": product.price, "quantity": 1}]
+        })
+        assert response.status_code == 200
+        assert database.READ_YOUR_WRITES_COOKIE in response.cookies
+
+        grouped = authenticated_client.get("/products/grouped").json()
+        stock = {p["name"]: p["stock_avilabilty"] for group in grouped.values() for p in group}
+        assert stock[product.name] == 9
+        assert "Replica Lamp" not in stock
+
+    def test_catalog_is_rebuilt_from_primary_after_a_change(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        replica
+    ):
+        product = sample_products[0]
+        assert authenticated_client.post(f"/products/{product.id}/purchase", json={"quantity": 1}).status_code == 200
+
+        # Clients that didn't write, sharing the cache entry the next one builds
+        authenticated_client.cookies.clear()
+        for _ in range(2):
+            grouped = authenticated_client.get("/products/grouped").json()
+            stock = {p["name"]: p["stock_avilabilty"] for group in grouped.values() for p in group}
+            assert stock[product.name] == 9
+            assert "Replica Lamp" not in stock
+
+    def test_new_user_sees_their_account_after_login(self, client: TestClient, replica):
+        # The replica has no copy of the user yet
+        registered = client.post("/register-user", data={
+            "first_name": "Lag", "last_name": "Test", "dob": "1990-01-01", "email": "lag@test.com",
+            "password": "Secret123", "sex": "F", "phone": "+100", "country": "Nowhere"
+        })
+        assert database.READ_YOUR_WRITES_COOKIE in registered.cookies
+        client.cookies.clear()
+
+        login = client.post("/login", data={"email": "lag@test.com", "password": "Secret123"})
+        assert database.READ_YOUR_WRITES_COOKIE in login.cookies
+
+        me = client.get("/me")
+        assert me.status_code == 200
+        assert me.json()["email"] == "lag@test.com"
+
+    def test_routing_session_writes_to_primary(self, db_session: Session, replica):
+        session = database.RoutingSession(bind=db_session.get_bind(), info={"replica": replica})
+        try:
+            assert session.get_bind(clause=select(Product)) is replica
+            assert session.get_bind(clause=select(Product).with_for_update()) is not replica
+            assert session.get_bind(clause=insert(Product)) is not replica
+        finally:
+            session.close()
+
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, first_name VARCHAR, last_name VARCHAR, dob VARCHAR, "
+    "email VARCHAR, password VARCHAR, sex VARCHAR, phone VARCHAR, country VARCHAR)",
+    "CREATE TABLE order_details (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users (id), total_price FLOAT)",
+]
+
+
+class TestIndexes:
+    @pytest.mark.parametrize("query, index", [
+        ("SELECT * FROM users WHERE email = 'a@b.c'", "ix_users_email"),
+        ("SELECT * FROM order_details WHERE user_id = 1", "ix_order_details_user_id"),
+        ("SELECT * FROM order_items WHERE order_details_id = 1", "ix_order_items_order_details_id"),
+        ("SELECT * FROM products WHERE category = 'clothing'", "ix_products_category_id"),
+        ("SELECT * FROM products WHERE name = 'Coat'", "ux_products_name"),
+    ])
+    def test_hot_queries_use_an_index(self, db_session: Session, query, index):
+        plan = " ".join(row[-1] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+        assert f"INDEX {index}" in plan
+
+    def test_migration_adds_indexes_to_existing_database(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path}/legacy.sqlite3")
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+
+        assert migrations.migrate(engine) == [version for version, _ in migrations.MIGRATIONS]
+        assert migrations.migrate(engine) == []
+
+        with engine.connect() as conn:
+            indexes = {row.name: row.sql for row in conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'index'"))}
+        assert "UNIQUE" in indexes["ix_users_email"]
+        assert "ix_order_details_user_id" in indexes
+        # The plain index on product names was replaced by a unique one
+        assert "UNIQUE" in indexes["ux_products_name"]
+        assert "ix_products_name" not in indexes
+        engine.dispose()
+
+    def test_migration_refuses_duplicate_emails(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path}/legacy.sqlite3")
+        with engine.begin() as conn:
+            conn.exec_driver_sql(LEGACY_SCHEMA[0])
+            conn.exec_driver_sql("INSERT INTO users (email) VALUES ('twice@test.com'), ('twice@test.com')")
+
+        with pytest.raises(RuntimeError, match="twice@test.com"):
+            migrations.migrate(engine)
+        engine.dispose()
+
+    def test_migration_refuses_duplicate_product_names(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path}/legacy.sqlite3")
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT, "
+                "price FLOAT NOT NULL, image_url VARCHAR(255) NOT NULL, category VARCHAR(50) NOT NULL, "
+                "stock_avilabilty INTEGER NOT NULL)"
+            )
+            conn.exec_driver_sql(
+                "INSERT INTO products (name, price, image_url, category, stock_avilabilty) "
+                "VALUES ('Coat', 1, 'a.jpg', 'Clothes', 1), ('Coat', 2, 'b.jpg', 'Clothes', 1)"
+            )
+
+        with pytest.raises(RuntimeError, match="'Coat'"):
+            migrations.migrate(engine)
+        engine.dispose()
+
+
+class TestMigrations:
+    def schema(self, engine):
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT type, name, tbl_name FROM sqlite_master "
+                "WHERE name NOT LIKE 'sqlite_%' AND name NOT LIKE 'products_fts_%' AND name != 'schema_migrations'"
+            ))
+            return {tuple(row) for row in rows}
+
+    def test_migrations_build_the_model_schema(self, tmp_path):
+        migrated = create_db_engine(f"sqlite:///{tmp_path}/migrated.sqlite3")
+        created = create_db_engine(f"sqlite:///{tmp_path}/created.sqlite3")
+        migrations.migrate(migrated)
+        Base.metadata.create_all(bind=created)
+
+        assert self.schema(migrated) == self.schema(created)
+        with migrated.connect() as conn:
+            versions = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+        assert versions == [version for version, _ in migrations.MIGRATIONS]
+        migrated.dispose()
+        created.dispose()
+
+    def test_current_schema_costs_one_query(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path}/current.sqlite3")
+        migrations.migrate(engine)
+
+        with count_statements(engine) as statements:
+            assert migrations.migrate(engine) == []
+        assert len(statements) == 1
+        engine.dispose()
+
+    def test_order_item_counts_are_backfilled(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path}/legacy.sqlite3")
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(
+                "CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_details_id INTEGER, product_id INTEGER, "
+                "product_name VARCHAR, price FLOAT, quantity INTEGER)"
+            )
+            conn.exec_driver_sql("INSERT INTO order_details (id, user_id, total_price) VALUES (1, 1, 10), (2, 1, 0)")
+            conn.exec_driver_sql("INSERT INTO order_items (order_details_id, quantity) VALUES (1, 2), (1, 3)")
+
+        migrations.migrate(engine)
+
+        with engine.connect() as conn:
+            counts = conn.execute(text("SELECT id, item_count FROM order_details ORDER BY id")).all()
+        assert [tuple(row) for row in counts] == [(1, 5), (2, 0)]
+        engine.dispose()
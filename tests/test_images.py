@@ -0,0 +1,117 @@
+import io
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from controller import images
+from controller.images import ImageCache
+from models.products import Product
+
+
+@pytest.fixture
+def image_cache(tmp_path, monkeypatch) -> ImageCache:
+    cache = ImageCache(directory=str(tmp_path / "cache"))
+    monkeypatch.setattr(images, "image_cache", cache)
+    return cache
+
+
+def size_of(response) -> tuple[int, int]:
+    return images.Image.open(io.BytesIO(response.content)).size
+
+
+@pytest.mark.skipif(images.Image is None, reason="Pillow is not installed")
+class TestImageResizing:
+    def test_original_without_parameters(self, client: TestClient):
+        response = client.get("/images/item1.jpg")
+        assert response.status_code == 200
+        with open(os.path.join(images.IMAGE_DIR, "item1.jpg"), "rb") as file:
+            assert response.content == file.read()
+
+    def test_resized_webp(self, client: TestClient, image_cache: ImageCache):
+        response = client.get("/images/item5.jpg?w=320&fmt=webp")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert size_of(response)[0] == 320
+        assert "max-age" in response.headers["cache-control"]
+
+    def test_width_is_rounded_up_to_a_variant(self, client: TestClient, image_cache: ImageCache):
+        response = client.get("/images/item5.jpg?w=300&fmt=jpeg")
+        assert response.headers["content-type"] == "image/jpeg"
+        assert size_of(response)[0] == 320
+
+    def test_format_follows_accept_header(self, client: TestClient, image_cache: ImageCache):
+        webp = client.get("/images/item5.jpg?w=320", headers={"Accept": "image/avif,image/webp,*/*"})
+        jpeg = client.get("/images/item5.jpg?w=320", headers={"Accept": "*/*"})
+        assert webp.headers["content-type"] == "image/webp"
+        assert jpeg.headers["content-type"] == "image/jpeg"
+        assert webp.headers["vary"] == "Accept"
+
+    def test_variant_is_made_once(self, client: TestClient, image_cache: ImageCache, monkeypatch):
+        calls = []
+        resize = images.resize
+        monkeypatch.setattr(images, "resize", lambda *args: calls.append(args) or resize(*args))
+
+        first = client.get("/images/item5.jpg?w=480&fmt=webp")
+        second = client.get("/images/item5.jpg?w=480&fmt=webp")
+        revalidated = client.get("/images/item5.jpg?w=480&fmt=webp", headers={"If-None-Match": first.headers["etag"]})
+
+        assert len(calls) == 1
+        assert second.content == first.content
+        assert revalidated.status_code == 304
+
+    def test_missing_image(self, client: TestClient, image_cache: ImageCache):
+        assert client.get("/images/nope.jpg?w=320").status_code == 404
+        assert client.get("/images/nope.jpg").status_code == 404
+
+    def test_cache_evicts_least_recently_used(self, tmp_path):
+        cache = ImageCache(directory=str(tmp_path / "cache"))
+        source = os.path.join(images.IMAGE_DIR, "item5.jpg")
+        old, new = (cache.path(cache.key(source, 320, fmt), fmt) for fmt in ("webp", "jpeg"))
+        cache._make(source, old, 320, "webp")
+        os.utime(old, (0, 0))
+        with open(source, "rb") as file:
+            # Room for the new variant, but not for both
+            cache.max_bytes = len(images.resize(file.read(), 320, "jpeg")) * 10 // 9 + 1
+
+        cache._make(source, new, 320, "jpeg")
+
+        assert not os.path.exists(old)
+        assert os.path.exists(new)
+        assert cache._size == os.path.getsize(new)
+
+    def test_recently_used_variant_is_kept(self, tmp_path):
+        cache = ImageCache(directory=str(tmp_path / "cache"), max_bytes=1)
+        source = os.path.join(images.IMAGE_DIR, "item5.jpg")
+        first, second = (cache.path(cache.key(source, 320, fmt), fmt) for fmt in ("webp", "jpeg"))
+        cache._make(source, first, 320, "webp")
+        os.utime(first, (0, 0))
+        # A hit refreshes the variant just before it is served
+        cache._make(source, first, 320, "webp")
+
+        cache._make(source, second, 320, "jpeg")
+
+        assert os.path.exists(first) and os.path.exists(second)
+        assert cache._size == os.path.getsize(first) + os.path.getsize(second)
+
+
+class TestProductSrcset:
+    def test_local_images_get_srcset(self, client: TestClient, db_session: Session, sample_products: list[Product]):
+        db_session.add(Product(name="Local", price=1.0, image_url="images/item1.jpg", category="electronics",
+                               stock_avilabilty=1))
+        db_session.commit()
+
+        products = {product["name"]: product for product in client.get("/products/grouped").json()["Electronics"]}
+
+        assert products["Local"]["srcset"].startswith("/images/item1.jpg?w=320 320w, ")
+        assert products["Test Laptop"]["srcset"] is None
+
+    def test_srcset_helper(self):
+        assert images.srcset("/images/item1.jpg").endswith(f"?w={images.IMAGE_WIDTHS[-1]} {images.IMAGE_WIDTHS[-1]}w")
+        assert images.srcset("http://example.com/laptop.jpg") is None
+        assert images.srcset(None) is None
+
+    def test_no_srcset_without_pillow(self, monkeypatch):
+        monkeypatch.setattr(images, "Image", None)
+        assert images.srcset("/images/item1.jpg") is None
@@ -1,5 +1,15 @@
+import gzip
+import json
+import os
+
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+import assets
+import main
+from models.products import Product
 
 
 class TestMainEndpoints:
@@ -26,6 +36,69 @@ class TestMainEndpoints:
         assert response.status_code == 200
         assert "text/html" in response.headers["content-type"]
 
+class TestPageCaching:
+    def test_pages_have_etag(self, client: TestClient):
+        response = client.get("/")
+        assert response.headers["etag"].startswith('"')
+        assert response.headers["cache-control"] == "no-cache"
+
+    def test_unchanged_page_is_not_modified(self, client: TestClient):
+        etag = client.get("/Register").headers["etag"]
+        response = client.get("/Register", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert client.get("/FQA", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_pages_are_rendered_once(self, client: TestClient, monkeypatch):
+        main.render_page.cache_clear()
+        rendered = []
+        get_template = main.templates.get_template
+        monkeypatch.setattr(main.templates, "get_template", lambda name: rendered.append(name) or get_template(name))
+
+        first = client.get("/")
+        second = client.get("/")
+
+        assert rendered == ["Web.html"]
+        assert second.content == first.content
+
+
+def inlined_catalog(page: str):
+    start = page.find('<script id="catalog-data" type="application/json">')
+    if start == -1:
+        return None
+    start = page.index(">", start) + 1
+    return json.loads(page[start:page.index("</script>", start)])
+
+
+class TestInlineCatalog:
+    def test_home_page_embeds_catalog(self, client: TestClient, sample_products: list[Product]):
+        page = client.get("/").text
+        assert inlined_catalog(page) == client.get("/products/grouped").json()
+
+    def test_catalog_cannot_close_the_script_element(self, client: TestClient, db_session: Session):
+        name = "</script><script>alert(1)</script>"
+        db_session.add(Product(name=name, price=1.0, image_url="images/item1.jpg", category="clothing",
+                               stock_avilabilty=1))
+        db_session.commit()
+
+        page = client.get("/").text
+
+        assert name not in page
+        assert inlined_catalog(page)["Clothing"][0]["name"] == name
+
+    def test_etag_follows_catalog(self, client: TestClient, sample_products: list[Product]):
+        etag = client.get("/").headers["etag"]
+        assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+        client.post(f"/products/{sample_products[0].id}/purchase", json={"quantity": 1})
+
+        assert client.get("/", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_can_be_disabled(self, client: TestClient, sample_products: list[Product], monkeypatch):
+        monkeypatch.setattr(main, "INLINE_CATALOG", False)
+        assert inlined_catalog(client.get("/").text) is None
+
+
 class TestApplicationConfiguration:
     def test_routers_are_included(self, client: TestClient):
         routes = [route.path for route in client.app.routes]
@@ -33,3 +106,58 @@ class TestApplicationConfiguration:
         assert "/login" in routes
         assert "/products/grouped" in routes
         assert "/order/checkout" in routes
+
+
+class TestStaticAssets:
+    @pytest.fixture(scope="class")
+    def build(self, tmp_path_factory) -> tuple[str, dict]:
+        dest = str(tmp_path_factory.mktemp("dist"))
+        return dest, assets.build("views", dest)
+
+    def test_files_are_fingerprinted(self, build):
+        dest, manifest = build
+        assert manifest["css/all.min.css"].startswith("css/all.min.")
+        assert manifest["css/all.min.css"] != "css/all.min.css"
+        assert assets.load_manifest(dest) == manifest
+        assert all(os.path.exists(os.path.join(dest, "assets", hashed)) for hashed in manifest.values())
+
+    def test_css_references_point_at_hashed_files(self, build):
+        dest, manifest = build
+        with open(os.path.join(dest, "assets", manifest["css/all.min.css"])) as file:
+            css = file.read()
+        font = os.path.basename(manifest["webfonts/fa-solid-900.woff2"])
+        assert f"url(../webfonts/{font})" in css
+        assert "fa-solid-900.woff2)" not in css
+
+    def test_only_text_assets_are_precompressed(self, build):
+        dest, manifest = build
+        css = os.path.join(dest, "assets", manifest["css/bootstrap.min.css"])
+        with open(css, "rb") as original, open(css + ".gz", "rb") as compressed:
+            assert gzip.decompress(compressed.read()) == original.read()
+        assert not os.path.exists(os.path.join(dest, "assets", manifest["images/item1.jpg"]) + ".gz")
+
+    def test_served_compressed_and_immutable(self, build):
+        dest, manifest = build
+        app = FastAPI()
+        app.mount("/assets", assets.PrecompressedStaticFiles(directory=os.path.join(dest, "assets")))
+        client = TestClient(app)
+        url = f"/assets/{manifest['css/bootstrap.min.css']}"
+
+        compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+        plain = client.get(url, headers={"Accept-Encoding": "identity"})
+
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["content-type"].startswith("text/css")
+        assert "immutable" in compressed.headers["cache-control"]
+        assert compressed.headers["vary"] == "Accept-Encoding"
+        assert "content-encoding" not in plain.headers
+        assert compressed.content == plain.content
+
+    def test_asset_url_uses_manifest(self, monkeypatch):
+        monkeypatch.setattr(assets, "manifest", {"style/web.css": "style/web.0123456789.css"})
+        assert assets.asset_url("style/web.css") == "/assets/style/web.0123456789.css"
+        assert assets.asset_url("images/logo.png") == "/images/logo.png"
+
+    def test_pages_link_assets(self, client: TestClient):
+        assert assets.asset_url("style/java.js") in client.get("/").text
+        assert assets.asset_url("css/bootstrap.min.css") in client.get("/FQA").text
@@ -1,8 +1,20 @@
 import pytest
+from datetime import datetime
 from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+import auth
 from models.products import Product
+from models.users import User
 from models.order import OrderDetails, OrderItem
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
+from database import create_db_engine
+from tests.conftest import TEST_DATABASE_URL, count_statements
+from controller.group_commit import CommitterStopped, GroupCommitter
+from controller.orders import OrderError, idempotency_cache, place_order
+from controller import group_commit, reservations
+from routers.order import OrderItemIn
+from models.reservations import StockReservation
 
 
 class TestCheckoutEndpoint:    
@@ -241,6 +253,48 @@ class TestCheckoutEndpoint:
         data = response.json()
         assert "insufficient stock" in data["detail"].lower()
     
+    def test_checkout_merges_repeated_lines_for_stock_check(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]  # Has stock of 5
+        line = {
+            "product_name": product.name,
+            "product_id": product.id,
+            "price": product.price,
+            "quantity": 3
+        }
+
+        response = authenticated_client.post("/order/checkout", json={"user_id": 1, "items": [line, line]})
+
+        assert response.status_code == 400
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 5
+
+    def test_checkout_query_count_does_not_grow_with_cart_size(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        def checkout_statements(products):
+            payload = {
+                "user_id": 1,
+                "items": [
+                    {"product_name": p.name, "product_id": p.id, "price": p.price, "quantity": 1}
+                    for p in products
+                ]
+            }
+            with count_statements() as statements:
+                response = authenticated_client.post("/order/checkout", json=payload)
+            assert response.status_code == 200
+            return len(statements)
+
+        assert checkout_statements(sample_products[:1]) == checkout_statements(sample_products[:3])
+
+
 class TestInventoryManagement: # Failed
     def test_inventory_not_reduced_on_validation_failure(
         self,
@@ -279,3 +333,473 @@ class TestInventoryManagement: # Failed
         
         assert product1.stock_avilabilty == stock1_before
         assert product2.stock_avilabilty == stock2_before
+
+
+def place_orders(client: TestClient, products: list[Product], count: int) -> list[int]:
+    ids = []
+    for n in range(count):
+        product = products[n % len(products)]
+        response = client.post("/order/checkout", json={
+            "user_id": 1,
+            "items": [{"product_name": product.name, "product_id": product.id, "price": product.price, "quantity": 1}]
+        })
+        assert response.status_code == 200
+        ids.append(response.json()["order_details_id"])
+    return ids
+
+
+class TestOrderHistory:
+    def test_history_requires_authentication(self, client: TestClient):
+        assert client.get("/order/history").status_code == 401
+
+    def test_history_lists_orders_newest_first(self, authenticated_client: TestClient, sample_products: list[Product]):
+        ids = place_orders(authenticated_client, sample_products[:3], 3)
+
+        response = authenticated_client.get("/order/history")
+        assert response.status_code == 200
+        data = response.json()
+        assert [order["order_details_id"] for order in data] == ids[::-1]
+        assert data[-1]["total"] == sample_products[0].price
+        assert data[-1]["item_count"] == 1
+        assert data[-1]["created_at"]
+        assert data[-1]["items"][0]["product_id"] == sample_products[0].id
+
+    def test_history_pages_by_cursor(self, authenticated_client: TestClient, sample_products: list[Product]):
+        ids = place_orders(authenticated_client, sample_products[:3], 5)
+
+        first = authenticated_client.get("/order/history", params={"limit": 2})
+        cursor = first.headers["X-Next-Cursor"]
+        second = authenticated_client.get("/order/history", params={"limit": 2, "before": cursor})
+        third = authenticated_client.get("/order/history", params={"limit": 2, "before": second.headers["X-Next-Cursor"]})
+
+        pages = [[order["order_details_id"] for order in page.json()] for page in (first, second, third)]
+        assert pages == [ids[:2:-1], ids[2:0:-1], ids[:1]]
+        assert "X-Next-Cursor" not in third.headers
+
+    def test_history_query_count_does_not_grow_with_orders(self, authenticated_client: TestClient, sample_products: list[Product]):
+        def history_statements():
+            with count_statements() as statements:
+                assert authenticated_client.get("/order/history").status_code == 200
+            return len(statements)
+
+        place_orders(authenticated_client, sample_products[:3], 1)
+        few = history_statements()
+        place_orders(authenticated_client, sample_products[:3], 6)
+        assert history_statements() == few == 2
+
+    def test_get_order(self, authenticated_client: TestClient, sample_products: list[Product]):
+        order_id = place_orders(authenticated_client, sample_products[:3], 1)[0]
+
+        response = authenticated_client.get(f"/order/{order_id}")
+        assert response.status_code == 200
+        assert response.json()["order_details_id"] == order_id
+        assert authenticated_client.get(f"/order/{order_id + 1}").status_code == 404
+
+    def test_get_order_of_another_user_is_not_found(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        order = OrderDetails(user_id=9999, total_price=1.0, item_count=1)
+        db_session.add(order)
+        db_session.commit()
+
+        assert authenticated_client.get(f"/order/{order.id}").status_code == 404
+
+
+class TestIdempotentCheckout:
+    def checkout(self, client: TestClient, product: Product, key=None):
+        headers = {"Idempotency-Key": key} if key else {}
+        return client.post("/order/checkout", headers=headers, json={
+            "user_id": 1,
+            "items": [{"product_name": product.name, "product_id": product.id, "price": product.price, "quantity": 2}]
+        })
+
+    def test_retry_returns_original_order(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[0]
+        first = self.checkout(authenticated_client, product, "retry-1")
+        second = self.checkout(authenticated_client, product, "retry-1")
+
+        assert first.status_code == second.status_code == 200
+        assert second.json() == first.json()
+        assert second.headers["Idempotent-Replayed"] == "true"
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 8
+        assert db_session.query(OrderDetails).count() == 1
+
+    def test_retry_is_recognised_without_the_cache(self, authenticated_client: TestClient, sample_products: list[Product]):
+        first = self.checkout(authenticated_client, sample_products[0], "retry-2")
+        idempotency_cache.clear()
+        second = self.checkout(authenticated_client, sample_products[0], "retry-2")
+
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert second.json() == first.json()
+
+    def test_replay_without_the_cache_keeps_price_changes(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product]
+    ):
+        product = sample_products[0]
+        cart = {"user_id": 1, "items": [{"product_id": product.id, "price": 9.0, "quantity": 1}]}
+        headers = {"Idempotency-Key": "stale-price"}
+
+        first = authenticated_client.post("/order/checkout", headers=headers, json=cart)
+        idempotency_cache.clear()
+        second = authenticated_client.post("/order/checkout", headers=headers, json=cart)
+
+        assert [change["client_price"] for change in first.json()["price_changes"]] == [9.0]
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert second.json() == first.json()
+
+    @pytest.mark.parametrize("clear_cache", [False, True])
+    def test_key_reused_for_another_cart_is_rejected(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session,
+        clear_cache: bool
+    ):
+        product = sample_products[0]
+        self.checkout(authenticated_client, product, "reused")
+        if clear_cache:
+            idempotency_cache.clear()
+
+        response = authenticated_client.post("/order/checkout", headers={"Idempotency-Key": "reused"}, json={
+            "user_id": 1,
+            "items": [{"product_name": product.name, "product_id": product.id, "price": product.price, "quantity": 3}]
+        })
+
+        assert response.status_code == 422
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 8
+
+    def test_requests_without_key_are_separate_orders(self, authenticated_client: TestClient, sample_products: list[Product]):
+        first = self.checkout(authenticated_client, sample_products[0])
+        second = self.checkout(authenticated_client, sample_products[0])
+        assert first.json()["order_details_id"] != second.json()["order_details_id"]
+
+    def test_keys_are_scoped_per_user(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        db_session.add(OrderDetails(user_id=9999, total_price=1.0, item_count=1, idempotency_key="shared"))
+        db_session.commit()
+
+        response = self.checkout(authenticated_client, sample_products[0], "shared")
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+
+    def test_overlong_key_is_rejected(self, authenticated_client: TestClient, sample_products: list[Product]):
+        assert self.checkout(authenticated_client, sample_products[0], "k" * 65).status_code == 422
+
+
+class TestServerPricing:
+    def test_checkout_charges_current_prices(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[0]
+        response = authenticated_client.post("/order/checkout", json={
+            "user_id": 1,
+            "items": [{"product_name": "Old name", "product_id": product.id, "price": 1.00, "quantity": 2}]
+        })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == product.price * 2
+        assert data["items"][0]["product_name"] == product.name
+        assert data["price_changes"] == [
+            {"product_id": product.id, "product_name": product.name, "client_price": 1.00, "price": product.price}
+        ]
+        item = db_session.query(OrderItem).filter(OrderItem.order_details_id == data["order_details_id"]).one()
+        assert item.price == product.price
+
+    def test_checkout_needs_only_ids_and_quantities(self, authenticated_client: TestClient, sample_products: list[Product]):
+        response = authenticated_client.post("/order/checkout", json={
+            "user_id": 1, "items": [{"product_id": sample_products[2].id, "quantity": 1}]
+        })
+        assert response.status_code == 200
+        assert response.json()["price_changes"] == []
+
+    def test_non_positive_quantity_is_rejected(self, authenticated_client: TestClient, sample_products: list[Product]):
+        response = authenticated_client.post("/order/checkout", json={
+            "user_id": 1, "items": [{"product_id": sample_products[0].id, "quantity": -1}]
+        })
+        assert response.status_code == 422
+
+    def test_preview_reports_prices_stock_and_stale_lines(self, client: TestClient, sample_products: list[Product]):
+        laptop, _, _, out_of_stock = sample_products
+        response = client.post("/order/preview", json={"items": [
+            {"product_id": laptop.id, "price": laptop.price, "quantity": 2},
+            {"product_id": out_of_stock.id, "price": 5.00, "quantity": 1},
+            {"product_id": 9999, "quantity": 1},
+        ]})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == laptop.price * 2 + out_of_stock.price
+        assert [item["in_stock"] for item in data["items"]] == [True, False]
+        assert [change["product_id"] for change in data["price_changes"]] == [out_of_stock.id]
+        assert data["missing"] == [9999]
+
+    def test_preview_is_served_from_price_cache(self, authenticated_client: TestClient, sample_products: list[Product]):
+        product = sample_products[0]
+        cart = {"items": [{"product_id": product.id, "quantity": 1}]}
+
+        def preview_with_statements():
+            with count_statements() as statements:
+                data = authenticated_client.post("/order/preview", json=cart).json()
+            return data, len(statements)
+
+        first, queries = preview_with_statements()
+        assert queries == 1
+        assert preview_with_statements() == (first, 0)
+
+        # Checkout drops the snapshot of the products it sold
+        authenticated_client.post("/order/checkout", json={"user_id": 1, **cart})
+        data, queries = preview_with_statements()
+        assert queries == 1
+        assert data["items"][0]["available"] == product.stock_avilabilty - 1
+
+
+class TestReservations:
+    @pytest.fixture
+    def second_client(self, client: TestClient, db_session: Session) -> TestClient:
+        other = User(first_name="Jane", email="jane@test.com", password="x")
+        db_session.add(other)
+        db_session.commit()
+        second = TestClient(client.app)
+        second.cookies.set("session_token", auth.create_session(other.id))
+        return second
+
+    def test_reserve_and_list(self, authenticated_client: TestClient, sample_products: list[Product]):
+        product = sample_products[1]  # 5 in stock
+        response = authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 3})
+        assert response.status_code == 200
+        assert response.json()["quantity"] == 3
+
+        holds = authenticated_client.get("/order/reservations").json()
+        assert [(hold["product_id"], hold["quantity"]) for hold in holds] == [(product.id, 3)]
+
+    def test_held_stock_is_not_available_to_others(
+        self,
+        authenticated_client: TestClient,
+        second_client: TestClient,
+        sample_products: list[Product]
+    ):
+        product = sample_products[1]  # 5 in stock
+        assert authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 4}).status_code == 200
+
+        assert second_client.post("/order/reservations", json={"product_id": product.id, "quantity": 2}).status_code == 409
+        checkout = second_client.post("/order/checkout", json={"user_id": 0, "items": [{"product_id": product.id, "quantity": 2}]})
+        assert checkout.status_code == 400
+        assert "Available: 1" in checkout.json()["detail"]
+        assert authenticated_client.post(f"/products/{product.id}/purchase", json={"quantity": 2}).status_code == 400
+
+    def test_checkout_consumes_own_hold(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]
+        authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5})
+
+        checkout = authenticated_client.post("/order/checkout", json={"user_id": 0, "items": [{"product_id": product.id, "quantity": 5}]})
+        assert checkout.status_code == 200
+        assert authenticated_client.get("/order/reservations").json() == []
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 0
+
+    def test_release_gives_stock_back(
+        self,
+        authenticated_client: TestClient,
+        second_client: TestClient,
+        sample_products: list[Product]
+    ):
+        product = sample_products[1]
+        authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5})
+        assert authenticated_client.delete(f"/order/reservations/{product.id}").status_code == 200
+        assert authenticated_client.delete(f"/order/reservations/{product.id}").status_code == 404
+
+        assert second_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5}).status_code == 200
+
+    def test_expired_holds_are_swept(
+        self,
+        authenticated_client: TestClient,
+        second_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]
+        authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5})
+        db_session.execute(update(StockReservation).values(expires_at=datetime(2000, 1, 1)))
+        db_session.commit()
+
+        assert reservations.sweep_expired(db_session) == 1
+        assert second_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5}).status_code == 200
+
+    def test_expired_holds_are_released_before_refusing(
+        self,
+        authenticated_client: TestClient,
+        second_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]
+        authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5})
+        db_session.execute(update(StockReservation).values(expires_at=datetime(2000, 1, 1)))
+        db_session.commit()
+
+        # Not swept yet, but the refusal is checked against the holds table
+        assert second_client.post("/order/reservations", json={"product_id": product.id, "quantity": 3}).status_code == 200
+        assert authenticated_client.post(f"/products/{product.id}/purchase", json={"quantity": 2}).status_code == 200
+        db_session.refresh(product)
+        assert (product.stock_avilabilty, product.reserved) == (3, 3)
+
+    def test_reserve_takes_stock_with_one_conditional_update(
+        self,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]
+        with count_statements() as statements:
+            assert authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 5}).status_code == 200
+            assert authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 6}).status_code == 409
+        assert sum(statement.startswith("UPDATE products SET reserved") for statement in statements) == 2
+
+        authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 2})
+        db_session.refresh(product)
+        assert product.reserved == 2
+        authenticated_client.delete(f"/order/reservations/{product.id}")
+        db_session.refresh(product)
+        assert product.reserved == 0
+
+
+class TestGroupCommit:
+    @pytest.fixture
+    def committer(self, test_db) -> GroupCommitter:
+        engine = create_db_engine(TEST_DATABASE_URL, savepoints=True)
+        committer = GroupCommitter(window_ms=20, session_factory=sessionmaker(bind=engine, autoflush=False))
+        yield committer
+        committer.stop()
+        engine.dispose()
+
+    def submit_orders(self, committer: GroupCommitter, user: User, product: Product, count: int, key=None):
+        # The batch closes once all of them are queued, well inside the window
+        committer.max_batch, committer.window = count, 5
+        committer.start()
+        cart = [OrderItemIn(product_id=product.id, quantity=1)]
+        futures = [committer.submit(user.id, cart, key) for _ in range(count)]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result(timeout=10))
+            except Exception as exc:
+                outcomes.append(exc)
+        return outcomes
+
+    def test_batch_never_oversells(
+        self,
+        committer: GroupCommitter,
+        sample_user: User,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[1]  # 5 in stock
+        outcomes = self.submit_orders(committer, sample_user, product, 8)
+
+        assert (committer.batches, committer.fallbacks) == (1, 0)
+        assert [isinstance(outcome, dict) for outcome in outcomes] == [True] * 5 + [False] * 3
+        assert all(isinstance(outcome, OrderError) for outcome in outcomes[5:])
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 0
+        assert db_session.query(OrderDetails).count() == 5
+        assert db_session.query(OrderItem).count() == 5
+
+    def test_failed_job_is_rolled_back_alone(
+        self,
+        committer: GroupCommitter,
+        sample_user: User,
+        sample_products: list[Product],
+        db_session: Session
+    ):
+        product = sample_products[0]  # 10 in stock
+        outcomes = self.submit_orders(committer, sample_user, product, 3, key="same-key")
+
+        # The batch failed on the reused key and was placed again one by one
+        assert committer.fallbacks == 1
+        assert isinstance(outcomes[0], dict)
+        assert all(isinstance(outcome, IntegrityError) for outcome in outcomes[1:])
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 9
+        assert db_session.query(OrderDetails).count() == 1
+
+    def test_batch_statements_do_not_grow_with_orders(
+        self,
+        committer: GroupCommitter,
+        sample_user: User,
+        sample_products: list[Product]
+    ):
+        def batch_statements(count: int) -> int:
+            with count_statements(committer.session_factory.kw["bind"]) as statements:
+                outcomes = self.submit_orders(committer, sample_user, sample_products[2], count)
+            assert all(isinstance(outcome, dict) for outcome in outcomes)
+            # SQLite cannot hand back the ids of a multi-row INSERT in order,
+            # so the order headers are inserted one at a time there
+            return len([statement for statement in statements if not statement.startswith("INSERT INTO order_details")])
+
+        assert batch_statements(1) == batch_statements(8)
+
+    def test_submit_is_refused_unless_running(self, committer: GroupCommitter, sample_user: User):
+        with pytest.raises(CommitterStopped):
+            committer.submit(sample_user.id, [])
+        committer.start()
+        committer.stop()
+        with pytest.raises(CommitterStopped):
+            committer.submit(sample_user.id, [])
+
+    def test_checkout_goes_through_committer(
+        self,
+        committer: GroupCommitter,
+        authenticated_client: TestClient,
+        sample_products: list[Product],
+        db_session: Session,
+        monkeypatch
+    ):
+        monkeypatch.setattr(group_commit, "committer", committer)
+        committer.start()
+        product = sample_products[0]
+        cart = {"user_id": 0, "items": [{"product_id": product.id, "quantity": 2}]}
+
+        first = authenticated_client.post("/order/checkout", headers={"Idempotency-Key": "gc-1"}, json=cart)
+        idempotency_cache.clear()
+        retry = authenticated_client.post("/order/checkout", headers={"Idempotency-Key": "gc-1"}, json=cart)
+        too_many = authenticated_client.post("/order/checkout", json={**cart, "items": [{"product_id": product.id, "quantity": 9}]})
+
+        assert first.status_code == 200
+        assert retry.json() == first.json()
+        assert too_many.status_code == 400
+        assert committer.jobs == 2
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 8
+
+        # Once the committer stops (shutdown), checkouts commit on their own
+        committer.stop()
+        after_stop = authenticated_client.post("/order/checkout", json=cart)
+        assert after_stop.status_code == 200
+        assert committer.jobs == 2
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 6
@@ -1,8 +1,16 @@
 
 
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.testclient import TestClient
-from models.products import Product
+from sqlalchemy.exc import OperationalError
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models.products import Product, ProductStockShard
+from controller.inventory import decrement_sharded, decrement_stock, shard_stock, stock_level, sharded_totals, sync_sharded_stock
+from controller import search
+from controller.search import InvertedIndex
+from tests.conftest import TestSessionLocal
 
 class TestSearchProducts:
     
@@ -55,3 +63,402 @@ class TestSearchProducts:
         assert isinstance(data, list)
         assert len(data) == 0
 
+    def test_search_matches_description_and_category(self, client: TestClient, sample_products: list[Product]):
+        by_description = client.get("/products/search?q=stock").json()
+        by_category = client.get("/products/search?q=clothing").json()
+
+        assert [p["name"] for p in by_description] == ["Out of Stock Item"]
+        assert {p["name"] for p in by_category} == {"Test Shirt", "Out of Stock Item"}
+
+    def test_search_matches_word_prefixes(self, client: TestClient, sample_products: list[Product]):
+        data = client.get("/products/search?q=lap").json()
+        assert [p["name"] for p in data] == ["Test Laptop"]
+
+    def test_search_requires_every_term(self, client: TestClient, sample_products: list[Product]):
+        data = client.get("/products/search?q=test phone").json()
+        assert [p["name"] for p in data] == ["Test Phone"]
+
+    def test_search_ranks_name_matches_first(self, client: TestClient, sample_products: list[Product], db_session: Session):
+        db_session.add(Product(name="Charger", description="Works with any phone", price=9.99,
+                               image_url="http://example.com/charger.jpg", category="electronics", stock_avilabilty=3))
+        db_session.commit()
+
+        data = client.get("/products/search?q=phone").json()
+        assert [p["name"] for p in data] == ["Test Phone", "Charger"]
+
+    def test_search_paginates(self, client: TestClient, sample_products: list[Product]):
+        first = client.get("/products/search?q=test&limit=2").json()
+        second = client.get("/products/search?q=test&limit=2&offset=2").json()
+
+        assert len(first) == 2
+        assert {p["id"] for p in first}.isdisjoint(p["id"] for p in second)
+
+    def test_search_index_follows_updates(self, client: TestClient, sample_products: list[Product], db_session: Session):
+        sample_products[0].name = "Renamed Notebook"
+        sample_products[0].description = "Portable computer"
+        db_session.commit()
+
+        assert client.get("/products/search?q=laptop").json() == []
+        assert [p["name"] for p in client.get("/products/search?q=notebook").json()] == ["Renamed Notebook"]
+
+
+class TestInvertedIndex:
+
+    def test_fallback_index_matches_prefixes_and_ranks(self, db_session: Session, sample_products: list[Product]):
+        index = InvertedIndex()
+        names = lambda keys: [db_session.get(Product, product_id).name for _, product_id in keys]
+
+        assert names(index.search(db_session, "lap", 10)) == ["Test Laptop"]
+        assert set(names(index.search(db_session, "clothing", 10))) == {"Test Shirt", "Out of Stock Item"}
+        assert index.search(db_session, "test nothing", 10) == []
+
+    def test_fallback_index_tracks_changes(self, db_session: Session, sample_products: list[Product]):
+        index = InvertedIndex()
+        index.rebuild(db_session)
+
+        product = sample_products[0]
+        index.remove(product.id)
+        assert index.search(db_session, "laptop", 10) == []
+
+        product.name = "Gaming Rig"
+        index.add(product)
+        assert [product_id for _, product_id in index.search(db_session, "gaming", 10)] == [product.id]
+
+    @pytest.fixture
+    def shared_index(self, db_session: Session):
+        search.inverted_index.rebuild(db_session)
+        yield search.inverted_index
+        search.inverted_index.clear()
+
+    def ids(self, index: InvertedIndex, db_session: Session, query: str) -> list[int]:
+        return [product_id for _, product_id in index.search(db_session, query, 10)]
+
+    def test_only_committed_changes_are_indexed(self, db_session: Session, sample_products: list[Product], shared_index):
+        product = sample_products[0]
+        product.name = "Gaming Rig"
+        db_session.flush()
+        db_session.rollback()
+        assert self.ids(shared_index, db_session, "gaming") == []
+        assert self.ids(shared_index, db_session, "laptop") == [product.id]
+
+        product.name = "Gaming Rig"
+        db_session.add(Product(name="Gaming Chair", price=1.0, image_url="x", category="furniture", stock_avilabilty=1))
+        db_session.commit()
+        assert len(self.ids(shared_index, db_session, "gaming")) == 2
+
+        db_session.delete(product)
+        db_session.commit()
+        assert len(self.ids(shared_index, db_session, "gaming")) == 1
+
+    def test_savepoint_rollback_forces_rebuild(self, db_session: Session, sample_products: list[Product], shared_index):
+        product = sample_products[0]
+        product.name = "Gaming Rig"
+        db_session.flush()
+        savepoint = db_session.begin_nested()
+        product.name = "Office Rig"
+        db_session.flush()
+        savepoint.rollback()
+        db_session.commit()
+
+        assert not shared_index.ready
+        assert self.ids(shared_index, db_session, "gaming") == [product.id]
+        assert self.ids(shared_index, db_session, "office") == []
+
+    def test_index_is_rebuilt_when_old(self, db_session: Session, sample_products: list[Product]):
+        index = InvertedIndex(max_age=0)
+        index.rebuild(db_session)
+        # A write this process never saw (e.g. another worker's)
+        with TestSessionLocal() as other:
+            other.execute(update(Product).where(Product.id == sample_products[0].id).values(name="Gaming Rig"))
+            other.commit()
+
+        assert self.ids(index, db_session, "gaming") == [sample_products[0].id]
+
+
+class TestPurchaseProduct:
+
+    def test_purchase_reduces_stock(self, client: TestClient, sample_products: list[Product], db_session: Session):
+        product = sample_products[0]
+        response = client.post(f"/products/{product.id}/purchase", json={"quantity": 3})
+
+        assert response.status_code == 200
+        assert response.json()["new_stock"] == 7
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 7
+
+    def test_purchase_insufficient_stock_fails(self, client: TestClient, sample_products: list[Product], db_session: Session):
+        product = sample_products[1]  # Has stock of 5
+        response = client.post(f"/products/{product.id}/purchase", json={"quantity": 6})
+
+        assert response.status_code == 400
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 5
+
+    def test_purchase_nonexistent_product_fails(self, client: TestClient):
+        response = client.post("/products/99999/purchase", json={"quantity": 1})
+        assert response.status_code == 404
+
+    def test_purchase_rejects_non_positive_quantity(self, client: TestClient, sample_products: list[Product]):
+        response = client.post(f"/products/{sample_products[0].id}/purchase", json={"quantity": -5})
+        assert response.status_code == 422
+
+    def test_decrement_without_returning_support(self, db_session: Session, sample_products: list[Product], monkeypatch):
+        monkeypatch.setattr(db_session.get_bind().dialect, "update_returning", False)
+        product = sample_products[0]
+
+        assert decrement_stock(db_session, product.id, 4) == 6
+        assert decrement_stock(db_session, product.id, 7) is None
+
+
+class TestPurchaseConcurrency:
+
+    @pytest.mark.parametrize("shards", [1, 4])
+    def test_concurrent_purchases_never_oversell(self, test_db, shards):
+        with TestSessionLocal() as db:
+            product = Product(name="Hot Item", price=10.0, image_url="images/item1.jpg", category="hot", stock_avilabilty=50)
+            db.add(product)
+            db.commit()
+            product_id = product.id
+            shard_stock(db, product_id, shards)
+            db.commit()
+
+        def buy():
+            sold = 0
+            for _ in range(10):
+                with TestSessionLocal() as db:
+                    try:
+                        if decrement_stock(db, product_id, 1) is not None:
+                            db.commit()
+                            sold += 1
+                    except OperationalError:
+                        db.rollback()
+            return sold
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            sold = sum(pool.map(lambda _: buy(), range(16)))
+
+        with TestSessionLocal() as db:
+            remaining = db.execute(select(stock_level()).where(Product.id == product_id)).scalar_one()
+
+        assert sold == 50
+        assert remaining == 0
+
+
+class TestStockShards:
+
+    def shards(self, db: Session, product_id: int) -> list[int]:
+        rows = db.query(ProductStockShard).filter(ProductStockShard.product_id == product_id).order_by(ProductStockShard.shard)
+        return [row.quantity for row in rows]
+
+    def test_shard_stock_splits_evenly(self, db_session: Session, sample_products: list[Product]):
+        product = sample_products[0]  # 10 in stock
+        shard_stock(db_session, product.id, 4)
+        db_session.commit()
+
+        assert self.shards(db_session, product.id) == [3, 3, 2, 2]
+        assert sharded_totals(db_session, [product.id, sample_products[1].id]) == {product.id: 10}
+
+    def test_purchase_spills_over_shards(self, client: TestClient, db_session: Session, sample_products: list[Product]):
+        product = sample_products[0]
+        shard_stock(db_session, product.id, 4)
+        db_session.commit()
+
+        response = client.post(f"/products/{product.id}/purchase", json={"quantity": 7})
+        assert response.status_code == 200
+        assert response.json()["new_stock"] == 3
+        assert sum(self.shards(db_session, product.id)) == 3
+
+        assert client.post(f"/products/{product.id}/purchase", json={"quantity": 4}).status_code == 400
+        assert sum(self.shards(db_session, product.id)) == 3
+
+    def test_shard_lowered_by_another_buyer_is_retried(self, db_session: Session, sample_products: list[Product]):
+        product = sample_products[0]  # 10 in stock
+        shard_stock(db_session, product.id, 2)
+        db_session.commit()
+
+        # Another buyer takes one unit from each shard between our read of
+        # the shards and our first UPDATE of one
+        def other_buyer(connection, cursor, statement, *args):
+            if statement.startswith("UPDATE product_stock_shards") and not lowered:
+                lowered.append(True)
+                cursor.execute("UPDATE product_stock_shards SET quantity = quantity - 1")
+        lowered = []
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", other_buyer)
+        try:
+            assert decrement_sharded(db_session, product.id, 6)
+        finally:
+            event.remove(engine, "before_cursor_execute", other_buyer)
+
+        assert sum(self.shards(db_session, product.id)) == 2
+
+    def test_sharded_purchase_leaves_held_stock(self, db_session: Session, sample_products: list[Product]):
+        product = sample_products[0]
+        shard_stock(db_session, product.id, 4)
+        db_session.commit()
+
+        assert not decrement_sharded(db_session, product.id, 7, held=4)
+        assert decrement_sharded(db_session, product.id, 6, held=4)
+        assert sum(self.shards(db_session, product.id)) == 4
+
+    def test_sharded_purchase_leaves_reserved_stock(
+        self,
+        authenticated_client: TestClient,
+        db_session: Session,
+        sample_products: list[Product]
+    ):
+        product = sample_products[0]
+        shard_stock(db_session, product.id, 4)
+        db_session.commit()
+        assert authenticated_client.post("/order/reservations", json={"product_id": product.id, "quantity": 8}).status_code == 200
+
+        assert authenticated_client.post(f"/products/{product.id}/purchase", json={"quantity": 3}).status_code == 400
+        assert authenticated_client.post(f"/products/{product.id}/purchase", json={"quantity": 2}).status_code == 200
+        assert sum(self.shards(db_session, product.id)) == 8
+
+    def test_checkout_and_reservations_use_shard_totals(
+        self,
+        authenticated_client: TestClient,
+        db_session: Session,
+        sample_products: list[Product]
+    ):
+        sharded, plain = sample_products[0], sample_products[2]
+        shard_stock(db_session, sharded.id, 3)
+        db_session.commit()
+
+        response = authenticated_client.post("/order/checkout", json={"user_id": 0, "items": [
+            {"product_id": sharded.id, "quantity": 6},
+            {"product_id": plain.id, "quantity": 1},
+        ]})
+        assert response.status_code == 200
+        assert sum(self.shards(db_session, sharded.id)) == 4
+
+        assert authenticated_client.post("/order/reservations", json={"product_id": sharded.id, "quantity": 5}).status_code == 409
+        assert authenticated_client.post("/order/reservations", json={"product_id": sharded.id, "quantity": 4}).status_code == 200
+
+    def test_sync_and_unshard(self, db_session: Session, sample_products: list[Product]):
+        product = sample_products[0]
+        shard_stock(db_session, product.id, 2)
+        db_session.commit()
+        assert decrement_stock(db_session, product.id, 3) == 7
+        db_session.commit()
+
+        assert sync_sharded_stock(db_session) == 1
+        db_session.refresh(product)
+        assert product.stock_avilabilty == 7
+
+        shard_stock(db_session, product.id, 1)
+        db_session.commit()
+        db_session.refresh(product)
+        assert self.shards(db_session, product.id) == []
+        assert product.stock_avilabilty == 7
+
+
+class TestGroupedProducts:
+
+    def test_products_are_grouped_by_category(self, client: TestClient, sample_products: list[Product]):
+        response = client.get("/products/grouped")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data) == {"Electronics", "Clothing"}
+        assert len(data["Electronics"]) == 2
+        assert len(data["Clothing"]) == 2
+
+    def test_limit_caps_each_category(self, client: TestClient, sample_products: list[Product]):
+        data = client.get("/products/grouped?limit=1").json()
+        assert all(len(products) == 1 for products in data.values())
+
+    def test_repeat_request_with_etag_returns_304(self, client: TestClient, sample_products: list[Product]):
+        first = client.get("/products/grouped")
+        etag = first.headers["etag"]
+
+        second = client.get("/products/grouped", headers={"If-None-Match": etag})
+
+        assert second.status_code == 304
+        assert second.content == b""
+
+    def test_cache_hits_are_counted(self, client: TestClient, sample_products: list[Product]):
+        client.get("/products/grouped")
+        client.get("/products/grouped")
+
+        stats = client.get("/products/cache-stats").json()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+
+    def test_purchase_invalidates_cached_catalog(self, client: TestClient, sample_products: list[Product]):
+        product = sample_products[0]
+        original_stock = product.stock_avilabilty
+        before = client.get("/products/grouped")
+
+        client.post(f"/products/{product.id}/purchase", json={"quantity": 1})
+        after = client.get("/products/grouped", headers={"If-None-Match": before.headers["etag"]})
+
+        assert after.status_code == 200
+        stock = next(p["stock_avilabilty"] for p in after.json()["Electronics"] if p["id"] == product.id)
+        assert stock == original_stock - 1
+
+
+class TestListingPagination:
+
+    def test_grouped_fields_projection(self, client: TestClient, sample_products: list[Product]):
+        data = client.get("/products/grouped?fields=name,price").json()
+
+        for products in data.values():
+            for product in products:
+                assert set(product) == {"id", "name", "price"}
+
+    def test_cached_page_keeps_its_cursor(self, client: TestClient, sample_products: list[Product]):
+        url = "/products/grouped?category=electronics&limit=1"
+        first = client.get(url)
+        # Served from the cache entry, cursor included
+        second = client.get(url)
+
+        assert second.headers["x-next-cursor"] == first.headers["x-next-cursor"] == str(sample_products[0].id)
+        assert client.get("/products/cache-stats").json()["hits"] == 1
+
+    def test_unknown_field_is_rejected(self, client: TestClient, sample_products: list[Product]):
+        assert client.get("/products/grouped?fields=password").status_code == 400
+        assert client.get("/products/search?q=test&fields=password").status_code == 400
+
+    def test_grouped_category_keyset_pagination(self, client: TestClient, sample_products: list[Product]):
+        first = client.get("/products/grouped?category=electronics&limit=1")
+        cursor = first.headers["x-next-cursor"]
+        second = client.get(f"/products/grouped?category=electronics&limit=1&after={cursor}")
+
+        assert list(first.json()) == ["Electronics"]
+        names = [p["name"] for p in first.json()["Electronics"] + second.json()["Electronics"]]
+        assert names == ["Test Laptop", "Test Phone"]
+
+    def test_search_fields_projection(self, client: TestClient, sample_products: list[Product]):
+        data = client.get("/products/search?q=laptop&fields=name").json()
+        assert data == [{"id": sample_products[0].id, "name": "Test Laptop"}]
+
+    def test_search_cursor_walks_all_results_once(self, client: TestClient, sample_products: list[Product]):
+        seen = []
+        url = "/products/search?q=test&limit=1"
+        while True:
+            response = client.get(url)
+            seen += [p["id"] for p in response.json()]
+            if "x-next-cursor" not in response.headers:
+                break
+            url = f"/products/search?q=test&limit=1&cursor={response.headers['x-next-cursor']}"
+
+        expected = [p["id"] for p in client.get("/products/search?q=test").json()]
+        assert seen == expected
+
+    def test_invalid_cursor_is_rejected(self, client: TestClient, sample_products: list[Product]):
+        assert client.get("/products/search?q=test&cursor=not-a-cursor").status_code == 400
+
+    def test_large_search_page_is_streamed(self, client: TestClient, db_session: Session):
+        db_session.add_all(
+            Product(name=f"Bulk item {i}", price=1.0, image_url="images/item1.jpg", category="bulk", stock_avilabilty=1)
+            for i in range(150)
+        )
+        db_session.commit()
+
+        response = client.get("/products/search?q=bulk&limit=500&fields=name")
+
+        assert response.status_code == 200
+        assert "content-length" not in response.headers
+        assert len(response.json()) == 150
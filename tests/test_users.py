@@ -3,7 +3,9 @@ import pytest
 from fastapi.testclient import TestClient
 from models.users import User
 from sqlalchemy.orm import Session
+from passlib.context import CryptContext
 from controller import verify_password
+from controller.user import pwd_context
 
 
 class TestUserRegistration:    
@@ -133,6 +135,25 @@ class TestUserLogin:
         data = response.json()
         assert "Invalid email or password" in data["message"]
 
+    def test_login_rehashes_outdated_password_hash(self, client: TestClient, sample_user: User, db_session: Session):
+        old_context = CryptContext(schemes=["argon2"], argon2__rounds=1, argon2__memory_cost=8192, argon2__parallelism=1)
+        sample_user.password = old_context.hash("TestPassword123")
+        db_session.commit()
+        assert pwd_context.needs_update(sample_user.password)
+
+        response = client.post(
+            "/login",
+            data={
+                "email": sample_user.email,
+                "password": "TestPassword123"
+            }
+        )
+
+        assert response.status_code == 200
+        db_session.refresh(sample_user)
+        assert not pwd_context.needs_update(sample_user.password)
+        assert verify_password("TestPassword123", sample_user.password)
+
 
 class TestGetCurrentUser:    
     def test_get_current_user_when_authenticated(self, authenticated_client: TestClient, sample_user: User):
@@ -166,6 +187,19 @@ class TestUpdateProfile:
         db_session.refresh(sample_user)
         assert sample_user.first_name == "UpdatedName"
         assert sample_user.phone == "+9999999999"
+
+    def test_update_profile_hashes_new_password(self, authenticated_client: TestClient, sample_user: User, db_session: Session):
+        response = authenticated_client.put(
+            "/update-profile",
+            data={
+                "password": "NewPassword456"
+            }
+        )
+
+        assert response.status_code == 200
+        db_session.refresh(sample_user)
+        assert sample_user.password != "NewPassword456"
+        assert verify_password("NewPassword456", sample_user.password)
     
     def test_update_profile_when_not_authenticated(self, client: TestClient):
         response = client.put(
@@ -1,15 +1,30 @@
 // ================================
 // GET PRODUCTS
 // ================================
+// The server inlines the first catalog page into the home page; use it once,
+// so the first paint needs no extra request. Later refreshes fetch.
+function takeEmbeddedCatalog() {
+    const script = document.getElementById('catalog-data');
+    if (!script) return null;
+    script.remove();
+    try {
+        return JSON.parse(script.textContent);
+    } catch (err) {
+        return null;
+    }
+}
+
 async function loadCategorizedProducts() {
     const container = document.getElementById('products_container');
     if (!container) return;
 
     try {
-        const response = await fetch('http://127.0.0.1:8000/products/grouped');
-        if (!response.ok) throw new Error('Failed to fetch products');
-
-        const groupedProducts = await response.json();
+        let groupedProducts = takeEmbeddedCatalog();
+        if (!groupedProducts) {
+            const response = await fetch('/products/grouped');
+            if (!response.ok) throw new Error('Failed to fetch products');
+            groupedProducts = await response.json();
+        }
         container.innerHTML = ''; // Clear existing content
 
         for (const [category, products] of Object.entries(groupedProducts)) {
@@ -56,7 +71,7 @@ async function loadCategorizedProducts() {
 
                 card.innerHTML = `
                     ${isOutOfStock ? '<div class="sold-out-overlay">Sold Out</div>' : ''}
-                    <img class="product-image" src="${product.image_url}" alt="${product.name}" style="width: 100%; height: 375px; object-fit: cover;">
+                    <img class="product-image" src="${product.image_url}" ${product.srcset ? `srcset="${product.srcset}" sizes="(min-width: 1000px) 33vw, 100vw"` : ''} loading="lazy" alt="${product.name}" style="width: 100%; height: 375px; object-fit: cover;">
                     <div class="product-details">
                         <div class="product-title">${product.name}</div>
                 
@@ -384,7 +399,7 @@ function showOrderSummary() {
     }
 
     // Check login status first
-    fetch("/me").then(response => {
+    fetch("/me").then(async response => {
         if (!response.ok) {
             showAlert("Please login to checkout.", "warning");
             document.getElementById('cartWindow').classList.remove('active');
@@ -393,6 +408,33 @@ function showOrderSummary() {
             return;
         }
 
+        // Refresh names and prices from the server before showing the total
+        try {
+            const previewResponse = await fetch("/order/preview", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({
+                    items: cart.map(item => ({ product_id: item.id, price: item.price, quantity: item.quantity }))
+                })
+            });
+            if (previewResponse.ok) {
+                const preview = await previewResponse.json();
+                const current = new Map(preview.items.map(item => [item.product_id, item]));
+                cart = cart
+                    .filter(item => current.has(item.id))
+                    .map(item => ({ ...item, name: current.get(item.id).product_name, price: current.get(item.id).price }));
+                localStorage.setItem("cart", JSON.stringify(cart));
+                // Redraw the cart from the corrected copy, or the next
+                // saveCartToLocalStorage() would write the stale DOM back
+                loadCartFromStorage();
+                if (preview.price_changes.length || preview.missing.length) {
+                    showAlert("Some prices in your cart have changed. The summary shows the current prices.", "warning");
+                }
+            }
+        } catch (err) {
+            console.error("Preview error:", err);
+        }
+
         // Populate Summary Modal
         const summaryItems = document.getElementById('orderSummaryItems');
         let total = 0;
@@ -441,6 +483,14 @@ document.getElementById("confirmOrderBtn")?.addEventListener("click", async () =
     const summaryModalEl = document.getElementById('orderSummaryModal');
     const summaryModal = bootstrap.Modal.getInstance(summaryModalEl);
 
+    // Reused by every retry of this checkout so the server places the order
+    // only once; dropped once the server has given a definite answer
+    let checkoutKey = localStorage.getItem("checkoutKey");
+    if (!checkoutKey) {
+        checkoutKey = crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem("checkoutKey", checkoutKey);
+    }
+
     const payload = {
         user_id: 0,
         items: cart.map(item => ({
@@ -452,13 +502,14 @@ document.getElementById("confirmOrderBtn")?.addEventListener("click", async () =
     };
 
     try {
-        const response = await fetch("http://127.0.0.1:8000/order/checkout", {
+        const response = await fetch("/order/checkout", {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: { "Content-Type": "application/json", "Idempotency-Key": checkoutKey },
             body: JSON.stringify(payload)
         });
 
         const result = await response.json();
+        if (response.status < 500) localStorage.removeItem("checkoutKey");
 
         if (response.ok) {
             summaryModal.hide();
@@ -684,8 +735,10 @@ if (userIcon) {
 // ================================
 // PAGE LOAD
 // ================================
+// Products are drawn as soon as the page is parsed, not after every image loaded
+document.addEventListener("DOMContentLoaded", loadCategorizedProducts);
+
 window.addEventListener("load", () => {
-    loadCategorizedProducts();
     loadCartFromStorage();
     checkLoginStatus();
     const urlParams = new URLSearchParams(window.location.search);
@@ -764,7 +817,7 @@ async function handleSearch(e) {
 
             card.innerHTML = `
                 ${isOutOfStock ? '<div class="sold-out-overlay">Sold Out</div>' : ''}
-                <img class="product-image" src="${product.image_url}" alt="${product.name}" style="width: 100%; height: 375px; object-fit: cover;">
+                <img class="product-image" src="${product.image_url}" ${product.srcset ? `srcset="${product.srcset}" sizes="(min-width: 1000px) 33vw, 100vw"` : ''} loading="lazy" alt="${product.name}" style="width: 100%; height: 375px; object-fit: cover;">
                 <div class="product-details">
                     <div class="product-title">${product.name}</div>
                     <div class="product-price">$${product.price.toFixed(2)}</div>